@@ -0,0 +1,139 @@
+import csv
+import io
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+import orjson
+from sqlmodel import Session, select, delete, func
+
+from .models import Room, Message, MessageArchive
+
+# Messages per compressed segment; one segment is compressed, inserted and deleted from the hot table per transaction
+ARCHIVE_SEGMENT_MESSAGES = int(os.environ.get("ARCHIVE_SEGMENT_MESSAGES", "1000"))
+# A room counts as finished once its newest message is this old
+ARCHIVE_IDLE_MINUTES = float(os.environ.get("ARCHIVE_IDLE_MINUTES", "120"))
+# Hot rows fetched per round trip while exporting
+EXPORT_BATCH = 500
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = ("room", "id", "sender", "content", "ts")
+
+# The MessageResponse fields, which is what a segment keeps of each message
+SEGMENT_COLUMNS = (Message.id, Message.sender, Message.content, Message.ts)
+
+
+def encode_segment(rows: List[dict]) -> bytes:
+    return zlib.compress(b"".join(orjson.dumps(row) + b"\n" for row in rows), 9)
+
+
+def decode_segment(data: bytes) -> List[dict]:
+    return [orjson.loads(line) for line in zlib.decompress(data).splitlines()]
+
+
+def archive_room_messages(session: Session, room_id: int, segment_size: int = ARCHIVE_SEGMENT_MESSAGES) -> dict:
+    """Move a room's messages into compressed MessageArchive segments, oldest first.
+
+    Each segment is written and its messages deleted in one commit, so
+    readers see every message exactly once (hot or archived) and the
+    write lock is only held for one segment at a time. The newest message
+    of the whole table is left in place: without AUTOINCREMENT SQLite
+    would hand its id out again, and clients page and poll by id.
+    """
+    newest_id = session.exec(select(func.max(Message.id))).one()
+    totals = {"messages": 0, "segments": 0, "bytes": 0}
+    while True:
+        rows = [row._asdict() for row in session.exec(
+            select(*SEGMENT_COLUMNS)
+            .where(Message.room_id == room_id, Message.id < newest_id)
+            .order_by(Message.id)
+            .limit(segment_size)
+        )]
+        if not rows:
+            return totals
+        data = encode_segment(rows)
+        session.add(MessageArchive(
+            room_id=room_id,
+            first_id=rows[0]["id"],
+            last_id=rows[-1]["id"],
+            count=len(rows),
+            first_ts=rows[0]["ts"],
+            last_ts=rows[-1]["ts"],
+            data=data
+        ))
+        session.exec(delete(Message).where(
+            Message.room_id == room_id, Message.id >= rows[0]["id"], Message.id <= rows[-1]["id"]
+        ))
+        session.commit()
+        totals["messages"] += len(rows)
+        totals["segments"] += 1
+        totals["bytes"] += len(data)
+
+
+def finished_room_ids(session: Session, idle_minutes: float = ARCHIVE_IDLE_MINUTES) -> List[int]:
+    """Rooms with hot messages, none of them newer than idle_minutes"""
+    cutoff = datetime.utcnow() - timedelta(minutes=idle_minutes)
+    return list(session.exec(
+        select(Message.room_id).group_by(Message.room_id).having(func.max(Message.ts) < cutoff)
+    ))
+
+
+def room_transcript(session: Session, room_id: int) -> Iterator[List[dict]]:
+    """A room's messages oldest first, in batches: each archived segment, then the hot rows"""
+    segment_ids = session.exec(
+        select(MessageArchive.id).where(MessageArchive.room_id == room_id).order_by(MessageArchive.first_id)
+    ).all()
+    for segment_id in segment_ids:
+        yield decode_segment(session.exec(select(MessageArchive.data).where(MessageArchive.id == segment_id)).one())
+
+    after = 0
+    while True:
+        rows = [row._asdict() for row in session.exec(
+            select(*SEGMENT_COLUMNS)
+            .where(Message.room_id == room_id, Message.id > after)
+            .order_by(Message.id)
+            .limit(EXPORT_BATCH)
+        )]
+        for row in rows:
+            # Same text as the archived rows, which went through JSON
+            row["ts"] = row["ts"].isoformat()
+        if rows:
+            yield rows
+        if len(rows) < EXPORT_BATCH:
+            return
+        after = rows[-1]["id"]
+
+
+def export_transcript(engine, format: str, code4: Optional[str] = None) -> Iterator[bytes]:
+    """Encoded transcript lines of one room, or of every room in creation order.
+
+    A sync generator for StreamingResponse, which runs it on the threadpool
+    one chunk per hop, so it yields a chunk per segment or batch rather than
+    per message. It uses its own session, since the request's is closed
+    before the body is sent, and holds at most one batch at a time.
+    """
+    with Session(engine) as session:
+        statement = select(Room.id, Room.code4).order_by(Room.created_at, Room.id)
+        if code4 is not None:
+            statement = statement.where(Room.code4 == code4)
+        rooms = session.exec(statement).all()
+
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            yield buffer.getvalue().encode()
+            for room_id, room_code in rooms:
+                for batch in room_transcript(session, room_id):
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(
+                        (room_code, message["id"], message["sender"], message["content"], message["ts"]) for message in batch
+                    )
+                    yield buffer.getvalue().encode()
+            return
+
+        for room_id, room_code in rooms:
+            for batch in room_transcript(session, room_id):
+                yield b"".join(orjson.dumps({"room": room_code, **message}) + b"\n" for message in batch)
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional
+
+from fastapi.responses import Response
+
+from .cache import etag_matches
+
+# Vite writes content-hashed bundles under assets/, so they can be cached forever
+IMMUTABLE_PREFIX = "assets/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else (index.html, public/ files) is revalidated with its ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Files worth compressing when the build didn't ship a .gz next to them
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 1024
+
+# Preferred first; identity is always available
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+@dataclass
+class Asset:
+    """One file of the frontend build, held in memory with its compressed variants"""
+    path: str
+    content_type: str
+    etag: str
+    cache_control: str
+    body: bytes
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def pick(self, accept_encoding: str):
+        """The preferred variant the client accepts, as (encoding or None, body)"""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return None, self.body
+
+
+class AssetIndex:
+    """The built frontend (frontend/dist), read once at startup.
+
+    Every file is loaded with a strong ETag from its content hash. .br and
+    .gz files written by the build are used as precompressed variants; if
+    the build didn't produce a gzip variant for a text file it is made here,
+    once. Requests are then answered from memory without touching the disk:
+    304 when the ETag matches, otherwise the best encoding the client takes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._assets: Dict[str, Asset] = {}
+
+    def load(self) -> "AssetIndex":
+        assets = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith((".br", ".gz")):
+                    continue
+                full_path = os.path.join(directory, filename)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                assets[path] = self._load_asset(path, full_path)
+        self._assets = assets
+        return self
+
+    def _load_asset(self, path: str, full_path: str) -> Asset:
+        with open(full_path, "rb") as f:
+            body = f.read()
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+
+        variants = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(full_path + suffix):
+                with open(full_path + suffix, "rb") as f:
+                    variants[encoding] = f.read()
+        if "gzip" not in variants and len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                variants["gzip"] = compressed
+
+        immutable = path.startswith(IMMUTABLE_PREFIX)
+        return Asset(
+            path=path,
+            content_type=content_type,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            cache_control=IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+            body=body,
+            variants=variants
+        )
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self._assets.get(path)
+
+    def __len__(self):
+        return len(self._assets)
+
+    def respond(self, asset: Asset, headers: Mapping[str, str]) -> Response:
+        """Answer a request for an asset, honouring If-None-Match and Accept-Encoding"""
+        encoding, body = asset.pick(headers.get("accept-encoding", ""))
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+
+        if etag_matches(headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+
+        return Response(body, media_type=asset.content_type, headers=response_headers)
@@ -1,11 +1,22 @@
+import asyncio
+import math
+import os
+import threading
+import time
 import jwt
 import bcrypt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect
 from sqlmodel import Session, select
-from .database import get_session
+from starlette.concurrency import run_in_threadpool
+from .database import DEFAULT_GAME, Game, games, get_game, get_session
 from .models import User
+from .profiling import track
 
 # JWT settings
 SECRET_KEY = "your-secret-key-change-in-production"  # Change this in production!
@@ -13,14 +24,186 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 8
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="api/login", auto_error=False)
+
+# Principal cache: users resolved from tokens, so polling requests skip the user SELECT
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = 1024
+
+class PrincipalCache:
+    """Bounded LRU of (game id, token) -> detached User, each entry expiring after a TTL.
+
+    The game is part of the key, so a token only hits the cache in the game it was checked for.
+    Lookups run on threadpool workers, so every operation holds a lock.
+    """
+
+    def __init__(self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (game id, token) -> (expires_at, user)
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[User]:
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, key: Tuple[str, str], user: User, token_exp: Optional[float] = None):
+        """Cache a user for a (game, token); never past the token's own expiry"""
+        lifetime = self.ttl_seconds
+        if token_exp is not None:
+            lifetime = min(lifetime, token_exp - time.time())
+        if lifetime <= 0:
+            return
+        # A detached copy is safe to share between requests and sessions
+        principal = User(id=user.id, username=user.username, pw_hash=user.pw_hash, role=user.role)
+        with self.lock:
+            self._entries[key] = (time.monotonic() + lifetime, principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        """Drop every cached token of a user (in every game, which only costs a lookup)"""
+        with self.lock:
+            for key in [k for k, (_, user) in self._entries.items() if user.username == username]:
+                del self._entries[key]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    """Keep cached principals in step with the user table"""
+    history = inspect(target).attrs.username.history
+    for username in {target.username, *(history.deleted or ())}:
+        principal_cache.invalidate(username)
+
+# Password hashing: bcrypt cost, calibrated at startup unless BCRYPT_ROUNDS is set
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+BCRYPT_TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 14
+
+# Hashing runs on a bounded pool so logins never block the event loop
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_MAX_PENDING = 64
 
 def verify_password(plain_password, hashed_password):
     """Verify a password against a hash"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
-def get_password_hash(password):
+def get_password_hash(password, rounds: Optional[int] = None):
     """Generate a bcrypt hash for a password"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12)).decode('utf-8')
+    rounds = rounds or BCRYPT_ROUNDS
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def get_password_cost(hashed_password: str) -> int:
+    """Read the cost factor out of a bcrypt hash ($2b$<cost>$...)"""
+    return int(hashed_password.split("$")[2])
+
+def calibrate_password_cost(target_ms: float = BCRYPT_TARGET_MS, shared_path: Optional[str] = None) -> int:
+    """Pick the bcrypt cost whose hashing time is closest to target_ms on this machine.
+
+    With shared_path, the first worker process records its choice there and
+    the others reuse it, so workers never disagree and rehash each other's hashes.
+    """
+    global BCRYPT_ROUNDS
+    if "BCRYPT_ROUNDS" in os.environ:
+        return BCRYPT_ROUNDS
+    if shared_path and os.path.exists(shared_path):
+        with open(shared_path) as f:
+            BCRYPT_ROUNDS = int(f.read().strip())
+        return BCRYPT_ROUNDS
+
+    # Each extra round doubles the work, so one measurement at the floor is enough
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=BCRYPT_MIN_ROUNDS))
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.001)
+
+    rounds = BCRYPT_MIN_ROUNDS + round(math.log2(target_ms / elapsed_ms))
+    BCRYPT_ROUNDS = max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, rounds))
+    password_pool.record_verify(elapsed_ms / 1000 * 2 ** (BCRYPT_ROUNDS - BCRYPT_MIN_ROUNDS))
+    print(f"bcrypt cost calibrated to {BCRYPT_ROUNDS} rounds (target {target_ms:.0f} ms)")
+    if shared_path:
+        with open(shared_path, "w") as f:
+            f.write(str(BCRYPT_ROUNDS))
+    return BCRYPT_ROUNDS
+
+class PasswordPool:
+    """Bounded worker pool for bcrypt, with a cap on how many calls may queue up"""
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        # Running estimate of one verification, used to pad failed logins for unknown users
+        self.verify_seconds = 0.25
+
+    def record_verify(self, seconds: float):
+        self.verify_seconds = 0.8 * self.verify_seconds + 0.2 * seconds
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many logins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, track(fn), *args)
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        start = time.perf_counter()
+        result = await self.run(verify_password, plain_password, hashed_password)
+        self.record_verify(time.perf_counter() - start)
+        return result
+
+    async def hash(self, plain_password: str) -> str:
+        return await self.run(get_password_hash, plain_password)
+
+password_pool = PasswordPool()
+
+class KnownUsernames:
+    """In-memory sets of existing usernames per database, so logins for unknown names skip the database"""
+
+    def __init__(self):
+        self.names: Dict[str, Set[str]] = {}
+
+    def contains(self, session: Session, username: str) -> bool:
+        database = str(session.get_bind().url)
+        if database not in self.names:
+            self.names[database] = set(session.exec(select(User.username)).all())
+        return username in self.names[database]
+
+    def clear(self):
+        self.names.clear()
+
+known_usernames = KnownUsernames()
+
+@event.listens_for(User, "after_insert")
+def _add_known_username(mapper, connection, target):
+    # Databases not loaded yet will read the new user along with the rest
+    known_usernames.names.get(str(connection.engine.url), set()).add(target.username)
+
+@event.listens_for(User, "after_delete")
+def _remove_known_username(mapper, connection, target):
+    known_usernames.names.get(str(connection.engine.url), set()).discard(target.username)
 
 def authenticate_user(session: Session, username: str, password: str):
     """Authenticate a user by username and password"""
@@ -29,6 +212,29 @@ def authenticate_user(session: Session, username: str, password: str):
         return None
     return user
 
+async def authenticate_user_async(session: Session, username: str, password: str):
+    """Authenticate a user without blocking the event loop, upgrading stale hashes on success"""
+    def lookup():
+        if not known_usernames.contains(session, username):
+            return None
+        return session.exec(select(User).where(User.username == username)).first()
+
+    user = await run_in_threadpool(lookup)
+    if user is None:
+        # Take as long as a real check would, without spending a hash on it
+        await asyncio.sleep(password_pool.verify_seconds)
+        return None
+
+    if not await password_pool.verify(password, user.pw_hash):
+        return None
+
+    # Transparently rehash when the stored cost differs from the calibrated one
+    if get_password_cost(user.pw_hash) != BCRYPT_ROUNDS:
+        user.pw_hash = await password_pool.hash(password)
+        session.add(user)
+        await run_in_threadpool(session.commit)
+    return user
+
 def create_access_token(data: dict):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -37,13 +243,20 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
-    """Get the current user from a JWT token"""
+def get_user_from_token(token: Optional[str], session: Session, game_id: str = DEFAULT_GAME):
+    """Resolve the user a JWT token was issued for, or raise 401 if it was issued by another game"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
+
+    cached = principal_cache.get((game_id, token))
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -51,12 +264,44 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-    
+    # Tokens from before games existed belong to the default game
+    if payload.get("game", DEFAULT_GAME) != game_id:
+        raise credentials_exception
+
     user = session.exec(select(User).where(User.username == username)).first()
     if user is None:
         raise credentials_exception
+
+    principal_cache.put((game_id, token), user, payload.get("exp"))
     return user
 
+def is_admin_token(token: Optional[str]) -> bool:
+    """Whether a bearer token belongs to an admin of the default game (blocking).
+
+    Used outside dependency injection by the profiling middleware; only the
+    default game's admins may profile, since profiles cover the whole process.
+    """
+    if not token:
+        return False
+    with Session(games.default.engine) as session:
+        try:
+            return get_user_from_token(token, session).role == "admin"
+        except HTTPException:
+            return False
+
+def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session), game: Game = Depends(get_game)):
+    """Get the current user from a JWT token"""
+    return get_user_from_token(token, session, game.id)
+
+def get_stream_user(
+    token: Optional[str] = None,
+    bearer_token: Optional[str] = Depends(oauth2_scheme_optional),
+    session: Session = Depends(get_session),
+    game: Game = Depends(get_game)
+):
+    """Get the current user for EventSource streams, which can only pass the JWT as ?token="""
+    return get_user_from_token(bearer_token or token, session, game.id)
+
 def get_admin_user(current_user: User = Depends(get_current_user)):
     """Check if the current user is an admin"""
     if current_user.role != "admin":
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Callable, Dict, List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session, select, delete, func
+from starlette.concurrency import run_in_threadpool
+
+from .database import engine
+from .models import BrokerEvent
+from .writer import get_writer
+
+# "local": one process, events stay in memory. "sqlite": several uvicorn workers
+# sharing the database, events and rate limits go through it. Defaults to
+# "sqlite" when uvicorn is told to run several workers through WEB_CONCURRENCY.
+# That database is always the default game's: with "sqlite", every game's
+# events and message/login rate limits are written there, so games hosted in
+# shards share its write lock. Shard isolation only holds for "local".
+STATE_BACKEND = os.environ.get("STATE_BACKEND") or (
+    "sqlite" if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 else "local"
+)
+
+# How often each worker reads the notification log, and how long entries are kept
+BROKER_POLL_SECONDS = float(os.environ.get("BROKER_POLL_MS", "50")) / 1000
+BROKER_RETENTION_SECONDS = 60
+BROKER_BATCH = 500
+
+
+class LocalBroker:
+    """In-process pub/sub between the API and the live-delivery state.
+
+    Modules register a handler per channel (room messages, user events,
+    cache invalidation, room directory changes). publish() runs the
+    handlers of this process straight away.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = {}
+
+    def on(self, channel: str, handler: Callable[[dict], None]):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def dispatch(self, channel: str, payload: dict):
+        for handler in self._handlers.get(channel, ()):
+            handler(payload)
+
+    async def publish(self, channel: str, payload: dict):
+        self.dispatch(channel, payload)
+
+    def publish_blocking(self, channel: str, payload: dict):
+        """publish() for sync code with no event loop at hand, e.g. ORM events on the threadpool"""
+        self.dispatch(channel, payload)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SQLiteBroker(LocalBroker):
+    """Pub/sub across worker processes through a notification log in the app's database.
+
+    publish() handles the event in this process right away and appends it
+    to the BrokerEvent table through the group-commit writer, so a burst of
+    events costs one commit. Every worker tails the table every
+    BROKER_POLL_SECONDS and handles the events other processes wrote, so
+    cross-worker delivery takes at most about one poll interval. Entries
+    older than BROKER_RETENTION_SECONDS are pruned.
+    """
+
+    shared = True
+
+    def __init__(self, engine, poll_seconds: float = BROKER_POLL_SECONDS, retention_seconds: float = BROKER_RETENTION_SECONDS):
+        super().__init__()
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self.origin = uuid.uuid4().hex
+        self._last_id = 0
+        self._task = None
+
+    async def publish(self, channel: str, payload: dict):
+        self.dispatch(channel, payload)
+        event = BrokerEvent(
+            channel=channel,
+            payload=orjson.dumps(jsonable_encoder(payload)).decode(),
+            origin=self.origin,
+            ts=time.time()
+        )
+
+        def append(session: Session):
+            session.add(event)
+            return event
+        await get_writer(self.engine).submit(append)
+
+    def publish_blocking(self, channel: str, payload: dict):
+        self.dispatch(channel, payload)
+        with Session(self.engine) as session:
+            session.add(BrokerEvent(
+                channel=channel,
+                payload=orjson.dumps(jsonable_encoder(payload)).decode(),
+                origin=self.origin,
+                ts=time.time()
+            ))
+            session.commit()
+
+    async def start(self):
+        def last_id():
+            with Session(self.engine) as session:
+                return session.exec(select(func.max(BrokerEvent.id))).one() or 0
+        self._last_id = await run_in_threadpool(last_id)
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _read(self, prune: bool) -> List[BrokerEvent]:
+        with Session(self.engine) as session:
+            if prune:
+                session.exec(delete(BrokerEvent).where(BrokerEvent.ts < time.time() - self.retention_seconds))
+                session.commit()
+            return session.exec(
+                select(BrokerEvent)
+                .where(BrokerEvent.id > self._last_id)
+                .order_by(BrokerEvent.id)
+                .limit(BROKER_BATCH)
+            ).all()
+
+    async def _poll(self):
+        polls = 0
+        prune_every = max(1, int(self.retention_seconds / self.poll_seconds))
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            polls += 1
+            try:
+                events = await run_in_threadpool(self._read, polls % prune_every == 0)
+            except Exception as e:
+                print(f"Broker poll failed: {e}")
+                continue
+            for event in events:
+                self._last_id = event.id
+                if event.origin == self.origin:
+                    continue
+                try:
+                    self.dispatch(event.channel, orjson.loads(event.payload))
+                except Exception as e:
+                    print(f"Broker handler for {event.channel} failed: {e}")
+
+
+def create_broker():
+    if STATE_BACKEND == "sqlite":
+        return SQLiteBroker(engine)
+    if STATE_BACKEND != "local":
+        raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}, expected 'local' or 'sqlite'")
+    return LocalBroker()
+
+
+broker = create_broker()
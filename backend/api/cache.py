@@ -0,0 +1,146 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .broker import broker
+from .database import games
+from .models import Persona
+
+# Pre-serialized responses kept in memory, least recently used evicted first
+RESPONSE_CACHE_SIZE = 256
+# Cached API responses may be stored by the browser but must be revalidated
+CACHED_RESPONSE_CACHE_CONTROL = "private, no-cache"
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    version: int
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """JSON response bodies cached per resource version.
+
+    Every resource ("personas", "rooms", "messages:<room id>", ...) has a
+    version counter that its writers bump after committing. A body is
+    serialized once, tagged with the version that was current before its
+    query ran, and served until the version moves on, so a write racing a
+    read can only leave behind an entry that is already stale. The ETag is
+    a hash of the body, which stays valid across restarts.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._versions: Dict[str, int] = {}
+        self._entries: "OrderedDict[Tuple[str, Hashable], CachedBody]" = OrderedDict()
+
+    def version(self, resource: str) -> int:
+        return self._versions.get(resource, 0)
+
+    def bump(self, resource: str):
+        """Mark everything cached for a resource as stale"""
+        self._versions[resource] = self.version(resource) + 1
+
+    def get(self, resource: str, key: Hashable = None) -> Optional[CachedBody]:
+        entry = self._entries.get((resource, key))
+        if entry is None or entry.version != self.version(resource):
+            return None
+        self._entries.move_to_end((resource, key))
+        return entry
+
+    def put(self, resource: str, key: Hashable, content, version: int) -> CachedBody:
+        body = orjson.dumps(content)
+        entry = CachedBody(version, body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        self._entries[(resource, key)] = entry
+        self._entries.move_to_end((resource, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def fetch(self, resource: str, key: Hashable, load: Callable[[], Awaitable]) -> CachedBody:
+        """The cached body for (resource, key), loading and serializing it on a miss"""
+        entry = self.get(resource, key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        version = self.version(resource)
+        return self.put(resource, key, await load(), version)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._versions.clear()
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def messages_resource(room_id: int) -> str:
+    return f"messages:{room_id}"
+
+
+async def invalidate(*resources: str):
+    """Bump resources in every worker's cache; call after the write has committed"""
+    await broker.publish("cache_bump", {"resources": list(resources)})
+
+
+def _bump_resources(payload: dict):
+    for resource in payload["resources"]:
+        response_cache.bump(resource)
+
+
+broker.on("cache_bump", _bump_resources)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cached_response(entry: CachedBody, request: Request) -> Response:
+    """Send a cached body, or 304 if the client already has it"""
+    headers = {"ETag": entry.etag, "Cache-Control": CACHED_RESPONSE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+@event.listens_for(Persona, "after_insert")
+@event.listens_for(Persona, "after_update")
+@event.listens_for(Persona, "after_delete")
+def _mark_personas_changed(mapper, connection, target):
+    """Personas only change through the ORM (seeding), so mapper events are enough.
+
+    The game is resolved from the engine that ran the write; its scoped
+    "personas" resource is bumped in every worker once the session commits.
+    """
+    game = games.for_engine(connection.engine)
+    object_session(target).info.setdefault("changed_resources", set()).add(game.scoped("personas"))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_resources(session):
+    resources = session.info.pop("changed_resources", None)
+    if resources:
+        broker.publish_blocking("cache_bump", {"resources": sorted(resources)})
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_resources(session, previous_transaction):
+    session.info.pop("changed_resources", None)
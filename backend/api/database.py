@@ -1,21 +1,239 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from fastapi import Depends, HTTPException
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlmodel import SQLModel, create_engine, Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+import fcntl
+import json
 import os
+import re
+import threading
 
 # SQLite database URL - use environment variable or default
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./severance.db")
 
+# Log every SQL statement only when asked to
+SQL_ECHO = os.environ.get("SQL_ECHO", "").lower() in ("1", "true", "yes")
+
 # Ensure data directory exists
 if DATABASE_URL.startswith("sqlite:///./data/"):
     os.makedirs("./data", exist_ok=True)
 
+# SQLite storage profiles, applied as PRAGMAs on every new connection.
+# WAL lets poll reads proceed while a message insert is committing.
+SQLITE_PROFILES = {
+    # SQLite's own defaults: rollback journal, writers block readers
+    "default": {},
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",  # durable across app crashes, may lose the last commits on power loss
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -32000,  # negative means KiB, so ~32 MB
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -32000,
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "fast")
+
+def get_sqlite_pragmas(profile: str = SQLITE_PROFILE, overrides: str = os.environ.get("SQLITE_PRAGMAS", "")) -> dict:
+    """PRAGMAs for a profile, with "name=value,..." overrides (e.g. SQLITE_PRAGMAS=synchronous=FULL)"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {profile!r}, expected one of {sorted(SQLITE_PROFILES)}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        name, _, value = item.partition("=")
+        pragmas[name.strip()] = value.strip()
+    return pragmas
+
+def configure_sqlite(engine, pragmas: dict):
+    """Apply PRAGMAs to every connection the engine opens"""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def open_engine(url: str) -> Engine:
+    engine = create_engine(url, echo=SQL_ECHO, connect_args={"check_same_thread": False})
+    configure_sqlite(engine, get_sqlite_pragmas())
+    return engine
+
 # Create SQLite engine
-engine = create_engine(DATABASE_URL, echo=True, connect_args={"check_same_thread": False})
+engine = open_engine(DATABASE_URL)
 
-def create_db_and_tables():
+def create_db_and_tables(engine: Engine = engine):
     """Create database tables from SQLModel models"""
     SQLModel.metadata.create_all(engine)
 
-def get_session():
-    """Get a database session"""
-    with Session(engine) as session:
+    # create_all skips tables that already exist, so add any indexes introduced since
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+# The game served at /api/...; every other game is served at /api/games/{game_id}/... from its own shard
+DEFAULT_GAME = "default"
+# Shard files of the other games: <GAMES_DIR>/<game id>.db, with the game's clues in <game id>.clues.json
+GAMES_DIR = os.environ.get("GAMES_DIR", "./data/games" if os.path.isdir("./data") else "./games")
+GAME_ID_PATTERN = re.compile(r"[a-z0-9][a-z0-9-]{0,31}")
+
+def scoped_key(game_id: str, key: str) -> str:
+    """A cache, channel or rate-limit key kept apart from other games'; the default game's keys are unchanged"""
+    return key if game_id == DEFAULT_GAME else f"{game_id}/{key}"
+
+@dataclass
+class Game:
+    id: str
+    engine: Engine
+    # Clues of the game's seed set; None for the default game, whose clues are SEED_DATA's
+    clues: Optional[dict] = None
+
+    def scoped(self, key: str) -> str:
+        return scoped_key(self.id, key)
+
+class GameRegistry:
+    """Open games by id: the default game on DATABASE_URL, every other one in its own SQLite shard.
+
+    Each shard has its own engine, connection pool and group-commit writer,
+    so one game's writes never wait on another's locks. A shard is opened
+    on its first request; shards created by another worker process are
+    found on disk the same way. With STATE_BACKEND=sqlite the cross-worker
+    state (broker events, shared rate limits) still lives in the default
+    game's database, so that isolation only holds for the local backend.
+    """
+
+    def __init__(self, directory: str = GAMES_DIR):
+        self.directory = directory
+        self.default = Game(DEFAULT_GAME, engine)
+        self._games: Dict[str, Game] = {DEFAULT_GAME: self.default}
+        self._lock = threading.Lock()
+
+    def shard_path(self, game_id: str) -> str:
+        return os.path.join(self.directory, f"{game_id}.db")
+
+    def clues_path(self, game_id: str) -> str:
+        return os.path.join(self.directory, f"{game_id}.clues.json")
+
+    def loaded(self, game_id: str) -> Optional[Game]:
+        return self._games.get(game_id)
+
+    def get(self, game_id: str) -> Optional[Game]:
+        """An open game, opening its shard if it exists (blocking)"""
+        game = self._games.get(game_id)
+        if game is not None or not GAME_ID_PATTERN.fullmatch(game_id):
+            return game
+        with self._lock:
+            # A shard without its clues file is still being created
+            if game_id not in self._games and os.path.exists(self.shard_path(game_id)) and os.path.exists(self.clues_path(game_id)):
+                self._open(game_id)
+            return self._games.get(game_id)
+
+    def _open(self, game_id: str) -> Game:
+        game_engine = open_engine(f"sqlite:///{self.shard_path(game_id)}")
+        # Shards made by an older version get the tables and indexes added since
+        create_db_and_tables(game_engine)
+        try:
+            with open(self.clues_path(game_id)) as f:
+                clues = json.load(f)
+        except (OSError, ValueError):
+            # Left empty, so the game's clue routes report the error
+            clues = {}
+        game = Game(game_id, game_engine, clues)
+        self._games[game_id] = game
+        return game
+
+    def create(self, game_id: str, clues: dict) -> Game:
+        """Create an empty shard for a new game (blocking); raises FileExistsError if it exists"""
+        if not GAME_ID_PATTERN.fullmatch(game_id) or game_id == DEFAULT_GAME:
+            raise ValueError(f"Invalid game id {game_id!r}")
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            # Claim the id first: O_EXCL, so of two workers creating the same game only one gets past here
+            os.close(os.open(self.shard_path(game_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            try:
+                # Renamed into place, so other workers see the whole clues file or none
+                temp_path = f"{self.clues_path(game_id)}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(clues, f)
+                os.replace(temp_path, self.clues_path(game_id))
+            except BaseException:
+                os.remove(self.shard_path(game_id))
+                raise
+            return self._open(game_id)
+
+    def remove(self, game_id: str):
+        """Close a game and delete its shard and clues files (blocking)"""
+        with self._lock:
+            game = self._games.pop(game_id, None)
+            if game is not None:
+                game.engine.dispose()
+            shard_path = self.shard_path(game_id)
+            for path in (shard_path, f"{shard_path}-wal", f"{shard_path}-shm", self.clues_path(game_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def for_engine(self, game_engine: Engine) -> Game:
+        """The game an engine belongs to; engines the registry didn't open count as the default game's"""
+        for game in list(self._games.values()):
+            if game.engine is game_engine:
+                return game
+        return self.default
+
+    def ids(self) -> List[str]:
+        """The default game and every game with a shard on disk"""
+        shards = []
+        if os.path.isdir(self.directory):
+            shards = sorted(name[:-3] for name in os.listdir(self.directory) if name.endswith(".db"))
+        return [DEFAULT_GAME] + shards
+
+    def dispose(self):
+        """Close the shards' connection pools"""
+        for game in list(self._games.values()):
+            if game is not self.default:
+                game.engine.dispose()
+
+games = GameRegistry()
+
+async def get_game(connection: HTTPConnection) -> Game:
+    """The game a request is for, from the {game_id} in /api/games/{game_id}/... (default game otherwise)"""
+    game_id = connection.path_params.get("game_id", DEFAULT_GAME)
+    game = games.loaded(game_id) or await run_in_threadpool(games.get, game_id)
+    if game is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return game
+
+@contextmanager
+def startup_lock():
+    """Serialize schema creation and seeding across worker processes sharing a SQLite file"""
+    if not DATABASE_URL.startswith("sqlite:///") or DATABASE_URL == "sqlite:///:memory:":
+        yield
+        return
+    with open(DATABASE_URL[len("sqlite:///"):] + ".startup.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_session(game: Game = Depends(get_game)):
+    """Get a database session on the request's game"""
+    # Keep loaded attributes after commit so handlers can serialize without re-querying
+    with Session(game.engine, expire_on_commit=False) as session:
         yield session
@@ -1,14 +1,24 @@
-from fastapi import FastAPI, Depends, Request
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 import os
-from sqlmodel import Session
 
-from .database import create_db_and_tables, get_session
-from .routes import router
+from .assets import AssetIndex
+from .auth import calibrate_password_cost, is_admin_token
+from .metrics import MetricsMiddleware
+from .profiling import ProfilingMiddleware
+from .broker import broker
+from .database import DATABASE_URL, create_db_and_tables, games, get_session, startup_lock
+from .routes import router, server_router
+from .ratelimit import rate_limit_sync
+from .rooms import room_directory
+from .writer import close_writers
 from .seed_data import seed_database
 
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 app = FastAPI(title="Severance Mystery Game")
 
 # Add CORS middleware
@@ -20,30 +30,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include the API router
-app.include_router(router)
+# Request counts, latency and SQL work per route, served at /api/metrics
+app.add_middleware(MetricsMiddleware)
+
+# Admin-only sampling profiler for single requests (X-Profile: 1 or ?profile=1)
+app.add_middleware(ProfilingMiddleware, is_admin=is_admin_token)
+
+# Include the API routers: the default game at /api, every other game under /api/games/{game_id}
+app.include_router(server_router)
+app.include_router(router, prefix="/api")
+app.include_router(router, prefix="/api/games/{game_id}", include_in_schema=False)
 
 @app.on_event("startup")
 def on_startup():
     """Initialize database and seed data on startup"""
-    create_db_and_tables()
+    timings = {"import": IMPORT_SECONDS}
+
+    # With several workers, the first one through the lock creates and seeds the database
+    with startup_lock():
+        started = time.perf_counter()
+        shared_cost_path = DATABASE_URL[len("sqlite:///"):] + ".bcrypt_rounds" if broker.shared else None
+        calibrate_password_cost(shared_path=shared_cost_path)
+        timings["calibrate"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        create_db_and_tables()
+        timings["create_all"] = time.perf_counter() - started
+
+        # Get a session to seed the database
+        started = time.perf_counter()
+        session = next(get_session(games.default))
+        seed_database(session)
+        timings["seed"] = time.perf_counter() - started
+
+    # Warm the room directory so message paths never look rooms up
+    room_directory.load(session)
+
+    if os.path.exists(frontend_path):
+        started = time.perf_counter()
+        frontend_assets.load()
+        timings["assets"] = time.perf_counter() - started
+
+    print("Startup timings: " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items()))
+
+@app.on_event("startup")
+async def start_broker():
+    """Start following events published by other worker processes, and syncing shared rate limits"""
+    await broker.start()
+    rate_limit_sync.start()
 
-    # Get a session to seed the database
-    session = next(get_session())
-    seed_database(session)
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Flush queued inserts before the process exits"""
+    await broker.stop()
+    await rate_limit_sync.stop()
+    await close_writers()
+    games.dispose()
 
-# Serve static files from the React build
+# Serve the React build from memory
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "frontend", "dist")
+frontend_assets = AssetIndex(frontend_path)
 if os.path.exists(frontend_path):
-    app.mount("/assets", StaticFiles(directory=os.path.join(frontend_path, "assets")), name="assets")
+    @app.get("/assets/{path:path}", include_in_schema=False)
+    async def serve_asset(request: Request, path: str):
+        """Serve a hashed build asset"""
+        asset = frontend_assets.get("assets/" + path)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return frontend_assets.respond(asset, request.headers)
 
     @app.get("/", include_in_schema=False)
     @app.get("/{path:path}", include_in_schema=False)
     async def serve_frontend(request: Request, path: str = ""):
-        """Serve the frontend React app"""
-        index_path = os.path.join(frontend_path, "index.html")
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
+        """Serve the frontend React app: a top-level build file, or index.html for client routes"""
+        asset = frontend_assets.get(path) or frontend_assets.get("index.html")
+        if asset is not None:
+            return frontend_assets.respond(asset, request.headers)
         return {"status": "error", "message": "Frontend not built"}
 else:
     @app.get("/")
@@ -0,0 +1,331 @@
+import bisect
+import contextvars
+import hmac
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from .auth import oauth2_scheme_optional, get_user_from_token, password_pool
+from .cache import response_cache
+from .database import get_session
+from .ratelimit import message_limiter, login_limiter, stream_limiter
+from .realtime import room_notifier, room_sockets, user_events
+from .writer import writer_stats
+
+# Seconds; the top buckets are for long-polls and slow logins under load
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Scrapers can authenticate with this static bearer token instead of an admin JWT
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric family with fixed label names"""
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterable[Tuple[str, Tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, label_values, value in self.samples():
+            label_names = self.labels + (("le",) if len(label_values) > len(self.labels) else ())
+            lines.append(f"{name}{format_labels(label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # SQL hooks update metrics from threadpool workers
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            yield self.name, label_values, value
+
+    def clear(self):
+        self.values.clear()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *label_values: str, value: float):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class CallbackGauge(Metric):
+    """A gauge read at scrape time from live state, as {label values: value}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def samples(self):
+        for label_values, value in sorted(self.read().items()):
+            yield self.name, label_values, value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            series = sorted((label_values, (list(counts), total, count)) for label_values, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", label_values + (format_value(bound),), cumulative
+            yield f"{self.name}_sum", label_values, total
+            yield f"{self.name}_count", label_values, count
+
+    def clear(self):
+        self.series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            if hasattr(metric, "clear"):
+                metric.clear()
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("route", "method", "status")
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled (long-polls and event streams included)"
+))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request to the end of the response body", ("route", "method")
+))
+sql_queries = registry.register(Counter(
+    "sql_queries_total", "SQL statements executed"
+))
+sql_seconds = registry.register(Counter(
+    "sql_query_seconds_total", "Time spent executing SQL statements"
+))
+request_sql_queries = registry.register(Histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ("route",), QUERY_COUNT_BUCKETS
+))
+request_sql_seconds = registry.register(Histogram(
+    "http_request_sql_seconds", "SQL time per request", ("route",)
+))
+
+
+class RequestStats:
+    """SQL work done on behalf of one request"""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# The current request's stats; the threadpool copies the context, so repository queries land here too
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    sql_queries.inc()
+    sql_seconds.inc(amount=elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, in-flight and latency per route template.
+
+    Labels use the matched route's path template (/api/rooms/{code4}/messages),
+    never the raw path, so room codes and ids don't multiply the series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_flight.inc(amount=1)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.inc(amount=-1)
+            current_request.reset(token)
+            route = route_template(scope)
+            http_requests.inc(route, scope["method"], str(status_code))
+            http_latency.observe(time.perf_counter() - started, route, scope["method"])
+            request_sql_queries.observe(stats.queries, route)
+            request_sql_seconds.observe(stats.seconds, route)
+
+
+LIMITERS = {"messages": message_limiter, "logins": login_limiter, "stream": stream_limiter}
+
+# Keys per limiter as of the last scrape; shared limiters count them with a query, so
+# refresh_tracked_keys runs on the threadpool before rendering
+tracked_keys: Dict[str, int] = {}
+
+
+def refresh_tracked_keys():
+    for name, limiter in LIMITERS.items():
+        tracked_keys[name] = len(limiter)
+
+
+def register_runtime_gauges():
+    """Gauges over the app's in-memory state, read at scrape time"""
+    registry.register(CallbackGauge(
+        "room_pollers", "Long-poll requests parked per room", ("room",),
+        lambda: {(code4,): count for code4, count in room_notifier.waiters().items()}
+    ))
+    registry.register(CallbackGauge(
+        "room_sockets", "Open WebSockets per room", ("room",),
+        lambda: {(code4,): count for code4, count in room_sockets.connections().items()}
+    ))
+    registry.register(CallbackGauge(
+        "event_stream_users", "Users with at least one open /api/events stream", (),
+        lambda: {(): user_events.user_count()}
+    ))
+    registry.register(CallbackGauge(
+        "rate_limit_rejections", "Requests rejected with 429 per limiter since startup", ("limiter",),
+        lambda: {(name,): limiter.rejections for name, limiter in LIMITERS.items()}
+    ))
+    registry.register(CallbackGauge(
+        "rate_limit_tracked_keys", "Keys with live token buckets per limiter", ("limiter",),
+        lambda: {(name,): count for name, count in tracked_keys.items()}
+    ))
+    registry.register(CallbackGauge(
+        "bcrypt_queue_depth", "Password hashes waiting for a free bcrypt worker", (),
+        lambda: {(): max(0, password_pool.pending - password_pool.workers)}
+    ))
+    registry.register(CallbackGauge(
+        "bcrypt_in_progress", "Password hashes running or queued", (),
+        lambda: {(): password_pool.pending}
+    ))
+    registry.register(CallbackGauge(
+        "group_commit", "Group-commit writer totals: queued writes, commits and writes committed", ("stat",),
+        lambda: {(stat,): value for stat, value in writer_stats().items()}
+    ))
+    registry.register(CallbackGauge(
+        "response_cache", "Versioned response cache lookups and size", ("stat",),
+        lambda: {("hits",): response_cache.hits, ("misses",): response_cache.misses, ("entries",): len(response_cache)}
+    ))
+
+
+register_runtime_gauges()
+
+
+def require_metrics_access(token: Optional[str] = Depends(oauth2_scheme_optional), session: Session = Depends(get_session)):
+    """Allow the static METRICS_TOKEN (for scrapers) or an admin's JWT"""
+    if token and METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    user = get_user_from_token(token, session)
+    if user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics require an admin or the metrics token")
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 from datetime import datetime
@@ -24,6 +25,9 @@ class Room(SQLModel, table=True):
     messages: List["Message"] = Relationship(back_populates="room")
 
 class Message(SQLModel, table=True):
+    # History and stream queries filter on room_id and page on id
+    __table_args__ = (Index("ix_message_room_id_id", "room_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     room_id: int = Field(foreign_key="room.id")
     sender: str
@@ -32,10 +36,59 @@ class Message(SQLModel, table=True):
 
     room: Room = Relationship(back_populates="messages")
 
+class MessageArchive(SQLModel, table=True):
+    # Compressed segments of messages moved out of the hot Message table, read back in first_id order per room
+    __table_args__ = (Index("ix_messagearchive_room_id_first_id", "room_id", "first_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    room_id: int = Field(foreign_key="room.id")
+    first_id: int
+    last_id: int
+    count: int
+    first_ts: datetime
+    last_ts: datetime
+    data: bytes  # zlib-compressed NDJSON, one MessageResponse object per line
+
+class RoomPresence(SQLModel, table=True):
+    # When each participant last opened, polled or posted in a room; written at most every LAST_SEEN_WRITE_SECONDS
+    room_id: int = Field(foreign_key="room.id", primary_key=True)
+    username: str = Field(primary_key=True)
+    last_seen: datetime
+
 class DirectMessage(SQLModel, table=True):
+    # Inbox pages walk (recipient, ts, id) newest first; unread counts filter on recipient and read state
+    __table_args__ = (
+        Index("ix_directmessage_user_ts_id", "user_username", "ts", "id"),
+        Index("ix_directmessage_user_read_ts", "user_username", "is_read", "ts"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     admin_username: str  # The admin who sent the message
     user_username: str   # The user who received the message
     content: str
     is_read: bool = Field(default=False)
     ts: datetime = Field(default_factory=datetime.utcnow)
+
+class UnreadCount(SQLModel, table=True):
+    # Kept in step with DirectMessage.is_read so unread checks are a primary-key read
+    username: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+class BrokerEvent(SQLModel, table=True):
+    # Notification log read by every worker process when STATE_BACKEND=sqlite.
+    # AUTOINCREMENT: ids must never be reused after pruning, workers track the last one they read
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    channel: str
+    payload: str  # JSON
+    origin: str  # id of the publishing process, which has already handled the event
+    ts: float = Field(index=True)  # unix time, for pruning
+
+class RateLimitBucket(SQLModel, table=True):
+    # Token buckets shared by all worker processes when STATE_BACKEND=sqlite
+    limiter: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    tokens: float
+    updated: float  # unix time
+    allowed: bool = True  # outcome of the last hit
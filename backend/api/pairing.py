@@ -0,0 +1,42 @@
+from typing import FrozenSet, Iterable, List, Optional, Set, Tuple
+
+Pairing = Tuple[str, str]
+
+
+def rotation_pairings(outies: List[str], innies: List[str], shift: int) -> Tuple[List[Pairing], List[str]]:
+    """Pair every member of the smaller group with the larger group rotated by shift.
+
+    Rooms are always (outie, innie). Over len(larger group) consecutive
+    shifts everyone from the smaller group meets everyone from the larger
+    one exactly once; returns the pairings and whoever sits this round out.
+    """
+    small, large = (outies, innies) if len(outies) <= len(innies) else (innies, outies)
+    if not small:
+        return [], list(large)
+    partners = [large[(i + shift) % len(large)] for i in range(len(small))]
+    if small is outies:
+        pairs = list(zip(small, partners))
+    else:
+        pairs = list(zip(partners, small))
+    chosen = set(partners)
+    return pairs, [name for name in large if name not in chosen]
+
+
+def least_repeated_shift(outies: List[str], innies: List[str], previous: Set[FrozenSet[str]]) -> int:
+    """The rotation whose pairings repeat the fewest previous rooms, earliest first on a tie.
+
+    With no history this is round 0; after each round the next unused
+    rotation wins, so calling it round after round walks the round robin.
+    """
+    rounds = max(len(outies), len(innies), 1)
+    return min(
+        range(rounds),
+        key=lambda shift: sum(frozenset(pair) in previous for pair in rotation_pairings(outies, innies, shift)[0])
+    )
+
+
+def round_robin(outies: List[str], innies: List[str], previous: Iterable[Pairing] = (), round: Optional[int] = None) -> Tuple[List[Pairing], List[str]]:
+    """One round of outie/innie rooms: the given round, or the least repeated one"""
+    if round is None:
+        round = least_repeated_shift(outies, innies, {frozenset(pair) for pair in previous})
+    return rotation_pairings(outies, innies, round)
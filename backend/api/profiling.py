@@ -0,0 +1,255 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+# Sampling period; the sampler also needs the GIL, so CPU-bound code is sampled less often
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_MS", "1")) / 1000
+# Stop sampling requests that run longer than this (long-polls, event streams)
+PROFILE_MAX_SECONDS = 30
+# Finished profiles kept in memory for /api/profiles
+PROFILE_KEEP = 20
+# Also write <id>.folded and <id>.json here when set
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+# Longest SQL text shown as a frame in the folded stacks
+SQL_FRAME_LENGTH = 80
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace(os.sep, "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def sql_label(statement: str) -> str:
+    text = " ".join(statement.split())
+    return "SQL: " + (text[:SQL_FRAME_LENGTH] + "..." if len(text) > SQL_FRAME_LENGTH else text)
+
+
+class Profile:
+    """A sampled profile of one request.
+
+    A sampler thread reads the stacks of the threads working for the
+    request: the event loop thread, plus any threadpool or bcrypt worker
+    while it runs one of the request's calls (see track). Stacks are
+    counted in folded form (root;...;leaf), ready for flamegraph.pl or
+    speedscope. A thread inside a SQL statement gets the statement as an
+    extra leaf frame, and every statement is also listed with its time.
+    Other requests running on the event loop at the same moment show up
+    in its samples too, so profile on a quiet server when possible.
+    """
+
+    def __init__(self, method: str, path: str, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status_code = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.queries: List[dict] = []
+        self.running_sql: Dict[int, str] = {}
+        self._threads: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def attach(self, ident: int, label: str):
+        self._threads[ident] = label
+
+    def detach(self, ident: int):
+        self._threads.pop(ident, None)
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration = time.time() - self.started_at
+
+    def _sample(self):
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for ident, label in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(label)
+                stack.reverse()
+                statement = self.running_sql.get(ident)
+                if statement is not None:
+                    stack.append(sql_label(statement))
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "sql_queries": len(self.queries),
+            "sql_ms": round(sum(query["ms"] for query in self.queries), 2),
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "queries": self.queries, "stacks": dict(self.stacks.most_common())}
+
+
+class ProfileStore:
+    """The most recent finished profiles, optionally mirrored to PROFILE_DIR"""
+
+    def __init__(self, keep: int = PROFILE_KEEP, directory: str = PROFILE_DIR):
+        self.keep = keep
+        self.directory = directory
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+
+    def add(self, profile: Profile):
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last=False)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile.id}.folded"), "w") as f:
+                f.write(profile.folded())
+            with open(os.path.join(self.directory, f"{profile.id}.json"), "w") as f:
+                json.dump(profile.to_dict(), f, indent=2)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Profile]:
+        return list(reversed(self._profiles.values()))
+
+    def clear(self):
+        self._profiles.clear()
+
+
+profile_store = ProfileStore()
+
+# The profile of the request being handled, if it asked for one
+current_profile: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("current_profile", default=None)
+
+
+def track(fn):
+    """Wrap a function about to run on a worker thread so the current profile samples that thread.
+
+    Returns fn itself when the request isn't being profiled.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return fn
+
+    def tracked(*args, **kwargs):
+        ident = threading.get_ident()
+        profile.attach(ident, threading.current_thread().name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.detach(ident)
+    return tracked
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.running_sql[threading.get_ident()] = statement
+        conn.info["profile_query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.running_sql.pop(threading.get_ident(), None)
+        elapsed = time.perf_counter() - conn.info.pop("profile_query_started", time.perf_counter())
+        profile.queries.append({
+            "sql": " ".join(statement.split()),
+            "executemany": executemany,
+            "ms": round(elapsed * 1000, 3),
+        })
+
+
+def wants_profile(scope) -> bool:
+    if not scope["path"].startswith("/api/"):
+        return False
+    for name, value in scope["headers"]:
+        if name == b"x-profile" and value not in (b"", b"0"):
+            return True
+    query = scope.get("query_string", b"")
+    return b"profile=1" in query.split(b"&")
+
+
+def bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value.lower().startswith(b"bearer "):
+            return value[7:].decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """Profile single /api requests on demand.
+
+    A request with an 'X-Profile: 1' header or '?profile=1' from an admin
+    is sampled while it runs; its response carries X-Profile-Id and the
+    profile is kept for GET /api/profiles/{id}. Requests without the flag
+    pay one header scan. is_admin checks a bearer token on the threadpool.
+    """
+
+    def __init__(self, app, is_admin: Callable[[Optional[str]], bool]):
+        self.app = app
+        self.is_admin = is_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not await run_in_threadpool(self.is_admin, bearer_token(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+        profile.attach(threading.get_ident(), "event-loop")
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode()),
+                ]
+            await send(message)
+
+        token = current_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            current_profile.reset(token)
+            profile.stop()
+            profile_store.add(profile)
@@ -0,0 +1,363 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, delete
+from starlette.concurrency import run_in_threadpool
+
+from .auth import get_current_user
+from .broker import STATE_BACKEND
+from .database import Game, engine, get_game
+from .models import User, RateLimitBucket
+
+# Room messages: sustained rate per user, with a short burst allowance
+MAX_MESSAGES_PER_MINUTE = 60
+MESSAGE_BURST = 20
+
+# Login attempts per client address and username
+MAX_LOGINS_PER_MINUTE = 5
+LOGIN_BURST = 10
+
+# Stream polls per user; long-polls re-poll right after every message they return
+MAX_STREAM_POLLS_PER_MINUTE = 120
+STREAM_BURST = 60
+
+# Keys tracked per limiter before the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = 10000
+
+# With shared state: how often synced limiters exchange spent tokens with the database,
+# and how often idle database buckets are pruned
+RATE_LIMIT_SYNC_SECONDS = 1.0
+RATE_LIMIT_PRUNE_SECONDS = 60
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+
+    def headers(self) -> dict:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class RateLimiter:
+    """Token bucket per key: 'burst' requests at once, refilled at 'per_minute'.
+
+    Each check is O(1). Buckets live in an LRU; a bucket idle long enough to
+    have refilled completely carries no information, so idle buckets are
+    dropped from the old end of the LRU as new checks come in, and the LRU
+    never holds more than max_keys buckets. The route dependencies are sync,
+    so checks run on threadpool workers at the same time and hold a lock.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_seconds = burst / self.rate
+        self.rejections = 0
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.lock = threading.Lock()
+
+    def hit(self, key: str, now: float = None) -> RateLimitResult:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            else:
+                self.rejections += 1
+            tokens = bucket[0]
+
+            self._expire(now)
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.burst,
+            remaining=int(tokens),
+            retry_after=0.0 if allowed else (1 - tokens) / self.rate
+        )
+
+    def _expire(self, now: float):
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - updated_at < self.idle_seconds:
+                break
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self.lock:
+            self._buckets.clear()
+            self.rejections = 0
+
+
+def prune_buckets(engine, name: str, idle_seconds: float, now: float = None):
+    """Drop a limiter's database buckets idle long enough to have refilled completely"""
+    now = time.time() if now is None else now
+    with Session(engine) as session:
+        session.exec(
+            delete(RateLimitBucket)
+            .where(RateLimitBucket.limiter == name)
+            .where(RateLimitBucket.updated < now - idle_seconds)
+        )
+        session.commit()
+
+
+class SharedRateLimiter:
+    """The same token buckets, kept in the database so every worker process draws from them.
+
+    Each check is a single upsert that refills the bucket, takes a token if
+    there is one and returns the outcome, so concurrent workers can't both
+    spend the last token. Buckets are keyed by limiter name; idle ones are
+    pruned by the background sync task, off the request path. Buckets of
+    every game live in the default game's database. It is
+    blocking: call it from the threadpool (the route dependencies below
+    are sync, so FastAPI does).
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, engine=engine):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.engine = engine
+        self.idle_seconds = burst / self.rate
+        self.rejections = 0
+
+    def hit(self, key: str, now: float = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        refilled = func.min(self.burst, RateLimitBucket.tokens + (now - RateLimitBucket.updated) * self.rate)
+        statement = (
+            sqlite_insert(RateLimitBucket)
+            .values(limiter=self.name, key=key, tokens=self.burst - 1, updated=now, allowed=True)
+            .on_conflict_do_update(
+                index_elements=[RateLimitBucket.limiter, RateLimitBucket.key],
+                set_={
+                    # SET expressions all see the row as it was before the update
+                    "tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+                    "updated": now,
+                    "allowed": refilled >= 1,
+                }
+            )
+            .returning(RateLimitBucket.tokens, RateLimitBucket.allowed)
+        )
+        with Session(self.engine) as session:
+            tokens, allowed = session.exec(statement).one()
+            session.commit()
+
+        if not allowed:
+            self.rejections += 1
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.burst,
+            remaining=int(tokens),
+            retry_after=0.0 if allowed else (1 - tokens) / self.rate
+        )
+
+    def prune(self, now: float = None):
+        prune_buckets(self.engine, self.name, self.idle_seconds, now)
+
+    def __len__(self):
+        with Session(self.engine) as session:
+            return session.exec(
+                select(func.count()).select_from(RateLimitBucket).where(RateLimitBucket.limiter == self.name)
+            ).one()
+
+    def clear(self):
+        with Session(self.engine) as session:
+            session.exec(delete(RateLimitBucket).where(RateLimitBucket.limiter == self.name))
+            session.commit()
+        self.rejections = 0
+
+
+class SyncedRateLimiter(RateLimiter):
+    """In-memory buckets charged locally, reconciled with the database buckets in the background.
+
+    For high-rate checks like stream polls, where a write transaction per
+    check would compete with message inserts for SQLite's write lock.
+    Every RATE_LIMIT_SYNC_SECONDS, sync() adds the tokens spent here to the
+    shared buckets in one transaction, then reads the buckets any worker
+    changed since and lowers the local ones to what is left there. All
+    workers together can overshoot a key's quota by at most one sync
+    interval of requests per worker.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, engine=engine, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        super().__init__(per_minute, burst, max_keys)
+        self.name = name
+        self.engine = engine
+        self._spent: Dict[str, int] = {}
+        self._synced_at = 0.0
+
+    def hit(self, key: str, now: float = None) -> RateLimitResult:
+        result = super().hit(key, now)
+        if result.allowed:
+            with self.lock:
+                self._spent[key] = self._spent.get(key, 0) + 1
+        return result
+
+    def sync(self, now: float = None):
+        """Push the tokens spent here since the last sync and pull what other workers spent (blocking)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            spent, self._spent = self._spent, {}
+
+        refilled = func.min(self.burst, RateLimitBucket.tokens + (now - RateLimitBucket.updated) * self.rate)
+        with Session(self.engine) as session:
+            for key, count in spent.items():
+                session.exec(
+                    sqlite_insert(RateLimitBucket)
+                    .values(limiter=self.name, key=key, tokens=max(0, self.burst - count), updated=now, allowed=True)
+                    .on_conflict_do_update(
+                        index_elements=[RateLimitBucket.limiter, RateLimitBucket.key],
+                        set_={"tokens": func.max(0, refilled - count), "updated": now}
+                    )
+                )
+            if spent:
+                session.commit()
+            # Buckets any worker charged since the last sync, this one included
+            changed = session.exec(
+                select(RateLimitBucket.key, RateLimitBucket.tokens, RateLimitBucket.updated)
+                .where(RateLimitBucket.limiter == self.name)
+                .where(RateLimitBucket.updated >= self._synced_at)
+            ).all()
+        self._synced_at = now
+
+        with self.lock:
+            for key, tokens, updated in changed:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    shared = min(self.burst, tokens + (now - updated) * self.rate)
+                    # Tokens spent here while syncing are pushed next time, but are already gone
+                    bucket[0] = max(0.0, min(bucket[0], shared - self._spent.get(key, 0)))
+
+    def prune(self, now: float = None):
+        prune_buckets(self.engine, self.name, self.idle_seconds, now)
+
+    def clear(self):
+        super().clear()
+        with self.lock:
+            self._spent.clear()
+        with Session(self.engine) as session:
+            session.exec(delete(RateLimitBucket).where(RateLimitBucket.limiter == self.name))
+            session.commit()
+
+
+def create_limiter(name: str, per_minute: float, burst: int, synced: bool = False):
+    """In-memory buckets for one process; database buckets when workers share state.
+
+    synced limiters charge locally and reconcile with the database in the background.
+    """
+    if STATE_BACKEND == "sqlite":
+        if synced:
+            return SyncedRateLimiter(name, per_minute, burst)
+        return SharedRateLimiter(name, per_minute, burst)
+    return RateLimiter(per_minute, burst)
+
+
+message_limiter = create_limiter("messages", MAX_MESSAGES_PER_MINUTE, MESSAGE_BURST)
+login_limiter = create_limiter("logins", MAX_LOGINS_PER_MINUTE, LOGIN_BURST)
+# Long-polls re-poll after every message, so these checks stay off the shared write lock
+stream_limiter = create_limiter("stream", MAX_STREAM_POLLS_PER_MINUTE, STREAM_BURST, synced=True)
+
+
+class RateLimitSync:
+    """Background task syncing and pruning the database-backed limiters of this worker"""
+
+    def __init__(self, limiters, sync_seconds: float = RATE_LIMIT_SYNC_SECONDS, prune_seconds: float = RATE_LIMIT_PRUNE_SECONDS):
+        self.limiters = limiters
+        self.sync_seconds = sync_seconds
+        self.prune_seconds = prune_seconds
+        self._task = None
+
+    def run_once(self, prune: bool):
+        for limiter in self.limiters:
+            if isinstance(limiter, SyncedRateLimiter):
+                limiter.sync()
+            if prune and hasattr(limiter, "prune"):
+                limiter.prune()
+
+    async def _loop(self):
+        ticks = 0
+        prune_every = max(1, int(self.prune_seconds / self.sync_seconds))
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            ticks += 1
+            try:
+                await run_in_threadpool(self.run_once, ticks % prune_every == 0)
+            except Exception as e:
+                print(f"Rate limit sync failed: {e}")
+
+    def start(self):
+        if STATE_BACKEND == "sqlite" and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Hand the last spent tokens to the other workers
+        await run_in_threadpool(self.run_once, False)
+
+
+rate_limit_sync = RateLimitSync([message_limiter, login_limiter, stream_limiter])
+
+
+def enforce(limiter: RateLimiter, key: str, response: Response = None) -> RateLimitResult:
+    """Count a request against a limiter, raising 429 when the key is out of quota"""
+    result = limiter.hit(key)
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers=result.headers()
+        )
+    if response is not None:
+        response.headers.update(result.headers())
+    return result
+
+
+def limit_messages(response: Response, current_user: User = Depends(get_current_user), game: Game = Depends(get_game)):
+    """Route dependency: per-user quota for posting room messages"""
+    enforce(message_limiter, game.scoped(current_user.username), response)
+
+
+def limit_stream_polls(response: Response, current_user: User = Depends(get_current_user), game: Game = Depends(get_game)):
+    """Route dependency: per-user quota for stream polling"""
+    enforce(stream_limiter, game.scoped(current_user.username), response)
+
+
+def limit_logins(request: Request, response: Response, form_data: OAuth2PasswordRequestForm = Depends(), game: Game = Depends(get_game)):
+    """Route dependency: quota for login attempts per client address and username"""
+    client_host = request.client.host if request.client else "unknown"
+    enforce(login_limiter, game.scoped(f"{client_host}:{form_data.username}"), response)
+
+
+def reset_rate_limits():
+    for limiter in (message_limiter, login_limiter, stream_limiter):
+        limiter.clear()
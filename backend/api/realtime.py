@@ -0,0 +1,248 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from .broker import broker
+
+
+class RoomSubscription:
+    """A parked stream request waiting for new messages in one room"""
+
+    def __init__(self, notifier: "RoomNotifier", code4: str, event: asyncio.Event):
+        self.notifier = notifier
+        self.code4 = code4
+        self.event = event
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until the room is notified; returns False on timeout"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.notifier._release(self.code4, self.event)
+
+
+class RoomNotifier:
+    """Per-room notification hub for long-polling stream requests.
+
+    Each room has one pending asyncio.Event shared by all of its waiters.
+    notify() sets and discards that event, so it wakes exactly the requests
+    parked on that room and later subscribers get a fresh event.
+    """
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def subscribe(self, code4: str) -> RoomSubscription:
+        """Register interest in a room; subscribe before querying to avoid missing a wakeup"""
+        event = self._events.get(code4)
+        if event is None:
+            event = self._events[code4] = asyncio.Event()
+        self._waiters[code4] = self._waiters.get(code4, 0) + 1
+        return RoomSubscription(self, code4, event)
+
+    def notify(self, code4: str):
+        """Wake every request currently waiting on the room"""
+        event = self._events.pop(code4, None)
+        if event is not None:
+            event.set()
+
+    def waiter_count(self, code4: str) -> int:
+        """Number of stream requests parked on the room"""
+        return self._waiters.get(code4, 0)
+
+    def waiters(self) -> Dict[str, int]:
+        """Parked stream requests per room"""
+        return dict(self._waiters)
+
+    def _release(self, code4: str, event: asyncio.Event):
+        remaining = self._waiters.get(code4, 0) - 1
+        if remaining > 0:
+            self._waiters[code4] = remaining
+            return
+        self._waiters.pop(code4, None)
+        if self._events.get(code4) is event:
+            del self._events[code4]
+
+
+room_notifier = RoomNotifier()
+
+
+# Per-connection backlog before a socket is considered too slow and dropped
+SOCKET_SEND_QUEUE_SIZE = 64
+
+
+class RoomConnection:
+    """One WebSocket in a room, fed through its own bounded send queue"""
+
+    def __init__(self, code4: str, websocket: WebSocket, queue_size: int):
+        self.code4 = code4
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def offer(self, payload: str) -> bool:
+        """Queue a frame without waiting; returns False if the client has fallen behind"""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _send_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket went away; the receive loop will notice and clean up
+            pass
+
+    async def close(self, code: int = 1000):
+        if self.sender is not None:
+            self.sender.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class RoomSocketHub:
+    """Fan-out of persisted room messages to every WebSocket in the room.
+
+    Broadcasting never awaits a client: each frame is serialized once and
+    offered to every connection's bounded queue. A connection whose queue
+    is full is closed so it can reconnect and catch up over HTTP, instead
+    of stalling delivery to everyone else.
+    """
+
+    def __init__(self, queue_size: int = SOCKET_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._rooms: Dict[str, Set[RoomConnection]] = {}
+
+    def connect(self, code4: str, websocket: WebSocket) -> RoomConnection:
+        connection = RoomConnection(code4, websocket, self.queue_size)
+        self._rooms.setdefault(code4, set()).add(connection)
+        connection.start()
+        return connection
+
+    async def disconnect(self, connection: RoomConnection, code: int = 1000):
+        connections = self._rooms.get(connection.code4)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._rooms[connection.code4]
+        await connection.close(code)
+
+    def broadcast(self, code4: str, message: dict):
+        """Send a message to every socket in the room"""
+        connections = self._rooms.get(code4)
+        if not connections:
+            return
+        payload = json.dumps(jsonable_encoder(message))
+        for connection in list(connections):
+            if not connection.offer(payload):
+                # 1013: try again later
+                asyncio.create_task(self.disconnect(connection, code=1013))
+
+    def connection_count(self, code4: str) -> int:
+        return len(self._rooms.get(code4, ()))
+
+    def connections(self) -> Dict[str, int]:
+        """Open sockets per room"""
+        return {code4: len(connections) for code4, connections in self._rooms.items()}
+
+
+room_sockets = RoomSocketHub()
+
+
+# Events buffered per open event stream before new ones are dropped
+USER_EVENT_QUEUE_SIZE = 32
+
+
+class UserEventBus:
+    """Per-user push channel feeding the /api/events Server-Sent Events streams"""
+
+    def __init__(self, queue_size: int = USER_EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, username: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues.setdefault(username, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, username: str, queue: asyncio.Queue):
+        queues = self._queues.get(username)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[username]
+
+    def has_subscribers(self, username: str) -> bool:
+        return username in self._queues
+
+    def user_count(self) -> int:
+        return len(self._queues)
+
+    def publish(self, username: str, event: str, data: dict):
+        """Push an event to every open stream of the user; a full stream skips it"""
+        for queue in self._queues.get(username, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+user_events = UserEventBus()
+
+
+# Live delivery goes through the broker, so a message posted to one worker
+# reaches the polls, sockets and event streams held by every worker
+
+async def publish_room_message(code4: str, message: dict):
+    """Wake the room's long-polls and send the message to its sockets"""
+    await broker.publish("room_message", {"code4": code4, "message": message})
+
+
+async def publish_user_event(username: str, event: str, data: dict):
+    """Push an event to the user's open event streams"""
+    await broker.publish("user_event", {"username": username, "event": event, "data": data})
+
+
+def may_have_subscribers(username: str) -> bool:
+    """Whether a user event could reach anyone; with several workers the stream may be elsewhere"""
+    return broker.shared or user_events.has_subscribers(username)
+
+
+def _deliver_room_message(payload: dict):
+    room_notifier.notify(payload["code4"])
+    room_sockets.broadcast(payload["code4"], payload["message"])
+
+
+def _deliver_user_event(payload: dict):
+    user_events.publish(payload["username"], payload["event"], payload["data"])
+
+
+broker.on("room_message", _deliver_room_message)
+broker.on("user_event", _deliver_user_event)
@@ -0,0 +1,400 @@
+from typing import List, Optional
+
+from fastapi import Depends
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, delete, insert, update, func
+from starlette.concurrency import run_in_threadpool
+
+from .archive import archive_room_messages, finished_room_ids
+from .cache import invalidate, messages_resource
+from .database import Game, games, get_game, get_session
+from .profiling import track
+from .models import User, Persona, Room, Message, MessageArchive, RoomPresence, DirectMessage, UnreadCount
+from .schemas import PersonaResponse, RoomResponse, MessageResponse, DirectMessageResponse
+from .writer import get_writer
+
+
+def response_columns(model, schema) -> list:
+    """The model columns a response schema is made of, in the schema's field order"""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+# Hot list endpoints read just these columns as plain rows instead of hydrating ORM objects
+PERSONA_COLUMNS = response_columns(Persona, PersonaResponse)
+ROOM_COLUMNS = response_columns(Room, RoomResponse)
+MESSAGE_COLUMNS = response_columns(Message, MessageResponse)
+DIRECT_MESSAGE_COLUMNS = response_columns(DirectMessage, DirectMessageResponse)
+
+
+class Repository:
+    """Room, Message and DirectMessage queries for the async handlers.
+
+    SQLite calls are synchronous, so every method runs its query on the
+    threadpool: a slow query holds up only its own request instead of the
+    whole event loop. One repository wraps one request's session and is
+    only used by one request at a time.
+
+    List queries behind the hot endpoints return plain dict rows of the
+    response columns, ready to be encoded as they are. The repository also
+    carries the request's game, whose id scopes the cache keys it bumps.
+    """
+
+    def __init__(self, session: Session, game: Optional[Game] = None):
+        self.session = session
+        self.game = game or games.default
+
+    async def run(self, fn, *args):
+        """Run a blocking function of the session on the threadpool"""
+        return await run_in_threadpool(track(fn), *args)
+
+    def rows(self, statement) -> List[dict]:
+        """Execute a column select and return its rows as dicts"""
+        return [row._asdict() for row in self.session.exec(statement)]
+
+    async def release(self):
+        """End the session's transaction and return its connection to the pool.
+
+        Call this before parking a request (long-poll, event stream, socket)
+        so idle waiters don't each pin a database connection.
+        """
+        await self.run(self.session.close)
+
+    # Users and personas
+
+    async def get_user(self, username: str) -> Optional[User]:
+        return await self.run(
+            lambda: self.session.exec(select(User).where(User.username == username)).first()
+        )
+
+    async def list_personas(self) -> List[dict]:
+        return await self.run(lambda: self.rows(select(*PERSONA_COLUMNS).order_by(Persona.id)))
+
+    # Rooms
+
+    async def get_room(self, code4: str) -> Optional[Room]:
+        return await self.run(
+            lambda: self.session.exec(select(Room).where(Room.code4 == code4)).first()
+        )
+
+    async def list_rooms(self) -> List[dict]:
+        return await self.run(
+            lambda: self.rows(select(*ROOM_COLUMNS).order_by(Room.created_at.desc()))
+        )
+
+    async def existing_room_codes(self, codes: List[str]) -> List[str]:
+        """Which of the given room codes are taken, in one query"""
+        return await self.run(
+            lambda: self.session.exec(select(Room.code4).where(Room.code4.in_(codes))).all()
+        )
+
+    async def room_pairs(self) -> List[tuple]:
+        """(playerA, playerB) of every existing room"""
+        return await self.run(lambda: self.session.exec(select(Room.playerA, Room.playerB)).all())
+
+    async def add_room(self, room: Room) -> Room:
+        def add():
+            self.session.add(room)
+            self.session.commit()
+            self.session.refresh(room)
+            return room
+        room = await self.run(add)
+        await invalidate(self.game.scoped("rooms"))
+        return room
+
+    async def add_rooms(self, rows: List[dict]) -> List[Room]:
+        """Create many rooms with one executemany insert and one commit; all or none"""
+        def add():
+            try:
+                rooms = self.session.scalars(insert(Room).returning(Room), rows).all()
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+            return rooms
+        rooms = await self.run(add)
+        await invalidate(self.game.scoped("rooms"))
+        return rooms
+
+    async def delete_room(self, room_id: int):
+        """Delete a room together with all of its messages, archived ones included"""
+        def remove():
+            self.session.exec(delete(Message).where(Message.room_id == room_id))
+            self.session.exec(delete(MessageArchive).where(MessageArchive.room_id == room_id))
+            self.session.exec(delete(RoomPresence).where(RoomPresence.room_id == room_id))
+            self.session.exec(delete(Room).where(Room.id == room_id))
+            self.session.commit()
+        await self.run(remove)
+        await invalidate(self.game.scoped("rooms"), self.game.scoped(messages_resource(room_id)))
+
+    async def room_activity(self) -> List[dict]:
+        """Every room with its message count, last message and participants' last-seen times, in one query.
+
+        Counts come from a GROUP BY over the (room_id, id) index plus the
+        archive segments' counts, the last message is joined by the
+        per-room max(id), and last_seen is a JSON object of the room's
+        RoomPresence rows, so the cost doesn't grow with the number of
+        requests the dashboard would otherwise make.
+        """
+        hot = (
+            select(Message.room_id, func.count().label("count"), func.max(Message.id).label("last_id"))
+            .group_by(Message.room_id)
+            .subquery()
+        )
+        archived = (
+            select(MessageArchive.room_id, func.sum(MessageArchive.count).label("count"), func.max(MessageArchive.last_ts).label("last_ts"))
+            .group_by(MessageArchive.room_id)
+            .subquery()
+        )
+        last = aliased(Message)
+        last_seen = (
+            select(func.json_group_object(RoomPresence.username, RoomPresence.last_seen))
+            .where(RoomPresence.room_id == Room.id)
+            .scalar_subquery()
+        )
+        statement = (
+            select(
+                Room.id, Room.code4, Room.playerA, Room.playerB, Room.created_at,
+                (func.coalesce(hot.c.count, 0) + func.coalesce(archived.c.count, 0)).label("message_count"),
+                last.id.label("last_id"), last.sender, last.content, last.ts,
+                archived.c.last_ts.label("archived_ts"),
+                last_seen.label("last_seen")
+            )
+            .outerjoin(hot, hot.c.room_id == Room.id)
+            .outerjoin(archived, archived.c.room_id == Room.id)
+            .outerjoin(last, last.id == hot.c.last_id)
+            .order_by(Room.created_at.desc())
+        )
+        return await self.run(lambda: self.rows(statement))
+
+    async def record_presence(self, room_id: int, username: str, seen: datetime):
+        """Upsert a participant's last-seen time through the group-commit writer"""
+        def write(session: Session):
+            session.exec(
+                sqlite_insert(RoomPresence)
+                .values(room_id=room_id, username=username, last_seen=seen)
+                .on_conflict_do_update(index_elements=[RoomPresence.room_id, RoomPresence.username], set_={"last_seen": seen})
+            )
+        await get_writer(self.session.get_bind()).submit(write)
+
+    # Room messages
+
+    async def message_page(
+        self,
+        room_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        """A page of a room's message rows by id cursor, always returned oldest first.
+
+        With 'after', the page starts right after that message (catch-up);
+        otherwise it ends right before 'before', or at the newest message
+        (scrollback). Filtering and ordering both use the (room_id, id)
+        index, so a page costs the same at any depth.
+        """
+        def query():
+            statement = select(*MESSAGE_COLUMNS).where(Message.room_id == room_id)
+            if after is not None:
+                statement = statement.where(Message.id > after)
+            if before is not None:
+                statement = statement.where(Message.id < before)
+
+            if after is not None:
+                return self.rows(statement.order_by(Message.id.asc()).limit(limit))
+            messages = self.rows(statement.order_by(Message.id.desc()).limit(limit))
+            return list(reversed(messages))
+        return await self.run(query)
+
+    async def messages_after(self, room_id: int, after: Optional[int], limit: int = 50) -> List[dict]:
+        """Up to 'limit' message rows of a room newer than the message id 'after'"""
+        def query():
+            statement = select(*MESSAGE_COLUMNS).where(Message.room_id == room_id)
+            if after is not None:
+                statement = statement.where(Message.id > after)
+            return self.rows(statement.order_by(Message.id.asc()).limit(limit))
+        return await self.run(query)
+
+    async def add_message(self, room_id: int, sender: str, content: str) -> Message:
+        """Insert a message through the group-commit writer"""
+        def add(session: Session):
+            message = Message(room_id=room_id, sender=sender, content=content)
+            session.add(message)
+            return message
+        message = await get_writer(self.session.get_bind()).submit(add)
+        await invalidate(self.game.scoped(messages_resource(room_id)))
+        return message
+
+    # Archive
+
+    async def archive_room(self, room_id: int) -> dict:
+        """Move a room's messages out of the hot table into compressed segments"""
+        totals = await self.run(archive_room_messages, self.session, room_id)
+        if totals["messages"]:
+            await invalidate(self.game.scoped(messages_resource(room_id)))
+        return totals
+
+    async def finished_rooms(self, idle_minutes: float) -> List[int]:
+        return await self.run(finished_room_ids, self.session, idle_minutes)
+
+    # Direct messages
+
+    async def add_direct_message(self, admin_username: str, user_username: str, content: str) -> DirectMessage:
+        """Insert a direct message through the group-commit writer"""
+        def add(session: Session):
+            direct_message = DirectMessage(
+                admin_username=admin_username,
+                user_username=user_username,
+                content=content
+            )
+            session.add(direct_message)
+            adjust_unread_count(session, user_username, 1)
+            return direct_message
+        return await get_writer(self.session.get_bind()).submit(add)
+
+    async def existing_usernames(self, usernames: List[str]) -> List[str]:
+        """Which of the given usernames exist, in one query"""
+        return await self.run(
+            lambda: self.session.exec(select(User.username).where(User.username.in_(usernames))).all()
+        )
+
+    async def persona_players(self, group: str) -> List[str]:
+        """Usernames of the players with a persona in the group ("outie" or "innie"), in persona order"""
+        return await self.run(lambda: self.session.exec(
+            select(Persona.username)
+            .join(User, User.username == Persona.username)
+            .where(Persona.group == group)
+            .order_by(Persona.id)
+        ).all())
+
+    async def usernames_for_target(self, target: str) -> List[str]:
+        """Resolve a broadcast target: "outies"/"innies" by persona group, "players" by role"""
+        def query():
+            if target == "players":
+                statement = select(User.username).where(User.role == "player")
+            else:
+                group = {"outies": "outie", "innies": "innie"}[target]
+                statement = (
+                    select(Persona.username)
+                    .join(User, User.username == Persona.username)
+                    .where(Persona.group == group)
+                )
+            return self.session.exec(statement.order_by(User.username)).all()
+        return await self.run(query)
+
+    async def add_direct_messages(self, admin_username: str, user_usernames: List[str], content: str) -> List[DirectMessage]:
+        """Send one message to many users: a single executemany insert and counter update, one commit"""
+        def add(session: Session):
+            ts = datetime.utcnow()
+            rows = [
+                {"admin_username": admin_username, "user_username": username, "content": content, "is_read": False, "ts": ts}
+                for username in user_usernames
+            ]
+            messages = session.scalars(insert(DirectMessage).returning(DirectMessage), rows).all()
+            adjust_unread_counts(session, user_usernames, 1)
+            return messages
+        return await get_writer(self.session.get_bind()).submit(add)
+
+    async def sent_direct_messages(self, admin_username: str) -> List[dict]:
+        return await self.run(
+            lambda: self.rows(
+                select(*DIRECT_MESSAGE_COLUMNS)
+                .where(DirectMessage.admin_username == admin_username)
+                .order_by(DirectMessage.ts.desc())
+            )
+        )
+
+    async def read_direct_messages(
+        self,
+        user_username: str,
+        before: Optional[datetime] = None,
+        before_id: Optional[int] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        """A page of a user's inbox rows, newest first; the rows on the page are marked read.
+
+        Pages end right before the (before, before_id) cursor, the ts and id
+        of the previous page's last row: a broadcast gives many rows the same
+        ts, so ts alone would skip or repeat them. The (user_username, ts, id)
+        index serves both the filter and the order, so a page costs the same
+        at any depth. Only the page's unread rows are rewritten, and the
+        unread counter drops by as many in the same transaction.
+        """
+        def read():
+            statement = select(*DIRECT_MESSAGE_COLUMNS).where(DirectMessage.user_username == user_username)
+            if before is not None and before_id is not None:
+                statement = statement.where(tuple_(DirectMessage.ts, DirectMessage.id) < tuple_(before, before_id))
+            elif before is not None:
+                statement = statement.where(DirectMessage.ts < before)
+            messages = self.rows(statement.order_by(DirectMessage.ts.desc(), DirectMessage.id.desc()).limit(limit))
+
+            unread_ids = [message["id"] for message in messages if not message["is_read"]]
+            if unread_ids:
+                marked = self.session.exec(
+                    update(DirectMessage)
+                    .where(DirectMessage.id.in_(unread_ids))
+                    .where(DirectMessage.is_read == False)
+                    .values(is_read=True)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                # Another tab may have marked some of them first
+                if marked:
+                    adjust_unread_count(self.session, user_username, -marked)
+                self.session.commit()
+
+            for message in messages:
+                message["is_read"] = True
+            return messages
+        return await self.run(read)
+
+    async def count_unread(self, user_username: str) -> int:
+        """A user's unread direct messages, from the materialized counter"""
+        def count():
+            counter = self.session.get(UnreadCount, user_username)
+            if counter is not None:
+                return counter.count
+            return count_unread_rows(self.session, user_username)
+        return await self.run(count)
+
+
+def count_unread_rows(session: Session, user_username: str) -> int:
+    """Count unread direct messages from the table itself"""
+    return session.exec(
+        select(func.count())
+        .select_from(DirectMessage)
+        .where(DirectMessage.user_username == user_username)
+        .where(DirectMessage.is_read == False)
+    ).one()
+
+
+def adjust_unread_count(session: Session, user_username: str, delta: int):
+    """Add delta to a user's unread counter, creating it from the table if it doesn't exist yet"""
+    adjust_unread_counts(session, [user_username], delta)
+
+
+def adjust_unread_counts(session: Session, user_usernames: List[str], delta: int):
+    """adjust_unread_count for many users as one executemany upsert"""
+    session.flush()
+    statement = sqlite_insert(UnreadCount).values(
+        username=bindparam("counter_username"),
+        count=select(func.count())
+        .select_from(DirectMessage)
+        .where(DirectMessage.user_username == bindparam("counter_username"))
+        .where(DirectMessage.is_read == False)
+        .scalar_subquery()
+    )
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[UnreadCount.username],
+            set_={"count": UnreadCount.count + delta}
+        ),
+        [{"counter_username": username} for username in user_usernames]
+    )
+
+
+def get_repository(session: Session = Depends(get_session), game: Game = Depends(get_game)) -> Repository:
+    """Get a repository over the request's database session"""
+    return Repository(session, game)
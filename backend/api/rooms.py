@@ -0,0 +1,238 @@
+import asyncio
+import math
+import random
+import string
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from sqlmodel import Session, select
+
+from .auth import get_current_user
+from .broker import broker
+from .database import DEFAULT_GAME, Game, scoped_key
+from .models import User, Room
+from .repository import Repository, get_repository
+
+# A participant's last-seen time in a room is written to the database at most this often
+LAST_SEEN_WRITE_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class RoomEntry:
+    """What the message paths need to know about a room, without loading it"""
+    id: int
+    code4: str
+    playerA: str
+    playerB: str
+    created_at: datetime
+    game: str = DEFAULT_GAME
+
+    @property
+    def channel(self) -> str:
+        """The room's key in the directory and the realtime hubs, which is unique across games"""
+        return scoped_key(self.game, self.code4)
+
+    def allows(self, user: User) -> bool:
+        """Admins may enter any room, players only their own"""
+        return user.role == "admin" or user.username in (self.playerA, self.playerB)
+
+
+class RoomDirectory:
+    """In-memory room map, loaded at startup and kept current by create_room/delete_room.
+
+    Rooms are keyed by channel (code4, prefixed with the game id outside
+    the default game), since every game has its own code space.
+
+    A code that isn't in the map is looked up in the database once and then
+    remembered, so rooms created before the map was loaded still resolve.
+    Creations and deletions are announced through the broker so every
+    worker's map follows them.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomEntry] = {}
+
+    def load(self, session: Session, game_id: str = DEFAULT_GAME):
+        for room in session.exec(select(Room)).all():
+            self.add(room, game_id)
+
+    def get(self, code4: str, game_id: str = DEFAULT_GAME) -> Optional[RoomEntry]:
+        return self._rooms.get(scoped_key(game_id, code4))
+
+    def add(self, room: Room, game_id: str = DEFAULT_GAME) -> RoomEntry:
+        entry = RoomEntry(
+            id=room.id,
+            code4=room.code4,
+            playerA=room.playerA,
+            playerB=room.playerB,
+            created_at=room.created_at,
+            game=game_id
+        )
+        self._rooms[entry.channel] = entry
+        return entry
+
+    def remove(self, code4: str, game_id: str = DEFAULT_GAME):
+        self._rooms.pop(scoped_key(game_id, code4), None)
+
+    async def announce_add(self, room: Room, game_id: str = DEFAULT_GAME):
+        """Add a newly created room here and in every other worker"""
+        await broker.publish("room_added", {
+            "id": room.id,
+            "code4": room.code4,
+            "playerA": room.playerA,
+            "playerB": room.playerB,
+            "created_at": room.created_at,
+            "game": game_id
+        })
+
+    async def announce_remove(self, code4: str, game_id: str = DEFAULT_GAME):
+        await broker.publish("room_removed", {"code4": code4, "game": game_id})
+
+    def clear(self):
+        self._rooms.clear()
+
+    async def resolve(self, code4: str, repo: Repository) -> Optional[RoomEntry]:
+        entry = self.get(code4, repo.game.id)
+        if entry is None:
+            room = await repo.get_room(code4)
+            if room is not None:
+                entry = self.add(room, repo.game.id)
+        return entry
+
+
+room_directory = RoomDirectory()
+
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_SPACE = len(CODE_ALPHABET) ** 4
+
+
+def room_code(index: int) -> str:
+    code = ""
+    for _ in range(4):
+        index, digit = divmod(index, len(CODE_ALPHABET))
+        code = CODE_ALPHABET[digit] + code
+    return code
+
+
+class RoomCodePool:
+    """Unused room codes, handed out in a shuffled order.
+
+    Candidates walk a random permutation of the whole code space
+    (i -> a*i + b mod 36^4, with a coprime to 36^4), so no code is tried
+    twice and no list of codes is stored. They are checked against the
+    rooms table refill_size at a time with a single IN query, and the free
+    ones are kept ready, so creating a room costs no lookups however full
+    the code space gets. Codes are checked, not reserved: another worker
+    can still take one first, which the unique index on code4 catches.
+    """
+
+    def __init__(self, refill_size: int = 256):
+        self.refill_size = refill_size
+        self._multiplier = random.randrange(1, CODE_SPACE)
+        while math.gcd(self._multiplier, CODE_SPACE) != 1:
+            self._multiplier = random.randrange(1, CODE_SPACE)
+        self._offset = random.randrange(CODE_SPACE)
+        self._position = 0
+        self._ready: List[str] = []
+        self._lock = asyncio.Lock()
+
+    def _candidates(self, count: int) -> List[str]:
+        end = min(self._position + count, CODE_SPACE)
+        codes = [room_code((self._multiplier * i + self._offset) % CODE_SPACE) for i in range(self._position, end)]
+        self._position = end
+        return codes
+
+    async def take(self, count: int, repo: Repository) -> List[str]:
+        async with self._lock:
+            while len(self._ready) < count:
+                candidates = self._candidates(max(self.refill_size, count - len(self._ready)))
+                if not candidates:
+                    raise HTTPException(status_code=503, detail="No room codes left")
+                taken = set(await repo.existing_room_codes(candidates))
+                self._ready.extend(code for code in candidates if code not in taken)
+            codes, self._ready = self._ready[:count], self._ready[count:]
+            return codes
+
+
+room_code_pools: Dict[str, RoomCodePool] = {}
+
+
+def room_codes(game: Game) -> RoomCodePool:
+    """The code pool of a game; each game has its own rooms table, so its own code space"""
+    pool = room_code_pools.get(game.id)
+    if pool is None:
+        pool = room_code_pools[game.id] = RoomCodePool()
+    return pool
+
+
+class PresenceTracker:
+    """When each participant last opened, polled or posted in each room.
+
+    Every room request from one of its two players updates this worker's
+    map. The time is written to RoomPresence at most every
+    LAST_SEEN_WRITE_SECONDS per room and player, so a client long-polling
+    every few seconds doesn't turn into a write per poll. The dashboard
+    reads the stored times and overlays this worker's fresher ones.
+    Entries are keyed by (room channel, username), as room ids repeat
+    across games.
+    """
+
+    def __init__(self, write_seconds: float = LAST_SEEN_WRITE_SECONDS):
+        self.write_seconds = write_seconds
+        self._seen: Dict[Tuple[str, str], datetime] = {}
+        self._written: Dict[Tuple[str, str], float] = {}
+
+    async def seen(self, room: RoomEntry, username: str, repo: Repository):
+        if username not in (room.playerA, room.playerB):
+            return
+        key = (room.channel, username)
+        now = datetime.utcnow()
+        self._seen[key] = now
+        written = self._written.get(key)
+        if written is None or time.monotonic() - written >= self.write_seconds:
+            self._written[key] = time.monotonic()
+            await repo.record_presence(room.id, username, now)
+
+    def last_seen(self) -> Dict[Tuple[str, str], datetime]:
+        return dict(self._seen)
+
+    def clear(self):
+        self._seen.clear()
+        self._written.clear()
+
+
+room_presence = PresenceTracker()
+
+
+def _room_added(payload: dict):
+    created_at = payload["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    fields = {name: value for name, value in payload.items() if name != "game"}
+    room_directory.add(Room(**{**fields, "created_at": created_at}), payload.get("game", DEFAULT_GAME))
+
+
+broker.on("room_added", _room_added)
+broker.on("room_removed", lambda payload: room_directory.remove(payload["code4"], payload.get("game", DEFAULT_GAME)))
+
+
+async def get_room_entry(
+    code4: str,
+    current_user: User = Depends(get_current_user),
+    repo: Repository = Depends(get_repository)
+) -> RoomEntry:
+    """Resolve the room in the path and check that the current user may access it"""
+    entry = await room_directory.resolve(code4, repo)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    # Check if user is allowed in this room
+    if not entry.allows(current_user):
+        raise HTTPException(status_code=403, detail="Not authorized to access this room")
+
+    await room_presence.seen(entry, current_user.username, repo)
+    return entry
@@ -1,40 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session, select, delete
-from typing import List, Dict, Optional
-import random
-import string
-import time
-from datetime import datetime, timedelta
-from collections import defaultdict
-
-from .database import get_session
-from .models import User, Persona, Room, Message, DirectMessage
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import asyncio
+import json
+import os
+from datetime import datetime
+
+from .archive import ARCHIVE_IDLE_MINUTES, EXPORT_FORMATS, export_transcript
+from .cache import response_cache, cached_response, messages_resource
+from .metrics import refresh_tracked_keys, registry, require_metrics_access
+from .profiling import profile_store
+from .database import DEFAULT_GAME, Game, games, get_game, get_session
+from .repository import Repository, get_repository
+from .models import User, Room, Message, DirectMessage
 from .schemas import (
-    Token, UserResponse, RoomCreate, RoomResponse,
+    Token, UserResponse, RoomCreate, RoomResponse, RoomActivity, RoomBulkCreate, RoomBulkResponse,
     MessageCreate, MessageResponse, CluesResponse,
     MurderCluesResponse, PersonaResponse,
-    DirectMessageCreate, DirectMessageResponse
+    DirectMessageCreate, DirectMessageResponse, DirectMessageBroadcast,
+    ArchiveResult, GameCreate, GameResponse
 )
 from .auth import (
-    authenticate_user, create_access_token,
-    get_current_user, get_admin_user
+    authenticate_user_async, create_access_token,
+    get_current_user, get_admin_user, get_user_from_token, get_stream_user
 )
-from .seed_data import SEED_DATA
+from .seed_data import SEED_DATA, seed_database
+from .ratelimit import enforce, message_limiter, limit_logins, limit_messages, limit_stream_polls
+from .pairing import round_robin
+from .rooms import RoomEntry, room_directory, room_codes, room_presence, get_room_entry
+from .realtime import (
+    room_notifier, room_sockets, user_events, format_sse,
+    publish_room_message, publish_user_event, may_have_subscribers
+)
+
+# Game routes, mounted at /api for the default game and at /api/games/{game_id} for the others
+router = APIRouter()
+# Routes of the server as a whole
+server_router = APIRouter(prefix="/api")
+
+# Long-polling: how long a stream request may park waiting for new messages
+LONG_POLL_TIMEOUT_SECONDS = float(os.environ.get("LONG_POLL_TIMEOUT_SECONDS", "25"))
+
+# Message history page sizes
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-router = APIRouter(prefix="/api")
+# Server-Sent Events: idle streams get a comment line this often to stay open through proxies
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
 
-# Store for long-polling requests
-message_events = defaultdict(list)
-waiting_clients = defaultdict(list)
+# Groups an admin can broadcast a direct message to
+BROADCAST_TARGETS = ("outies", "innies", "players")
 
-# Rate limiting for messages
-message_rate_limit = {}
-MAX_MESSAGES_PER_MINUTE = 60
+# Pairing generators for bulk room creation
+PAIRING_GENERATORS = ("round_robin",)
+# Fresh codes to try when another worker took one of ours between the check and the insert
+ROOM_CODE_ATTEMPTS = 3
 
-@router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    user = authenticate_user(session, form_data.username, form_data.password)
+@router.post("/login", response_model=Token, dependencies=[Depends(limit_logins)])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session), game: Game = Depends(get_game)):
+    user = await authenticate_user_async(session, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,7 +70,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Sessi
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(data={"sub": user.username})
+    # The game claim keeps the token from working in any other game
+    access_token = create_access_token(data={"sub": user.username, "game": game.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
@@ -50,270 +79,510 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return {"username": current_user.username, "role": current_user.role}
 
 @router.get("/personas", response_model=List[PersonaResponse])
-async def get_personas(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    personas = session.exec(select(Persona)).all()
-    return personas
+async def get_personas(request: Request, current_user: User = Depends(get_current_user), repo: Repository = Depends(get_repository)):
+    entry = await response_cache.fetch(repo.game.scoped("personas"), None, repo.list_personas)
+    return cached_response(entry, request)
 
 @router.get("/clues", response_model=CluesResponse)
-async def get_clues(current_user: User = Depends(get_current_user)):
-    if current_user.username in SEED_DATA["clues_regular"]:
-        return {"clues": SEED_DATA["clues_regular"][current_user.username]}
-    return {"clues": []}
+async def get_clues(request: Request, current_user: User = Depends(get_current_user), game: Game = Depends(get_game)):
+    # Clues come from the game's seed set and never change while the server runs
+    clues = game_clues(game)["clues_regular"]
+    async def load():
+        if current_user.username in clues:
+            return {"clues": clues[current_user.username]}
+        return {"clues": []}
+    entry = await response_cache.fetch(game.scoped("clues"), current_user.username, load)
+    return cached_response(entry, request)
 
 @router.get("/clues/murder", response_model=MurderCluesResponse)
-async def get_murder_clues(current_user: User = Depends(get_admin_user)):
-    return {
-        "to_outies": SEED_DATA["clues_murder"]["to_outies"],
-        "to_innies": SEED_DATA["clues_murder"]["to_innies"]
-    }
+async def get_murder_clues(request: Request, current_user: User = Depends(get_admin_user), game: Game = Depends(get_game)):
+    clues = game_clues(game)["clues_murder"]
+    async def load():
+        return {
+            "to_outies": clues["to_outies"],
+            "to_innies": clues["to_innies"]
+        }
+    entry = await response_cache.fetch(game.scoped("clues_murder"), None, load)
+    return cached_response(entry, request)
+
+def game_clues(game: Game) -> dict:
+    """The clues of a game's seed set; the default game's are SEED_DATA's"""
+    if game.id == DEFAULT_GAME:
+        return SEED_DATA
+    if not game.clues:
+        # Never fall back to SEED_DATA here, that would hand the default game's puzzle to this one
+        raise HTTPException(status_code=500, detail="The game's clues can't be read")
+    return game.clues
 
 @router.get("/rooms", response_model=List[RoomResponse])
-async def get_all_rooms(current_user: User = Depends(get_admin_user), session: Session = Depends(get_session)):
+async def get_all_rooms(request: Request, current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
     """Get all rooms (admin only)"""
-    rooms = session.exec(select(Room).order_by(Room.created_at.desc())).all()
-    return rooms
+    entry = await response_cache.fetch(repo.game.scoped("rooms"), None, repo.list_rooms)
+    return cached_response(entry, request)
 
 @router.post("/rooms", response_model=RoomResponse)
-async def create_room(room_data: RoomCreate, current_user: User = Depends(get_admin_user), session: Session = Depends(get_session)):
-    # Generate a random 4-character code
-    code4 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-
-    # Check if code already exists
-    while session.exec(select(Room).where(Room.code4 == code4)).first():
-        code4 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-
-    # Create the room
-    room = Room(
-        code4=code4,
-        playerA=room_data.playerA,
-        playerB=room_data.playerB
-    )
-    session.add(room)
-    session.commit()
-    session.refresh(room)
-
-    return room
+async def create_room(room_data: RoomCreate, current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
+    rooms = await create_rooms(repo, [(room_data.playerA, room_data.playerB)])
+    return rooms[0]
+
+@router.post("/rooms/bulk", response_model=RoomBulkResponse)
+async def create_rooms_bulk(bulk: RoomBulkCreate, current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
+    """Start a round: create a room per pairing, given or generated, in one transaction (admin only)"""
+    if (bulk.pairings is None) == (bulk.generate is None):
+        raise HTTPException(status_code=400, detail="Give either pairings or generate")
+
+    unpaired = []
+    if bulk.generate is not None:
+        if bulk.generate not in PAIRING_GENERATORS:
+            raise HTTPException(status_code=400, detail=f"Unknown generator, expected one of: {', '.join(PAIRING_GENERATORS)}")
+        outies = await repo.persona_players("outie")
+        innies = await repo.persona_players("innie")
+        pairs, unpaired = round_robin(outies, innies, await repo.room_pairs(), bulk.round)
+    else:
+        pairs = [(pairing.playerA, pairing.playerB) for pairing in bulk.pairings]
+        players = [player for pair in pairs for player in pair]
+        if any(playerA == playerB for playerA, playerB in pairs):
+            raise HTTPException(status_code=400, detail="A room needs two different players")
+        repeated = sorted({player for player in players if players.count(player) > 1})
+        if repeated:
+            raise HTTPException(status_code=400, detail=f"Players in more than one pairing: {', '.join(repeated)}")
+        missing = sorted(set(players) - set(await repo.existing_usernames(players)))
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Users not found: {', '.join(missing)}")
+
+    if not pairs:
+        raise HTTPException(status_code=400, detail="No pairings to create")
+    return {"rooms": await create_rooms(repo, pairs), "unpaired": unpaired}
+
+async def create_rooms(repo: Repository, pairs: List[tuple]) -> List[Room]:
+    """Create rooms with codes from the pool and announce them to every worker"""
+    for attempt in range(ROOM_CODE_ATTEMPTS):
+        codes = await room_codes(repo.game).take(len(pairs), repo)
+        try:
+            rooms = await repo.add_rooms([
+                {"code4": code4, "playerA": playerA, "playerB": playerB, "created_at": datetime.utcnow()}
+                for code4, (playerA, playerB) in zip(codes, pairs)
+            ])
+            break
+        except IntegrityError:
+            if attempt == ROOM_CODE_ATTEMPTS - 1:
+                raise
+    for room in rooms:
+        await room_directory.announce_add(room, repo.game.id)
+    return rooms
 
 @router.delete("/rooms/{code4}")
-async def delete_room(code4: str, current_user: User = Depends(get_admin_user), session: Session = Depends(get_session)):
+async def delete_room(code4: str, current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
     """Delete a room (admin only)"""
-    room = session.exec(select(Room).where(Room.code4 == code4)).first()
+    room = await room_directory.resolve(code4, repo)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    # Delete all messages in the room
-    session.exec(delete(Message).where(Message.room_id == room.id))
-
-    # Delete the room
-    session.delete(room)
-    session.commit()
+    # Delete the room and all of its messages
+    await repo.delete_room(room.id)
+    await room_directory.announce_remove(code4, repo.game.id)
 
     return {"status": "success", "message": f"Room {code4} deleted successfully"}
 
-@router.get("/rooms/{code4}", response_model=RoomResponse)
-async def get_room(code4: str, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    room = session.exec(select(Room).where(Room.code4 == code4)).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    # Check if user is allowed in this room
-    if current_user.role != "admin" and current_user.username not in [room.playerA, room.playerB]:
-        raise HTTPException(status_code=403, detail="Not authorized to access this room")
+@router.get("/dashboard", response_model=List[RoomActivity])
+async def get_dashboard(current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
+    """Every room's activity in one request: message count, last message and last-seen times (admin only)"""
+    seen_here = room_presence.last_seen()
+    rooms = []
+    for row in await repo.room_activity():
+        stored = json.loads(row["last_seen"]) if row["last_seen"] else {}
+        last_seen = {}
+        for player in (row["playerA"], row["playerB"]):
+            times = [datetime.fromisoformat(stored[player])] if player in stored else []
+            key = (repo.game.scoped(row["code4"]), player)
+            if key in seen_here:
+                # This worker may have seen them since the last write
+                times.append(seen_here[key])
+            last_seen[player] = max(times) if times else None
+        last_message = None
+        if row["last_id"] is not None:
+            last_message = {"id": row["last_id"], "sender": row["sender"], "content": row["content"], "ts": row["ts"]}
+        rooms.append({
+            "code4": row["code4"],
+            "playerA": row["playerA"],
+            "playerB": row["playerB"],
+            "created_at": row["created_at"],
+            "message_count": row["message_count"],
+            "last_message": last_message,
+            "last_activity": row["ts"] or row["archived_ts"],
+            "last_seen": last_seen,
+        })
+    return rows_response(rooms)
 
+@router.get("/rooms/{code4}", response_model=RoomResponse)
+async def get_room(room: RoomEntry = Depends(get_room_entry)):
     return room
 
 @router.get("/rooms/{code4}/messages", response_model=List[MessageResponse])
-async def get_messages(code4: str, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    room = session.exec(select(Room).where(Room.code4 == code4)).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    # Check if user is allowed in this room
-    if current_user.role != "admin" and current_user.username not in [room.playerA, room.playerB]:
-        raise HTTPException(status_code=403, detail="Not authorized to access this room")
-
-    # Get the last 50 messages
-    messages = session.exec(
-        select(Message)
-        .where(Message.room_id == room.id)
-        .order_by(Message.ts.desc())
-        .limit(50)
-    ).all()
-
-    return list(reversed(messages))
+async def get_messages(
+    code4: str,
+    request: Request,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    room: RoomEntry = Depends(get_room_entry),
+    repo: Repository = Depends(get_repository)
+):
+    """Room history paged by message id: ?before=<id> scrolls back, ?after=<id> catches up"""
+    entry = await response_cache.fetch(
+        repo.game.scoped(messages_resource(room.id)),
+        (before, after, limit),
+        lambda: repo.message_page(room.id, before=before, after=after, limit=limit)
+    )
+    return cached_response(entry, request)
 
-@router.post("/rooms/{code4}/msg", response_model=MessageResponse)
+@router.post("/rooms/{code4}/msg", response_model=MessageResponse, dependencies=[Depends(limit_messages)])
 async def create_message(
     code4: str,
     message_data: MessageCreate,
+    room: RoomEntry = Depends(get_room_entry),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    repo: Repository = Depends(get_repository)
 ):
-    # Rate limiting
-    now = datetime.utcnow()
-    user_key = f"{current_user.username}:{now.minute}"
-
-    if user_key in message_rate_limit:
-        if message_rate_limit[user_key] >= MAX_MESSAGES_PER_MINUTE:
-            raise HTTPException(status_code=429, detail="Rate limit exceeded")
-        message_rate_limit[user_key] += 1
-    else:
-        # Clean up old entries
-        for key in list(message_rate_limit.keys()):
-            if key.split(':')[1] != str(now.minute):
-                del message_rate_limit[key]
-        message_rate_limit[user_key] = 1
+    return await post_message(repo, room, current_user.username, message_data.content)
 
-    room = session.exec(select(Room).where(Room.code4 == code4)).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    # Check if user is allowed in this room
-    if current_user.role != "admin" and current_user.username not in [room.playerA, room.playerB]:
-        raise HTTPException(status_code=403, detail="Not authorized to access this room")
-
-    # Create the message
-    message = Message(
-        room_id=room.id,
-        sender=current_user.username,
-        content=message_data.content
-    )
-    session.add(message)
-    session.commit()
-    session.refresh(message)
+@router.websocket("/rooms/{code4}/ws")
+async def room_socket(
+    websocket: WebSocket,
+    code4: str,
+    token: Optional[str] = None,
+    repo: Repository = Depends(get_repository)
+):
+    """Live chat for a room: receives {"content": ...} frames and pushes every new message"""
+    # Browsers cannot set headers on WebSockets, so the JWT may also come as ?token=
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
+
+    try:
+        current_user = await run_in_threadpool(get_user_from_token, token, repo.session, repo.game.id)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
 
-    # Notify waiting clients
-    message_events[code4].append(message)
+    room = await room_directory.resolve(code4, repo)
+    await repo.release()
+    if not room or not room.allows(current_user):
+        await websocket.close(code=1008)
+        return
 
-    # Notify waiting clients directly instead of using background tasks
-    notify_clients(code4)
+    await websocket.accept()
+    await room_presence.seen(room, current_user.username, repo)
+    connection = room_sockets.connect(room.channel, websocket)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message_data = MessageCreate.model_validate_json(data)
+                await run_in_threadpool(enforce, message_limiter, repo.game.scoped(current_user.username))
+            except (ValueError, HTTPException) as e:
+                connection.offer(json.dumps({"error": getattr(e, "detail", "Invalid message")}))
+                continue
+            await post_message(repo, room, current_user.username, message_data.content)
+            await room_presence.seen(room, current_user.username, repo)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await room_sockets.disconnect(connection)
+
+async def post_message(repo: Repository, room: RoomEntry, sender: str, content: str) -> Message:
+    """Persist a room message and push it to everyone listening on the room"""
+    message = await repo.add_message(room.id, sender, content)
+
+    # Wake any stream requests parked on this room and fan out to its sockets, in every worker
+    await publish_room_message(room.channel, {
+        "id": message.id,
+        "sender": message.sender,
+        "content": message.content,
+        "ts": message.ts
+    })
 
     return message
 
-@router.get("/rooms/{code4}/stream")
+@router.get("/rooms/{code4}/stream", response_model=List[MessageResponse], dependencies=[Depends(limit_stream_polls)])
 async def stream_messages(
     code4: str,
+    response: Response,
     after: Optional[int] = None,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    timeout: Optional[float] = None,
+    room: RoomEntry = Depends(get_room_entry),
+    repo: Repository = Depends(get_repository)
 ):
-    room = session.exec(select(Room).where(Room.code4 == code4)).first()
+    # Clients may ask for a shorter wait, never a longer one
+    wait_seconds = LONG_POLL_TIMEOUT_SECONDS
+    if timeout is not None:
+        wait_seconds = max(0.0, min(timeout, LONG_POLL_TIMEOUT_SECONDS))
+
+    # Subscribe before querying so a message committed in between still wakes us
+    with room_notifier.subscribe(room.channel) as subscription:
+        # Limit to 50 messages to avoid overwhelming the client
+        new_messages = await repo.messages_after(room.id, after)
+
+        # Nothing new yet: park until create_message notifies this room or we time out
+        if not new_messages:
+            # Waiters holding pooled connections would exhaust the pool and block new requests on the event loop
+            await repo.release()
+            if await subscription.wait(wait_seconds):
+                new_messages = await repo.messages_after(room.id, after)
+
+    return rows_response(new_messages, response)
+
+def rows_response(rows: List[dict], response: Optional[Response] = None) -> ORJSONResponse:
+    """Encode plain rows straight to JSON bytes, skipping response_model validation.
+
+    The rows already have exactly the response_model's fields, which still
+    documents the endpoint. FastAPI drops headers set on the injected
+    response (e.g. rate limits) when a Response is returned, so they are
+    copied over.
+    """
+    encoded = ORJSONResponse(rows)
+    if response is not None:
+        encoded.headers.update(response.headers)
+    return encoded
+
+# Archive and export endpoints
+@router.post("/rooms/{code4}/archive", response_model=ArchiveResult)
+async def archive_room(code4: str, current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
+    """Move a room's messages into compressed archive segments (admin only)"""
+    room = await room_directory.resolve(code4, repo)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
+    return {"rooms": 1, **await repo.archive_room(room.id)}
 
-    # Check if user is allowed in this room
-    if current_user.role != "admin" and current_user.username not in [room.playerA, room.playerB]:
-        raise HTTPException(status_code=403, detail="Not authorized to access this room")
-
-    # Get new messages since 'after'
-    query = select(Message).where(Message.room_id == room.id)
-    if after:
-        query = query.where(Message.id > after)
-    query = query.order_by(Message.ts.asc())
-
-    # Limit to 50 messages to avoid overwhelming the client
-    query = query.limit(50)
-
-    new_messages = session.exec(query).all()
-
-    # If there are new messages, return them immediately
-    if new_messages:
-        return [
-            {
-                "id": msg.id,
-                "sender": msg.sender,
-                "content": msg.content,
-                "ts": msg.ts
-            } for msg in new_messages
-        ]
-
-    # For simplicity, we'll return an empty list immediately instead of long-polling
-    # This avoids blocking issues and the client will poll again after a short delay
-    return []
-
-def notify_clients(code4: str):
-    """Notify waiting clients about new messages"""
-    if code4 not in waiting_clients:
-        return
+@router.post("/archive", response_model=ArchiveResult)
+async def archive_finished_rooms(
+    idle_minutes: float = Query(ARCHIVE_IDLE_MINUTES, ge=0),
+    current_user: User = Depends(get_admin_user),
+    repo: Repository = Depends(get_repository)
+):
+    """Archive every room whose newest message is older than idle_minutes (admin only)"""
+    result = {"rooms": 0, "messages": 0, "segments": 0, "bytes": 0}
+    for room_id in await repo.finished_rooms(idle_minutes):
+        totals = await repo.archive_room(room_id)
+        result["rooms"] += 1 if totals["messages"] else 0
+        for key, value in totals.items():
+            result[key] += value
+    return result
+
+def transcript_response(repo: Repository, format: str, filename: str, code4: Optional[str] = None) -> StreamingResponse:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(EXPORT_FORMATS)}")
+    return StreamingResponse(
+        export_transcript(repo.session.get_bind(), format, code4),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
 
-    for event in waiting_clients[code4]:
-        event["has_new_messages"] = True
-        event["messages"] = [
-            {
-                "id": msg.id,
-                "sender": msg.sender,
-                "content": msg.content,
-                "ts": msg.ts
-            } for msg in message_events[code4]
-        ]
-
-    # Clear the events and waiting clients
-    message_events[code4] = []
-    waiting_clients[code4] = []
+@router.get("/rooms/{code4}/export")
+async def export_room(
+    code4: str,
+    format: str = "ndjson",
+    room: RoomEntry = Depends(get_room_entry),
+    repo: Repository = Depends(get_repository)
+):
+    """The room's full transcript, archived and live messages, streamed as NDJSON or CSV"""
+    return transcript_response(repo, format, f"room-{room.code4}", room.code4)
+
+@router.get("/export")
+async def export_game(format: str = "ndjson", current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
+    """Every room's transcript in creation order, streamed as NDJSON or CSV (admin only)"""
+    return transcript_response(repo, format, "transcript")
 
 # Direct Message endpoints
 @router.post("/direct-messages", response_model=DirectMessageResponse)
 async def create_direct_message(
     message_data: DirectMessageCreate,
     current_user: User = Depends(get_admin_user),
-    session: Session = Depends(get_session)
+    repo: Repository = Depends(get_repository)
 ):
     """Create a direct message from admin to user"""
     # Verify the user exists
-    user = session.exec(select(User).where(User.username == message_data.user_username)).first()
+    user = await repo.get_user(message_data.user_username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Create the direct message
-    direct_message = DirectMessage(
-        admin_username=current_user.username,
-        user_username=message_data.user_username,
-        content=message_data.content
+    direct_message = await repo.add_direct_message(
+        current_user.username,
+        message_data.user_username,
+        message_data.content
     )
 
-    session.add(direct_message)
-    session.commit()
-    session.refresh(direct_message)
+    await publish_direct_messages(repo, [direct_message])
 
     return direct_message
 
+@router.post("/direct-messages/broadcast", response_model=List[DirectMessageResponse])
+async def broadcast_direct_message(
+    broadcast: DirectMessageBroadcast,
+    current_user: User = Depends(get_admin_user),
+    repo: Repository = Depends(get_repository)
+):
+    """Send one direct message to a list of users or to a whole group"""
+    if (broadcast.recipients is None) == (broadcast.target is None):
+        raise HTTPException(status_code=400, detail="Give either recipients or a target")
+
+    if broadcast.target is not None:
+        if broadcast.target not in BROADCAST_TARGETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown target; expected one of {', '.join(BROADCAST_TARGETS)}"
+            )
+        recipients = await repo.usernames_for_target(broadcast.target)
+    else:
+        # Keep the caller's order, drop duplicates, check them all in one query
+        recipients = list(dict.fromkeys(broadcast.recipients))
+        existing = set(await repo.existing_usernames(recipients))
+        unknown = [username for username in recipients if username not in existing]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Users not found: {', '.join(unknown)}")
+
+    if not recipients:
+        return []
+
+    direct_messages = await repo.add_direct_messages(current_user.username, recipients, broadcast.content)
+    await publish_direct_messages(repo, direct_messages)
+
+    return direct_messages
+
+async def publish_direct_messages(repo: Repository, direct_messages: List[DirectMessage]):
+    """Push new messages and unread counts to recipients with open event streams"""
+    for direct_message in direct_messages:
+        recipient = repo.game.scoped(direct_message.user_username)
+        if not may_have_subscribers(recipient):
+            continue
+        await publish_user_event(
+            recipient,
+            "direct_message",
+            DirectMessageResponse.model_validate(direct_message, from_attributes=True).model_dump()
+        )
+        await publish_user_event(
+            recipient,
+            "unread_count",
+            {"unread_count": await repo.count_unread(direct_message.user_username)}
+        )
+
 @router.get("/direct-messages/sent", response_model=List[DirectMessageResponse])
-async def get_sent_direct_messages(current_user: User = Depends(get_admin_user), session: Session = Depends(get_session)):
+async def get_sent_direct_messages(current_user: User = Depends(get_admin_user), repo: Repository = Depends(get_repository)):
     """Get all direct messages sent by the admin"""
-    messages = session.exec(
-        select(DirectMessage)
-        .where(DirectMessage.admin_username == current_user.username)
-        .order_by(DirectMessage.ts.desc())
-    ).all()
+    messages = await repo.sent_direct_messages(current_user.username)
 
-    return messages
+    return rows_response(messages)
 
 @router.get("/direct-messages/received", response_model=List[DirectMessageResponse])
-async def get_received_direct_messages(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    """Get all direct messages received by the user"""
-    messages = session.exec(
-        select(DirectMessage)
-        .where(DirectMessage.user_username == current_user.username)
-        .order_by(DirectMessage.ts.desc())
-    ).all()
-
-    # Mark messages as read
-    for message in messages:
-        if not message.is_read:
-            message.is_read = True
-            session.add(message)
+async def get_received_direct_messages(
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    repo: Repository = Depends(get_repository)
+):
+    """Get direct messages received by the user, newest first; ?before=<ts>&before_id=<id> of the last row pages back"""
+    # Fetch the page and mark its messages as read
+    messages = await repo.read_direct_messages(current_user.username, before=before, before_id=before_id, limit=limit)
 
-    session.commit()
+    # Other open tabs of this user should update their badge too
+    unread_count = await repo.count_unread(current_user.username)
+    await publish_user_event(repo.game.scoped(current_user.username), "unread_count", {"unread_count": unread_count})
 
-    return messages
+    return rows_response(messages)
 
 @router.get("/direct-messages/unread-count")
-async def get_unread_count(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+async def get_unread_count(current_user: User = Depends(get_current_user), repo: Repository = Depends(get_repository)):
     """Get count of unread direct messages for the user"""
-    count = session.exec(
-        select(DirectMessage)
-        .where(DirectMessage.user_username == current_user.username)
-        .where(DirectMessage.is_read == False)
-    ).all()
+    return {"unread_count": await repo.count_unread(current_user.username)}
+
+@router.get("/events")
+async def event_stream(current_user: User = Depends(get_stream_user), repo: Repository = Depends(get_repository)):
+    """Server-Sent Events stream of the user's direct messages and unread count"""
+    # Subscribe before counting so a message sent in between is not lost
+    username = current_user.username
+    channel = repo.game.scoped(username)
+    queue = user_events.subscribe(channel)
+    unread_count = await repo.count_unread(username)
+    await repo.release()
+
+    async def events():
+        try:
+            yield format_sse("unread_count", {"unread_count": unread_count})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            user_events.unsubscribe(channel, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    return {"unread_count": len(count)}
+@server_router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def get_metrics():
+    """Runtime metrics in Prometheus text format (admin or METRICS_TOKEN)"""
+    await run_in_threadpool(refresh_tracked_keys)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@server_router.get("/profiles")
+async def list_profiles(current_user: User = Depends(get_admin_user)):
+    """Recent request profiles, newest first"""
+    return [profile.summary() for profile in profile_store.list()]
+
+@server_router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "folded", current_user: User = Depends(get_admin_user)):
+    """One request profile: folded stacks for flame graphs, or ?format=json with the SQL it ran"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return ORJSONResponse(profile.to_dict())
+    return PlainTextResponse(profile.folded())
+
+# Game hosting endpoints (admins of the default game run the server)
+@server_router.get("/games", response_model=List[GameResponse])
+async def list_games(current_user: User = Depends(get_admin_user)):
+    """Every hosted game: the default one and each shard on disk"""
+    return [{"id": game_id} for game_id in await run_in_threadpool(games.ids)]
+
+@server_router.post("/games", response_model=GameResponse, status_code=status.HTTP_201_CREATED)
+async def create_game(game_data: GameCreate, current_user: User = Depends(get_admin_user)):
+    """Create a game in its own SQLite shard, seeded from the given set or SEED_DATA, served at /api/games/{id}"""
+    seed = game_data.seed.model_dump() if game_data.seed is not None else SEED_DATA
+    if not any(user["role"] == "admin" for user in seed["users"]):
+        raise HTTPException(status_code=422, detail="The seed set needs an admin user")
+    usernames = [user["username"] for user in seed["users"]]
+    repeated = sorted({username for username in usernames if usernames.count(username) > 1})
+    if repeated:
+        raise HTTPException(status_code=422, detail=f"Usernames in the seed set more than once: {', '.join(repeated)}")
+    persona_usernames = [username for group in seed["personas"].values() for username in group]
+    repeated = sorted({username for username in persona_usernames if persona_usernames.count(username) > 1})
+    if repeated:
+        raise HTTPException(status_code=422, detail=f"Players with more than one persona: {', '.join(repeated)}")
+
+    def create():
+        game = games.create(game_data.id, {"clues_regular": seed["clues_regular"], "clues_murder": seed["clues_murder"]})
+        try:
+            with Session(game.engine) as session:
+                seed_database(session, seed, game_data.admin_password)
+        except BaseException:
+            # Don't leave an unseeded game behind holding the id
+            games.remove(game.id)
+            raise
+
+    try:
+        await run_in_threadpool(create)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Game ids are 1-32 lowercase letters, digits and dashes")
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="Game already exists")
+    return {"id": game_data.id}
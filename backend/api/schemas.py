@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # Authentication schemas
@@ -27,6 +27,18 @@ class RoomResponse(BaseModel):
     playerB: str
     created_at: datetime
 
+class RoomBulkCreate(BaseModel):
+    # Either explicit pairings or generate="round_robin" to pair outies with innies
+    pairings: Optional[List[RoomCreate]] = None
+    generate: Optional[str] = None
+    # Round robin rotation to use; by default the one repeating the fewest existing rooms
+    round: Optional[int] = None
+
+class RoomBulkResponse(BaseModel):
+    rooms: List[RoomResponse]
+    # Players left without a room when the groups differ in size
+    unpaired: List[str]
+
 # Message schemas
 class MessageCreate(BaseModel):
     content: str
@@ -37,6 +49,18 @@ class MessageResponse(BaseModel):
     content: str
     ts: datetime
 
+class RoomActivity(BaseModel):
+    code4: str
+    playerA: str
+    playerB: str
+    created_at: datetime
+    # Archived messages included
+    message_count: int
+    last_message: Optional[MessageResponse]
+    last_activity: Optional[datetime]
+    # Each participant's last request in the room, None if they never opened it
+    last_seen: Dict[str, Optional[datetime]]
+
 # Clue schemas
 class CluesResponse(BaseModel):
     clues: List[str]
@@ -63,3 +87,39 @@ class DirectMessageResponse(BaseModel):
     content: str
     is_read: bool
     ts: datetime
+
+# Archive schemas
+class ArchiveResult(BaseModel):
+    rooms: int
+    messages: int
+    segments: int
+    bytes: int
+
+class DirectMessageBroadcast(BaseModel):
+    content: str
+    # Either explicit usernames or a target: "outies", "innies" or "players"
+    recipients: Optional[List[str]] = None
+    target: Optional[str] = None
+
+# Game schemas
+class SeedUser(BaseModel):
+    username: str
+    password_plain: str
+    role: str
+
+class GameSeed(BaseModel):
+    # Same shape as SEED_DATA
+    users: List[SeedUser]
+    personas: Dict[str, Dict[str, str]]
+    clues_regular: Dict[str, List[str]]
+    clues_murder: MurderCluesResponse
+
+class GameCreate(BaseModel):
+    id: str
+    # Replaces the seed set's admin passwords, so every game gets its own admin login
+    admin_password: str
+    # SEED_DATA when omitted
+    seed: Optional[GameSeed] = None
+
+class GameResponse(BaseModel):
+    id: str
@@ -1,8 +1,19 @@
+import hashlib
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from sqlmodel import Session, select
 from .models import User, Persona
+from . import auth
 from .auth import get_password_hash
 
+# Seed password hashes are cached on disk, keyed by password and bcrypt cost
+SEED_HASH_CACHE_PATH = os.environ.get(
+    "SEED_HASH_CACHE_PATH",
+    "./data/seed_hashes.json" if os.path.isdir("./data") else "./seed_hashes.json"
+)
+
 # Seed data as specified in the requirements
 SEED_DATA = {
   "users": [
@@ -80,8 +91,54 @@ SEED_DATA = {
   }
 }
 
-def seed_database(session: Session):
-    """Seed the database with initial data"""
+def seed_hash_key(password: str, rounds: int) -> str:
+    """Cache key for a password/cost pair; the password itself is not stored"""
+    return hashlib.sha256(f"{rounds}:{password}".encode("utf-8")).hexdigest()
+
+def load_seed_hash_cache(path: str = SEED_HASH_CACHE_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_seed_hash_cache(cache: dict, path: str = SEED_HASH_CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"Could not save seed hash cache to {path}: {e}")
+
+def hash_seed_passwords(passwords, rounds=None, cache_path: Optional[str] = SEED_HASH_CACHE_PATH) -> dict:
+    """Hash passwords at the current cost, reusing cached hashes and hashing the rest in parallel.
+
+    With no cache_path nothing is read from or written to disk.
+    """
+    rounds = rounds or auth.BCRYPT_ROUNDS
+    cache = load_seed_hash_cache(cache_path) if cache_path else {}
+    hashes = {}
+    missing = []
+    for password in set(passwords):
+        cached = cache.get(seed_hash_key(password, rounds))
+        if cached:
+            hashes[password] = cached
+        else:
+            missing.append(password)
+
+    if missing:
+        # bcrypt releases the GIL, so threads spread the hashing over all cores
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            computed = pool.map(lambda password: get_password_hash(password, rounds), missing)
+            for password, pw_hash in zip(missing, computed):
+                hashes[password] = pw_hash
+                cache[seed_hash_key(password, rounds)] = pw_hash
+        if cache_path:
+            save_seed_hash_cache(cache, cache_path)
+
+    return hashes
+
+def seed_database(session: Session, seed_data: dict = SEED_DATA, admin_password: Optional[str] = None):
+    """Seed the database with initial data; admin_password replaces the seed set's admin passwords"""
     # Check if data already exists
     existing_user = session.exec(select(User)).first()
     if existing_user:
@@ -89,16 +146,24 @@ def seed_database(session: Session):
         return
     
     # Seed users
-    for user_data in SEED_DATA["users"]:
+    # Only SEED_DATA's passwords, which are in the source anyway, go through the on-disk cache
+    cache_path = SEED_HASH_CACHE_PATH if seed_data is SEED_DATA else None
+    hashes = hash_seed_passwords([user_data["password_plain"] for user_data in seed_data["users"]], cache_path=cache_path)
+    # A game's own admin password stays out of the on-disk hash cache
+    admin_hash = get_password_hash(admin_password) if admin_password else None
+    for user_data in seed_data["users"]:
+        pw_hash = hashes[user_data["password_plain"]]
+        if admin_hash and user_data["role"] == "admin":
+            pw_hash = admin_hash
         user = User(
             username=user_data["username"],
-            pw_hash=get_password_hash(user_data["password_plain"]),
+            pw_hash=pw_hash,
             role=user_data["role"]
         )
         session.add(user)
     
     # Seed personas - outies
-    for username, description in SEED_DATA["personas"]["outies"].items():
+    for username, description in seed_data["personas"].get("outies", {}).items():
         persona = Persona(
             username=username,
             group="outie",
@@ -107,7 +172,7 @@ def seed_database(session: Session):
         session.add(persona)
     
     # Seed personas - innies
-    for username, description in SEED_DATA["personas"]["innies"].items():
+    for username, description in seed_data["personas"].get("innies", {}).items():
         persona = Persona(
             username=username,
             group="innie",
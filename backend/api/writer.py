@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+# Group commit: how long the writer keeps gathering inserts after the first one, and the batch cap
+GROUP_COMMIT_WINDOW_SECONDS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "3")) / 1000
+GROUP_COMMIT_MAX_BATCH = 128
+
+
+class GroupCommitWriter:
+    """Single writer task that commits queued inserts in small batches.
+
+    Callers submit a function that adds rows to a session and returns them.
+    The writer gathers whatever arrives within GROUP_COMMIT_WINDOW_SECONDS of
+    the first request and runs the whole batch in one transaction, so a
+    burst of chat lines costs one commit (and one fsync) instead of one each.
+    Every caller's future resolves after the commit, with ids and defaults
+    such as timestamps filled in.
+    """
+
+    def __init__(self, engine, window_seconds: float = GROUP_COMMIT_WINDOW_SECONDS, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.engine = engine
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    async def submit(self, write: Callable[[Session], object]):
+        """Queue a write and wait for the commit that includes it"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # First use, the previous loop is gone (e.g. between test clients) or the task died
+            leftovers = drain(self._queue)
+            queue = asyncio.Queue()
+            if self._loop is loop:
+                # Writes the dead task never took still get committed, by the new one
+                for item in leftovers:
+                    queue.put_nowait(item)
+            else:
+                fail_writes(leftovers, RuntimeError("The group-commit writer's event loop has changed"))
+            self._loop = loop
+            self._queue = queue
+            # A fresh context, so the long-lived task doesn't carry the first caller's request state
+            self._task = loop.create_task(self._run(queue), context=contextvars.Context())
+
+        future = loop.create_future()
+        self._queue.put_nowait((write, future))
+        return await future
+
+    async def close(self):
+        """Commit everything queued, including a batch already committing, then stop the writer task"""
+        task, queue = self._task, self._queue
+        # Writes submitted from now on start a new task on a new queue
+        self._task = self._queue = None
+        if task is None:
+            return
+        if task.get_loop() is asyncio.get_running_loop() and not task.done():
+            # The task commits what is ahead of the sentinel, then returns
+            queue.put_nowait(None)
+            await asyncio.wait([task])
+        fail_writes(drain(queue), RuntimeError("The group-commit writer stopped"))
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    item = queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    # close(): commit this batch, then stop
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                outcomes = await run_in_threadpool(self._commit, [write for write, _ in batch])
+            except BaseException as e:
+                # Cancelled or failed mid-commit: the callers must not wait forever
+                fail_writes(batch, e if isinstance(e, Exception) else RuntimeError("The group-commit writer stopped"))
+                raise
+            self.batches += 1
+            self.writes += len(batch)
+            for (_, future), (ok, value) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _commit(self, writes: List[Callable[[Session], object]]) -> List[Tuple[bool, object]]:
+        with Session(self.engine, expire_on_commit=False) as session:
+            try:
+                results = [write(session) for write in writes]
+                session.commit()
+                return [(True, result) for result in results]
+            except Exception:
+                session.rollback()
+
+        # Something in the batch failed: retry one transaction per write so only
+        # the bad write reports an error
+        outcomes = []
+        for write in writes:
+            with Session(self.engine, expire_on_commit=False) as session:
+                try:
+                    result = write(session)
+                    session.commit()
+                    outcomes.append((True, result))
+                except Exception as e:
+                    session.rollback()
+                    outcomes.append((False, e))
+        return outcomes
+
+
+def drain(queue: Optional[asyncio.Queue]) -> List[Tuple[Callable[[Session], object], asyncio.Future]]:
+    """Remove and return the writes still waiting in a queue"""
+    items = []
+    while queue is not None and not queue.empty():
+        item = queue.get_nowait()
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def fail_writes(items, error: Exception):
+    """Fail the futures of writes that will never be committed, on whichever loop they belong to"""
+    for _, future in items:
+        future_loop = future.get_loop()
+        if future.done() or future_loop.is_closed():
+            continue
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if future_loop is running:
+            future.set_exception(error)
+        else:
+            future_loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_exception(error))
+
+
+_writers: Dict[object, GroupCommitWriter] = {}
+
+
+def get_writer(engine) -> GroupCommitWriter:
+    """The writer for an engine; all inserts into one database go through one writer"""
+    writer = _writers.get(engine)
+    if writer is None:
+        writer = _writers[engine] = GroupCommitWriter(engine)
+    return writer
+
+
+def writer_stats() -> Dict[str, int]:
+    """Totals over all writers: writes waiting in queues, commits and writes committed"""
+    return {
+        "queued": sum(writer._queue.qsize() for writer in _writers.values() if writer._queue is not None),
+        "batches": sum(writer.batches for writer in _writers.values()),
+        "writes": sum(writer.writes for writer in _writers.values()),
+    }
+
+
+async def close_writers():
+    for writer in _writers.values():
+        await writer.close()
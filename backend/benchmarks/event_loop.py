@@ -0,0 +1,120 @@
+"""Concurrent request latency and event-loop stalls: threadpool repository vs. inline queries.
+
+Run from backend/:  python -m benchmarks.event_loop [--messages 200000] [--clients 20]
+
+Requests go through the real app in-process (httpx ASGI transport) against a
+temporary SQLite file. "inline" runs every repository query directly on the
+event loop, which is what the handlers did before the repository existed;
+"threadpool" is the current behaviour. A ticker task measures how long the
+event loop is stalled, which is what every other open poll would feel.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlmodel import SQLModel, Session, create_engine, insert
+
+from api.auth import create_access_token
+from api.database import configure_sqlite, get_session, get_sqlite_pragmas
+from api.main import app
+from api.models import User, Room, Message
+from api.repository import Repository
+
+
+def build_database(messages: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=50)
+    configure_sqlite(engine, get_sqlite_pragmas("fast", ""))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="bench", pw_hash="-", role="player"))
+        room = Room(code4="BNCH", playerA="bench", playerB="other")
+        other = Room(code4="OTHR", playerA="x", playerB="y")
+        session.add(room)
+        session.add(other)
+        session.commit()
+        # Most rows belong to other rooms, as in a long game night
+        rows = [
+            {"room_id": room.id if i % 50 == 0 else other.id, "sender": "bench", "content": "x" * 60}
+            for i in range(messages)
+        ]
+        session.exec(insert(Message), params=rows)
+        session.commit()
+    return engine
+
+
+async def monitor_loop(stop: asyncio.Event, stalls: list):
+    interval = 0.001
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run_mode(mode: str, clients: int, requests_per_client: int) -> dict:
+    original_run = Repository.run
+    if mode == "inline":
+        async def run_inline(self, fn, *args):
+            return fn(*args)
+        Repository.run = run_inline
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+    latencies = []
+    stalls = []
+    stop = asyncio.Event()
+
+    async def client_loop(client: httpx.AsyncClient):
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = await client.get("/api/rooms/BNCH/messages", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            monitor = asyncio.create_task(monitor_loop(stop, stalls))
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await monitor
+    finally:
+        Repository.run = original_run
+
+    ordered = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 2)
+    return {
+        "mode": mode,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": to_ms(ordered[len(ordered) // 2]),
+        "latency_p95_ms": to_ms(ordered[int(len(ordered) * 0.95)]),
+        "loop_stall_max_ms": to_ms(max(stalls)),
+        "loop_stall_mean_ms": to_ms(statistics.mean(stalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    args = parser.parse_args()
+
+    engine = build_database(args.messages)
+
+    def get_session_override():
+        with Session(engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    for mode in ("inline", "threadpool"):
+        print(asyncio.run(run_mode(mode, args.clients, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Room message inserts per second: one commit per message vs. the group-commit writer.
+
+Run from backend/:  python -m benchmarks.group_commit [--senders 30] [--messages 50]
+
+Each sender is a coroutine posting messages back to back, like players during
+the accusation round. "per-message" commits every insert in its own session on
+the threadpool, as create_message used to; "group-commit" submits them to
+GroupCommitWriter. Both run against a temporary SQLite file for each storage
+profile, since the gain depends on what a commit costs.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlmodel import SQLModel, Session, create_engine
+from starlette.concurrency import run_in_threadpool
+
+from api.database import configure_sqlite, get_sqlite_pragmas
+from api.models import Room, Message
+from api.writer import GroupCommitWriter
+
+
+def build_engine(profile: str):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=50)
+    configure_sqlite(engine, get_sqlite_pragmas(profile, ""))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Room(code4="BNCH", playerA="a", playerB="b"))
+        session.commit()
+    return engine
+
+
+async def per_message(engine, senders: int, messages: int):
+    def insert(content):
+        with Session(engine) as session:
+            message = Message(room_id=1, sender="a", content=content)
+            session.add(message)
+            session.commit()
+            session.refresh(message)
+            return message
+
+    async def sender(i):
+        for j in range(messages):
+            await run_in_threadpool(insert, f"{i}-{j}")
+
+    await asyncio.gather(*(sender(i) for i in range(senders)))
+
+
+async def group_commit(engine, senders: int, messages: int):
+    writer = GroupCommitWriter(engine)
+
+    def insert(content):
+        def add(session):
+            message = Message(room_id=1, sender="a", content=content)
+            session.add(message)
+            return message
+        return add
+
+    async def sender(i):
+        for j in range(messages):
+            await writer.submit(insert(f"{i}-{j}"))
+
+    await asyncio.gather(*(sender(i) for i in range(senders)))
+    await writer.close()
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=50, help="messages per sender")
+    parser.add_argument("--profiles", nargs="+", default=["default", "fast", "durable"])
+    args = parser.parse_args()
+    total = args.senders * args.messages
+
+    for profile in args.profiles:
+        for name, mode in (("per-message", per_message), ("group-commit", group_commit)):
+            engine = build_engine(profile)
+            started = time.perf_counter()
+            result = asyncio.run(mode(engine, args.senders, args.messages))
+            elapsed = time.perf_counter() - started
+            report = {"profile": profile, "mode": name, "messages_per_sec": round(total / elapsed, 1)}
+            if isinstance(result, GroupCommitWriter):
+                report["mean_batch"] = round(result.writes / result.batches, 1)
+            print(report)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
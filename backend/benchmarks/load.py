@@ -0,0 +1,296 @@
+"""Load generation against a real uvicorn server: N synthetic players running the client loop.
+
+Run from backend/:  python -m benchmarks.load [--players 16] [--duration 30] [--output results.json]
+
+A temporary SQLite database is filled with an admin, N players and one room
+per pair of players, then uvicorn is launched on it as a subprocess. Each
+player logs in once and then, until the run ends, does what the React client
+does: long-poll /rooms/{code4}/stream with its message cursor, post a message
+every --message-interval seconds and check /direct-messages/unread-count
+every --unread-interval seconds. Player start times are spread over --ramp
+seconds. The admin sends a direct message to a random player every
+--dm-interval seconds, so the unread counters move.
+
+Latency is recorded per route template with p50/p95/p99 and throughput.
+Stream latency includes the time a poll is parked waiting for a message, so
+read it as delivery delay, not server time. Results (configuration, per-route
+stats and totals) are written as JSON so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+from sqlmodel import SQLModel, Session, create_engine, insert
+
+from api.auth import get_password_hash
+from api.models import User, Room
+from api.rooms import room_code
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAYER_PASSWORD = "bench-password"
+ADMIN_PASSWORD = "bench-admin"
+
+
+def build_database(path: str, players: int, bcrypt_rounds: int) -> list:
+    """Create the admin, the players and their rooms; returns (username, code4) per player"""
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    # One hash for everyone: the server still pays a full verify per login
+    player_hash = get_password_hash(PLAYER_PASSWORD, rounds=bcrypt_rounds)
+    usernames = [f"player{i:05d}" for i in range(players)]
+    assignments = []
+    with Session(engine) as session:
+        session.add(User(username="admin", pw_hash=get_password_hash(ADMIN_PASSWORD, rounds=bcrypt_rounds), role="admin"))
+        session.exec(insert(User), params=[
+            {"username": username, "pw_hash": player_hash, "role": "player"} for username in usernames
+        ])
+        rooms = []
+        for i in range(0, players, 2):
+            player_a = usernames[i]
+            player_b = usernames[i + 1] if i + 1 < players else "admin"
+            code4 = room_code(i // 2)
+            rooms.append({"code4": code4, "playerA": player_a, "playerB": player_b})
+            assignments.append((player_a, code4))
+            if player_b != "admin":
+                assignments.append((player_b, code4))
+        session.exec(insert(Room), params=rooms)
+        session.commit()
+    engine.dispose()
+    return assignments
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_path: str, port: int, bcrypt_rounds: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}", BCRYPT_ROUNDS=str(bcrypt_rounds))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+
+
+async def wait_for_server(base_url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                await client.get("/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+class Recorder:
+    """Latencies and status codes per route template"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[f"{route}: {type(e).__name__}"] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][response.status_code] += 1
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            percentile = lambda p: round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+            routes[route] = {
+                "requests": len(ordered),
+                "requests_per_sec": round(len(ordered) / elapsed, 1),
+                "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(ordered[-1] * 1000, 2),
+                "status": {str(code): count for code, count in sorted(self.statuses[route].items())},
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "routes": routes,
+            "total_requests": total,
+            "total_requests_per_sec": round(total / elapsed, 1),
+            "errors": dict(self.errors),
+        }
+
+
+async def login(client: httpx.AsyncClient, recorder: Recorder, username: str, password: str):
+    response = await recorder.request(
+        client, "POST /api/login", "POST", "/api/login",
+        data={"username": username, "password": password}
+    )
+    if response is None or response.status_code != 200:
+        return None
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def every(interval: float, stop_at: float, rng: random.Random, action):
+    """Run an action every interval seconds, starting at a random offset"""
+    await asyncio.sleep(rng.uniform(0, interval))
+    while time.monotonic() < stop_at:
+        await action()
+        await asyncio.sleep(interval)
+
+
+async def player_loop(client, recorder, username, code4, args, start_delay, stop_at):
+    """One player: a long-poll loop plus periodic posting and unread checks, concurrently like the client"""
+    await asyncio.sleep(start_delay)
+    headers = await login(client, recorder, username, PLAYER_PASSWORD)
+    if headers is None:
+        return
+    rng = random.Random(username)
+    cursor = {"after": None}
+
+    async def poll():
+        while time.monotonic() < stop_at:
+            params = {"timeout": args.poll_wait}
+            if cursor["after"] is not None:
+                params["after"] = cursor["after"]
+            response = await recorder.request(
+                client, "GET /api/rooms/{code4}/stream", "GET", f"/api/rooms/{code4}/stream",
+                headers=headers, params=params
+            )
+            if response is None or response.status_code != 200:
+                await asyncio.sleep(args.think)
+                continue
+            messages = response.json()
+            if messages:
+                cursor["after"] = messages[-1]["id"]
+
+    async def post():
+        await recorder.request(
+            client, "POST /api/rooms/{code4}/msg", "POST", f"/api/rooms/{code4}/msg",
+            headers=headers, json={"content": f"{username} at {time.monotonic():.3f}"}
+        )
+
+    async def check_unread():
+        await recorder.request(
+            client, "GET /api/direct-messages/unread-count", "GET", "/api/direct-messages/unread-count",
+            headers=headers
+        )
+
+    await asyncio.gather(
+        poll(),
+        every(args.message_interval, stop_at, rng, post),
+        every(args.unread_interval, stop_at, rng, check_unread)
+    )
+
+
+async def admin_loop(client, recorder, usernames, args, stop_at):
+    headers = await login(client, recorder, "admin", ADMIN_PASSWORD)
+    if headers is None:
+        return
+    rng = random.Random("admin")
+
+    async def send_clue():
+        await recorder.request(
+            client, "POST /api/direct-messages", "POST", "/api/direct-messages",
+            headers=headers, json={"user_username": rng.choice(usernames), "content": "A new clue"}
+        )
+
+    await every(args.dm_interval, stop_at, rng, send_clue)
+
+
+async def run(args, base_url: str, assignments: list) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.poll_wait + 30)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.monotonic()
+        stop_at = started + args.ramp + args.duration
+        tasks = [
+            player_loop(client, recorder, username, code4, args, args.ramp * i / len(assignments), stop_at)
+            for i, (username, code4) in enumerate(assignments)
+        ]
+        tasks.append(admin_loop(client, recorder, [username for username, _ in assignments], args, stop_at))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+    return recorder.summary(elapsed)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of steady load after the ramp")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which players log in")
+    parser.add_argument("--poll-wait", type=float, default=5, help="long-poll timeout each stream request asks for")
+    parser.add_argument("--think", type=float, default=2, help="pause before re-polling after a failed poll")
+    parser.add_argument("--message-interval", type=float, default=10)
+    parser.add_argument("--unread-interval", type=float, default=15)
+    parser.add_argument("--dm-interval", type=float, default=5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Thousands of players means thousands of sockets
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    database_path = os.path.join(tempfile.mkdtemp(), "load.db")
+    assignments = build_database(database_path, args.players, args.bcrypt_rounds)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(database_path, port, args.bcrypt_rounds)
+    try:
+        asyncio.run(wait_for_server(base_url, server))
+        summary = asyncio.run(run(args, base_url, assignments))
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        "benchmark": "load",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **summary,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
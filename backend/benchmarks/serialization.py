@@ -0,0 +1,102 @@
+"""Per-request CPU of a message page: ORM + response_model validation vs. column rows + orjson.
+
+Run from backend/:  python -m benchmarks.serialization [--iterations 300]
+
+Both paths run the same query against a temporary SQLite file and produce
+the JSON body a client would receive. "orm" is what get_messages did before
+the fast path: hydrate Message objects, validate them through the
+List[MessageResponse] response field and encode with FastAPI's JSONResponse.
+"rows" is the current Repository.message_page + rows_response. CPU time is
+measured with time.process_time, so it excludes waiting on the disk.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlmodel import SQLModel, Session, create_engine, insert, select
+
+from api.database import configure_sqlite, get_sqlite_pragmas
+from api.models import Room, Message
+from api.repository import Repository
+from api.routes import rows_response
+from api.schemas import MessageResponse
+
+
+def build_database(messages: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    configure_sqlite(engine, get_sqlite_pragmas("fast", ""))
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        room = Room(code4="BNCH", playerA="bench", playerB="other")
+        session.add(room)
+        session.commit()
+        rows = [
+            {"room_id": room.id, "sender": "bench", "content": f"message {i} " + "x" * 60}
+            for i in range(messages)
+        ]
+        session.exec(insert(Message), params=rows)
+        session.commit()
+        return engine, room.id
+
+
+async def orm_page(session: Session, room_id: int, limit: int, field) -> bytes:
+    messages = session.exec(
+        select(Message).where(Message.room_id == room_id).order_by(Message.id.desc()).limit(limit)
+    ).all()
+    content = await serialize_response(field=field, response_content=list(reversed(messages)))
+    return JSONResponse(content).body
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
+
+
+async def rows_page(session: Session, room_id: int, limit: int) -> bytes:
+    repo = Repository(session)
+    # Call the query directly: the threadpool hop is the same for both paths
+    repo.run = run_inline
+    return rows_response(await repo.message_page(room_id, limit=limit)).body
+
+
+async def measure(engine, room_id: int, limit: int, iterations: int) -> dict:
+    field = create_response_field(name="Response_get_messages", type_=List[MessageResponse])
+    results = {"messages": limit}
+    with Session(engine, expire_on_commit=False) as session:
+        for name, page in (
+            ("orm", lambda: orm_page(session, room_id, limit, field)),
+            ("rows", lambda: rows_page(session, room_id, limit)),
+        ):
+            body = await page()
+            for _ in range(10):
+                await page()
+            started = time.process_time()
+            for _ in range(iterations):
+                await page()
+                # Fresh identity map, as each request has its own session
+                session.expunge_all()
+            results[f"{name}_cpu_us"] = round((time.process_time() - started) / iterations * 1e6, 1)
+            results[f"{name}_bytes"] = len(body)
+    results["speedup"] = round(results["orm_cpu_us"] / results["rows_cpu_us"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500])
+    args = parser.parse_args()
+
+    engine, room_id = build_database(max(args.sizes) * 4)
+    for limit in args.sizes:
+        print(asyncio.run(measure(engine, room_id, limit, args.iterations)))
+
+
+if __name__ == "__main__":
+    main()
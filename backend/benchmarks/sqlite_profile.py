@@ -0,0 +1,109 @@
+"""Poll-read latency while chat messages are being written, per SQLite profile.
+
+Run from backend/:  python -m benchmarks.sqlite_profile [--seconds 5] [--readers 8]
+
+A writer thread inserts and commits messages one at a time (like create_message)
+while reader threads repeatedly run the stream_messages query, so the numbers show
+how long polls stall behind commits under each storage profile.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from api.database import configure_sqlite, get_sqlite_pragmas
+from api.models import Room, Message
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_profile(profile: str, seconds: float, readers: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), f"{profile}.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=readers + 2)
+    configure_sqlite(engine, get_sqlite_pragmas(profile, ""))
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        room = Room(code4="BNCH", playerA="a", playerB="b")
+        session.add(room)
+        session.commit()
+        room_id = room.id
+
+    stop = threading.Event()
+    latencies = []
+    errors = {"read": 0, "write": 0}
+    writes = [0]
+
+    def writer():
+        with Session(engine) as session:
+            while not stop.is_set():
+                try:
+                    session.add(Message(room_id=room_id, sender="a", content="x" * 80))
+                    session.commit()
+                    writes[0] += 1
+                except OperationalError:
+                    session.rollback()
+                    errors["write"] += 1
+
+    def reader():
+        with Session(engine) as session:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    session.exec(
+                        select(Message)
+                        .where(Message.room_id == room_id)
+                        .where(Message.id > max(writes[0] - 20, 0))
+                        .order_by(Message.id)
+                        .limit(50)
+                    ).all()
+                    session.commit()
+                    latencies.append(time.perf_counter() - start)
+                except OperationalError:
+                    session.rollback()
+                    errors["read"] += 1
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    to_ms = lambda value: round(value * 1000, 3)
+    return {
+        "profile": profile,
+        "writes_per_sec": round(writes[0] / seconds, 1),
+        "reads_per_sec": round(len(latencies) / seconds, 1),
+        "read_p50_ms": to_ms(percentile(latencies, 50)),
+        "read_p95_ms": to_ms(percentile(latencies, 95)),
+        "read_p99_ms": to_ms(percentile(latencies, 99)),
+        "read_max_ms": to_ms(max(latencies)),
+        "read_mean_ms": to_ms(statistics.mean(latencies)),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--profiles", nargs="+", default=["default", "fast", "durable"])
+    args = parser.parse_args()
+
+    for profile in args.profiles:
+        print(run_profile(profile, args.seconds, args.readers))
+
+
+if __name__ == "__main__":
+    main()
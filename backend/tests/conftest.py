@@ -0,0 +1,21 @@
+import os
+import pytest
+
+# Cheap bcrypt for test fixtures; must be set before the app modules are imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from api.auth import principal_cache, known_usernames
+from api.cache import response_cache
+from api.ratelimit import reset_rate_limits
+from api.rooms import room_directory, room_presence
+
+@pytest.fixture(autouse=True)
+def reset_in_memory_state():
+    """Each test gets a fresh database, so process-wide caches must start empty"""
+    principal_cache.clear()
+    known_usernames.clear()
+    room_directory.clear()
+    room_presence.clear()
+    response_cache.clear()
+    reset_rate_limits()
+    yield
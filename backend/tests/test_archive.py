@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from api.main import app
+from api.archive import archive_room_messages
+from api.database import get_session
+from api.models import User, Room, Message, MessageArchive
+from api.auth import get_password_hash
+
+# Create an in-memory SQLite database for testing
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", pw_hash=get_password_hash("adminpass"), role="admin"))
+        session.add(User(username="player1", pw_hash=get_password_hash("player1pass"), role="player"))
+        session.add(User(username="player2", pw_hash=get_password_hash("player2pass"), role="player"))
+        session.add(User(username="player3", pw_hash=get_password_hash("player3pass"), role="player"))
+
+        # DONE finished hours ago; LIVE is still being played
+        done = Room(code4="DONE", playerA="player1", playerB="player2", created_at=datetime.utcnow() - timedelta(hours=5))
+        live = Room(code4="LIVE", playerA="player1", playerB="player3")
+        session.add(done)
+        session.add(live)
+        session.commit()
+        started = datetime.utcnow() - timedelta(hours=4)
+        for i in range(25):
+            session.add(Message(room_id=done.id, sender="player1" if i % 2 else "player2", content=f"old, \"quoted\" {i}", ts=started + timedelta(seconds=i)))
+        session.add(Message(room_id=live.id, sender="player3", content="still here"))
+        session.commit()
+
+        yield session
+
+# Override the get_session dependency
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    def get_session_override():
+        return session
+
+    app.dependency_overrides[get_session] = get_session_override
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+def get_token(client: TestClient, username: str, password: str):
+    """Helper function to get auth token"""
+    response = client.post(
+        "/api/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+def test_archive_segments_keep_every_message_once(session: Session):
+    """Test that archiving moves messages into ordered segments and out of the hot table"""
+    room = session.exec(select(Room).where(Room.code4 == "DONE")).one()
+
+    totals = archive_room_messages(session, room.id, segment_size=10)
+    assert totals["messages"] == 25 and totals["segments"] == 3
+
+    segments = session.exec(select(MessageArchive).order_by(MessageArchive.first_id)).all()
+    assert [segment.count for segment in segments] == [10, 10, 5]
+    assert segments[0].last_id < segments[1].first_id
+    assert session.exec(select(Message).where(Message.room_id == room.id)).all() == []
+
+    # Nothing left to move the second time
+    assert archive_room_messages(session, room.id)["messages"] == 0
+
+def test_archive_finished_rooms_and_export(client: TestClient):
+    """Test archiving idle rooms and streaming the merged transcript as NDJSON and CSV"""
+    admin_token = get_token(client, "admin", "adminpass")
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    player_headers = {"Authorization": f"Bearer {get_token(client, 'player1', 'player1pass')}"}
+
+    # Players can't archive
+    assert client.post("/api/archive", headers=player_headers).status_code == 403
+
+    response = client.post("/api/archive?idle_minutes=60", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["rooms"] == 1
+    assert response.json()["messages"] == 25
+
+    # The hot history of the archived room is empty, the live room is untouched
+    assert client.get("/api/rooms/DONE/messages", headers=player_headers).json() == []
+    assert len(client.get("/api/rooms/LIVE/messages", headers=player_headers).json()) == 1
+
+    # A fully archived room still shows when it was last active
+    done = [room for room in client.get("/api/dashboard", headers=admin_headers).json() if room["code4"] == "DONE"][0]
+    assert done["message_count"] == 25
+    assert done["last_message"] is None and done["last_activity"] is not None
+
+    # New messages after archiving come after the archived ones in the transcript
+    client.post("/api/rooms/DONE/msg", headers=player_headers, json={"content": "recap time"})
+
+    response = client.get("/api/rooms/DONE/export", headers=player_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert 'filename="room-DONE.ndjson"' in response.headers["content-disposition"]
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 26
+    assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+    assert lines[0]["content"] == 'old, "quoted" 0'
+    assert lines[-1]["content"] == "recap time"
+    assert {line["room"] for line in lines} == {"DONE"}
+
+    # The dashboard counts archived messages too
+    rooms = {room["code4"]: room for room in client.get("/api/dashboard", headers=admin_headers).json()}
+    assert rooms["DONE"]["message_count"] == 26
+    assert rooms["DONE"]["last_message"]["content"] == "recap time"
+
+    # Only the room's players (and admins) may export it
+    player3_headers = {"Authorization": f"Bearer {get_token(client, 'player3', 'player3pass')}"}
+    assert client.get("/api/rooms/DONE/export", headers=player3_headers).status_code == 403
+
+    # The whole game, as CSV, is for admins
+    assert client.get("/api/export?format=csv", headers=player_headers).status_code == 403
+    response = client.get("/api/export?format=csv", headers=admin_headers)
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["room", "id", "sender", "content", "ts"]
+    assert [row[0] for row in rows[1:]] == ["DONE"] * 26 + ["LIVE"]
+    assert rows[1][3] == 'old, "quoted" 0'
+
+    assert client.get("/api/export?format=xml", headers=admin_headers).status_code == 400
@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+
+from api.assets import AssetIndex, IMMUTABLE_CACHE_CONTROL
+
+INDEX_HTML = b"<!doctype html><html><body><div id=\"root\"></div></body></html>"
+BUNDLE_JS = b"console.log('severance');\n" * 200
+
+# A small stand-in for frontend/dist
+@pytest.fixture(name="assets")
+def assets_fixture(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_bytes(INDEX_HTML)
+    (tmp_path / "assets" / "index-abc123.js").write_bytes(BUNDLE_JS)
+    (tmp_path / "assets" / "index-abc123.js.br").write_bytes(b"pretend brotli")
+    (tmp_path / "assets" / "index-abc123.css").write_bytes(b"body { color: black; }\n" * 100)
+    return AssetIndex(str(tmp_path)).load()
+
+def test_index_is_loaded_without_compressed_siblings(assets: AssetIndex):
+    """Test that .br/.gz files are variants, not assets of their own"""
+    assert len(assets) == 3
+    assert assets.get("assets/index-abc123.js.br") is None
+    assert set(assets.get("assets/index-abc123.js").variants) == {"br", "gzip"}
+
+def test_hashed_assets_are_immutable_and_compressed(assets: AssetIndex):
+    """Test that hashed assets pick the best accepted encoding with long-lived caching"""
+    asset = assets.get("assets/index-abc123.js")
+
+    response = assets.respond(asset, {"accept-encoding": "gzip, deflate, br"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.body == b"pretend brotli"
+
+    response = assets.respond(asset, {"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body) == BUNDLE_JS
+
+    response = assets.respond(asset, {})
+    assert "content-encoding" not in response.headers
+    assert response.body == BUNDLE_JS
+
+def test_index_html_answers_304(assets: AssetIndex):
+    """Test that index.html is revalidated by ETag instead of re-sent"""
+    asset = assets.get("index.html")
+
+    response = assets.respond(asset, {})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+
+    response = assets.respond(asset, {"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.body == b""
+
+    # A different encoding is a different representation
+    asset = assets.get("assets/index-abc123.css")
+    etag = assets.respond(asset, {}).headers["etag"]
+    response = assets.respond(asset, {"if-none-match": etag, "accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
@@ -1,12 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
 from api.main import app
 from api.database import get_session
 from api.models import User
-from api.auth import get_password_hash
+from api import auth
+from api.auth import get_password_hash, get_password_cost, verify_password
 
 # Create an in-memory SQLite database for testing
 @pytest.fixture(name="session")
@@ -114,3 +118,65 @@ def test_admin_access(client: TestClient):
         headers={"Authorization": f"Bearer {user_token}"}
     )
     assert user_response.status_code == 403
+
+def test_current_user_is_cached_until_user_changes(client: TestClient, session: Session):
+    """Test that token lookups are served from the principal cache and invalidated on updates"""
+    login_response = client.post(
+        "/api/login",
+        data={"username": "testuser", "password": "testpassword"}
+    )
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    assert client.get("/api/me", headers=headers).json()["role"] == "player"
+
+    # Updating the user through the ORM invalidates its cached principal
+    user = session.exec(select(User).where(User.username == "testuser")).one()
+    user.role = "admin"
+    session.add(user)
+    session.commit()
+    assert client.get("/api/me", headers=headers).json()["role"] == "admin"
+
+    # A raw SQL change bypasses invalidation, so the cached principal still answers
+    session.exec(text("UPDATE user SET role = 'player' WHERE username = 'testuser'"))
+    session.commit()
+    assert client.get("/api/me", headers=headers).json()["role"] == "admin"
+
+def test_principal_cache_is_thread_safe():
+    """Test that concurrent gets, puts and evictions on a small principal cache never raise"""
+    cache = auth.PrincipalCache(ttl_seconds=0.001, max_size=8)
+    user = User(id=1, username="testuser", pw_hash="x", role="player")
+
+    def hammer(worker):
+        for i in range(2000):
+            key = ("default", f"t{(worker + i) % 32}")
+            cache.put(key, user)
+            cache.get(key)
+            if i % 100 == 0:
+                cache.invalidate("testuser")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(hammer, range(8)))
+    assert len(cache._entries) <= 8
+
+def test_login_unknown_user(client: TestClient):
+    """Test that logins for unknown usernames fail like wrong passwords"""
+    response = client.post(
+        "/api/login",
+        data={"username": "nobody", "password": "testpassword"}
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Incorrect username or password"
+
+def test_login_rehashes_outdated_cost(client: TestClient, session: Session):
+    """Test that a successful login upgrades a hash made with a different bcrypt cost"""
+    session.add(User(username="legacy", pw_hash=get_password_hash("legacypass", rounds=auth.BCRYPT_ROUNDS + 1), role="player"))
+    session.commit()
+
+    response = client.post(
+        "/api/login",
+        data={"username": "legacy", "password": "legacypass"}
+    )
+    assert response.status_code == 200
+
+    user = session.exec(select(User).where(User.username == "legacy")).one()
+    assert get_password_cost(user.pw_hash) == auth.BCRYPT_ROUNDS
+    assert verify_password("legacypass", user.pw_hash)
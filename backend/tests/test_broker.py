@@ -0,0 +1,54 @@
+import asyncio
+import os
+import tempfile
+
+from sqlmodel import SQLModel, create_engine
+
+from api.broker import LocalBroker, SQLiteBroker
+from api.writer import close_writers
+
+def make_engine():
+    # A file, so the two brokers read through separate connections like separate workers
+    path = os.path.join(tempfile.mkdtemp(), "broker.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+def test_local_broker_runs_handlers_in_process():
+    """Test that publishing on the local broker calls the channel's handlers straight away"""
+    broker = LocalBroker()
+    received = []
+    broker.on("room_message", received.append)
+
+    asyncio.run(broker.publish("room_message", {"code4": "ABCD"}))
+    asyncio.run(broker.publish("other", {"code4": "EFGH"}))
+    assert received == [{"code4": "ABCD"}]
+
+def test_sqlite_broker_delivers_across_workers():
+    """Test that an event published by one worker reaches the others once, and its own handler only once"""
+    engine = make_engine()
+    first = SQLiteBroker(engine, poll_seconds=0.01)
+    second = SQLiteBroker(engine, poll_seconds=0.01)
+    first_received, second_received = [], []
+    first.on("cache_bump", first_received.append)
+    second.on("cache_bump", second_received.append)
+
+    async def scenario():
+        await first.start()
+        await second.start()
+        await first.publish("cache_bump", {"resources": ["rooms"]})
+        # Sync code (ORM events) publishes without the group-commit writer
+        first.publish_blocking("cache_bump", {"resources": ["personas"]})
+        for _ in range(100):
+            if len(second_received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        # A few more polls, to be sure nothing is delivered twice
+        await asyncio.sleep(0.05)
+        await first.stop()
+        await second.stop()
+        await close_writers()
+
+    asyncio.run(scenario())
+    assert first_received == [{"resources": ["rooms"]}, {"resources": ["personas"]}]
+    assert second_received == [{"resources": ["rooms"]}, {"resources": ["personas"]}]
@@ -0,0 +1,221 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from api.main import app
+from api.database import get_session
+from api.models import User, Persona, DirectMessage, UnreadCount
+from api.auth import get_password_hash
+from api.realtime import user_events
+
+# Create an in-memory SQLite database for testing
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Create test users
+        admin = User(
+            username="admin",
+            pw_hash=get_password_hash("adminpass"),
+            role="admin"
+        )
+        player1 = User(
+            username="player1",
+            pw_hash=get_password_hash("player1pass"),
+            role="player"
+        )
+
+        session.add(admin)
+        session.add(player1)
+        session.commit()
+
+        yield session
+
+# Override the get_session dependency
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    def get_session_override():
+        return session
+
+    app.dependency_overrides[get_session] = get_session_override
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+def get_token(client: TestClient, username: str, password: str):
+    """Helper function to get auth token"""
+    response = client.post(
+        "/api/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+def test_unread_count_and_mark_read(client: TestClient):
+    """Test that unread counts track sent and viewed direct messages"""
+    admin_token = get_token(client, "admin", "adminpass")
+    player1_token = get_token(client, "player1", "player1pass")
+
+    for content in ["clue one", "clue two"]:
+        response = client.post(
+            "/api/direct-messages",
+            headers={"Authorization": f"Bearer {admin_token}"},
+            json={"user_username": "player1", "content": content}
+        )
+        assert response.status_code == 200
+
+    response = client.get(
+        "/api/direct-messages/unread-count",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert response.json() == {"unread_count": 2}
+
+    response = client.get(
+        "/api/direct-messages/received",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert [m["content"] for m in response.json()] == ["clue two", "clue one"]
+
+    response = client.get(
+        "/api/direct-messages/unread-count",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert response.json() == {"unread_count": 0}
+
+def test_direct_message_is_published_to_event_stream(client: TestClient):
+    """Test that sending a direct message pushes it and the unread count to the recipient"""
+    admin_token = get_token(client, "admin", "adminpass")
+    queue = user_events.subscribe("player1")
+    try:
+        client.post(
+            "/api/direct-messages",
+            headers={"Authorization": f"Bearer {admin_token}"},
+            json={"user_username": "player1", "content": "check the break room"}
+        )
+
+        event, data = queue.get_nowait()
+        assert event == "direct_message"
+        assert data["content"] == "check the break room"
+        assert queue.get_nowait() == ("unread_count", {"unread_count": 1})
+    finally:
+        user_events.unsubscribe("player1", queue)
+
+def test_event_stream_requires_token(client: TestClient):
+    """Test that the event stream rejects unauthenticated clients"""
+    response = client.get("/api/events")
+    assert response.status_code == 401
+
+def test_inbox_pages_and_counter(client: TestClient, session: Session):
+    """Test inbox pagination and that only the pages opened are marked read"""
+    admin_token = get_token(client, "admin", "adminpass")
+    player1_token = get_token(client, "player1", "player1pass")
+    player1_headers = {"Authorization": f"Bearer {player1_token}"}
+
+    for i in range(3):
+        client.post(
+            "/api/direct-messages",
+            headers={"Authorization": f"Bearer {admin_token}"},
+            json={"user_username": "player1", "content": f"clue {i}"}
+        )
+    assert session.get(UnreadCount, "player1").count == 3
+
+    first_page = client.get("/api/direct-messages/received?limit=2", headers=player1_headers).json()
+    assert [m["content"] for m in first_page] == ["clue 2", "clue 1"]
+    assert all(m["is_read"] for m in first_page)
+
+    # Messages on later pages stay unread until their page is opened
+    session.expire_all()
+    assert session.get(UnreadCount, "player1").count == 1
+    unread = session.exec(select(DirectMessage).where(DirectMessage.is_read == False)).all()
+    assert [m.content for m in unread] == ["clue 0"]
+
+    second_page = client.get(
+        "/api/direct-messages/received",
+        params={"limit": 2, "before": first_page[-1]["ts"], "before_id": first_page[-1]["id"]},
+        headers=player1_headers
+    ).json()
+    assert [m["content"] for m in second_page] == ["clue 0"]
+    session.expire_all()
+    assert session.get(UnreadCount, "player1").count == 0
+
+def test_inbox_pages_through_rows_with_the_same_ts(client: TestClient, session: Session):
+    """Test that the (ts, id) cursor neither skips nor repeats messages sent at the same instant"""
+    sent_at = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(5):
+        session.add(DirectMessage(admin_username="admin", user_username="player1", content=f"clue {i}", ts=sent_at))
+    session.commit()
+    player1_headers = {"Authorization": f"Bearer {get_token(client, 'player1', 'player1pass')}"}
+
+    seen = []
+    params = {"limit": 2}
+    while True:
+        page = client.get("/api/direct-messages/received", params=params, headers=player1_headers).json()
+        if not page:
+            break
+        seen.extend(m["content"] for m in page)
+        params = {"limit": 2, "before": page[-1]["ts"], "before_id": page[-1]["id"]}
+    assert seen == [f"clue {i}" for i in reversed(range(5))]
+
+def test_inbox_page_uses_index_order(session: Session):
+    """Test that an inbox page is read in index order instead of sorting the whole inbox"""
+    plan = session.exec(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM directmessage WHERE user_username = 'player1' "
+        "AND (ts, id) < ('2024-01-01', 10) ORDER BY ts DESC, id DESC LIMIT 50"
+    )).all()
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_directmessage_user_ts_id" in details
+    assert "TEMP B-TREE" not in details
+
+def test_broadcast_direct_messages(client: TestClient, session: Session):
+    """Test broadcasting to a persona group and to an explicit recipient list"""
+    session.add(User(username="player2", pw_hash=get_password_hash("player2pass"), role="player"))
+    session.add(Persona(username="player1", group="outie", description="Outie"))
+    session.add(Persona(username="player2", group="innie", description="Innie"))
+    session.commit()
+    admin_token = get_token(client, "admin", "adminpass")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.post(
+        "/api/direct-messages/broadcast",
+        headers=headers,
+        json={"target": "innies", "content": "innie clue"}
+    )
+    assert response.status_code == 200
+    assert [m["user_username"] for m in response.json()] == ["player2"]
+
+    response = client.post(
+        "/api/direct-messages/broadcast",
+        headers=headers,
+        json={"recipients": ["player1", "player2", "player1"], "content": "everyone"}
+    )
+    assert response.status_code == 200
+    assert [m["user_username"] for m in response.json()] == ["player1", "player2"]
+    assert all(m["id"] is not None and not m["is_read"] for m in response.json())
+
+    assert session.get(UnreadCount, "player1").count == 1
+    assert session.get(UnreadCount, "player2").count == 2
+
+    # Unknown recipients reject the whole broadcast
+    response = client.post(
+        "/api/direct-messages/broadcast",
+        headers=headers,
+        json={"recipients": ["player1", "nobody"], "content": "lost"}
+    )
+    assert response.status_code == 404
+    assert "nobody" in response.json()["detail"]
+
+    response = client.post(
+        "/api/direct-messages/broadcast",
+        headers=headers,
+        json={"target": "everyone", "content": "lost"}
+    )
+    assert response.status_code == 400
+
+    messages = session.exec(select(DirectMessage).where(DirectMessage.content == "lost")).all()
+    assert messages == []
@@ -0,0 +1,229 @@
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from api.main import app
+from api.database import DEFAULT_GAME, Game, GameRegistry, games, get_game, get_session
+from api.models import User, Persona, Room
+from api.auth import get_password_hash
+from api import routes, seed_data
+
+SEED = {
+    "users": [
+        {"username": "host", "password_plain": "seedpass", "role": "admin"},
+        {"username": "player1", "password_plain": "player1pass", "role": "player"},
+        {"username": "player2", "password_plain": "player2pass", "role": "player"},
+    ],
+    "personas": {
+        "outies": {"player1": "Desk by the window"},
+        "innies": {"player2": "Cubicle A1"},
+    },
+    "clues_regular": {"player1": ["likes tea"]},
+    "clues_murder": {"to_outies": ["outie clue"], "to_innies": ["innie clue"]},
+}
+
+# Create an in-memory SQLite database for the default game
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", pw_hash=get_password_hash("adminpass"), role="admin"))
+        session.add(User(username="player1", pw_hash=get_password_hash("defaultpass"), role="player"))
+        session.add(User(username="player2", pw_hash=get_password_hash("defaultpass"), role="player"))
+        session.commit()
+        yield session
+
+# Override the get_session dependency for the default game only; other games use their shards
+@pytest.fixture(name="client")
+def client_fixture(session: Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(games, "directory", str(tmp_path))
+    monkeypatch.setattr(seed_data, "SEED_HASH_CACHE_PATH", str(tmp_path / "seed_hashes.json"))
+    monkeypatch.setattr(games, "_games", {DEFAULT_GAME: games.default})
+
+    def get_session_override(game: Game = Depends(get_game)):
+        if game.id == DEFAULT_GAME:
+            yield session
+            return
+        with Session(game.engine, expire_on_commit=False) as game_session:
+            yield game_session
+
+    app.dependency_overrides[get_session] = get_session_override
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+    games.dispose()
+
+def get_token(client: TestClient, username: str, password: str, game_id: str = DEFAULT_GAME):
+    """Helper function to get auth token"""
+    prefix = "/api" if game_id == DEFAULT_GAME else f"/api/games/{game_id}"
+    response = client.post(
+        f"{prefix}/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+def create_game(client: TestClient, game_id: str = "party"):
+    admin_token = get_token(client, "admin", "adminpass")
+    return client.post(
+        "/api/games",
+        json={"id": game_id, "admin_password": "partyhost", "seed": SEED},
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+def test_create_game(client: TestClient, tmp_path):
+    """Test creating a game from a custom seed set"""
+    response = create_game(client)
+    assert response.status_code == 201
+    assert response.json() == {"id": "party"}
+    assert (tmp_path / "party.db").exists()
+    # A custom seed set's passwords are never written to the seed hash cache
+    assert not (tmp_path / "seed_hashes.json").exists()
+
+    # The admin password given for the game replaces the seed set's
+    assert client.post("/api/games/party/login", data={"username": "host", "password": "seedpass"}).status_code == 401
+    token = get_token(client, "host", "partyhost", "party")
+    response = client.get("/api/games/party/clues/murder", headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == SEED["clues_murder"]
+
+    admin_token = get_token(client, "admin", "adminpass")
+    response = client.get("/api/games", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.json() == [{"id": "default"}, {"id": "party"}]
+
+    assert create_game(client).status_code == 409
+    assert create_game(client, "Not A Game").status_code == 400
+
+def test_games_require_server_admin(client: TestClient):
+    """Test that only the default game's admins can create games"""
+    create_game(client)
+    token = get_token(client, "host", "partyhost", "party")
+    response = client.post(
+        "/api/games",
+        json={"id": "other", "admin_password": "x"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 401
+
+def test_tokens_only_work_in_their_game(client: TestClient):
+    """Test that a token is rejected by every game but the one it was issued in"""
+    create_game(client)
+    # Same username in both games, different passwords
+    default_token = get_token(client, "player1", "defaultpass")
+    party_token = get_token(client, "player1", "player1pass", "party")
+
+    assert client.get("/api/me", headers={"Authorization": f"Bearer {default_token}"}).status_code == 200
+    assert client.get("/api/games/party/me", headers={"Authorization": f"Bearer {party_token}"}).status_code == 200
+    assert client.get("/api/games/party/me", headers={"Authorization": f"Bearer {default_token}"}).status_code == 401
+    assert client.get("/api/me", headers={"Authorization": f"Bearer {party_token}"}).status_code == 401
+
+def test_games_have_separate_rooms(client: TestClient, session: Session):
+    """Test that a game's rooms live in its own shard"""
+    create_game(client)
+    host_token = get_token(client, "host", "partyhost", "party")
+    response = client.post(
+        "/api/games/party/rooms",
+        json={"playerA": "player1", "playerB": "player2"},
+        headers={"Authorization": f"Bearer {host_token}"}
+    )
+    assert response.status_code == 200
+    code4 = response.json()["code4"]
+
+    player_token = get_token(client, "player1", "player1pass", "party")
+    response = client.post(
+        f"/api/games/party/rooms/{code4}/msg",
+        json={"content": "hello party"},
+        headers={"Authorization": f"Bearer {player_token}"}
+    )
+    assert response.status_code == 200
+    response = client.get(f"/api/games/party/rooms/{code4}/messages", headers={"Authorization": f"Bearer {player_token}"})
+    assert [message["content"] for message in response.json()] == ["hello party"]
+
+    # The room lives in the game's shard, not in the default database
+    assert session.exec(select(Room)).all() == []
+    admin_token = get_token(client, "admin", "adminpass")
+    assert client.get("/api/rooms", headers={"Authorization": f"Bearer {admin_token}"}).json() == []
+    default_player_token = get_token(client, "player1", "defaultpass")
+    response = client.get(f"/api/rooms/{code4}", headers={"Authorization": f"Bearer {default_player_token}"})
+    assert response.status_code == 404
+
+def test_persona_changes_invalidate_the_game_cache(client: TestClient):
+    """Test that a persona written in a shard bumps that game's cached personas"""
+    create_game(client)
+    headers = {"Authorization": f"Bearer {get_token(client, 'player1', 'player1pass', 'party')}"}
+    response = client.get("/api/games/party/personas", headers=headers)
+    etag = response.headers["etag"]
+    assert client.get("/api/games/party/personas", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    with Session(games.loaded("party").engine) as game_session:
+        persona = game_session.exec(select(Persona).where(Persona.username == "player2")).one()
+        persona.description = "Moved to Optics and Design"
+        game_session.add(persona)
+        game_session.commit()
+
+    response = client.get("/api/games/party/personas", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert "Moved to Optics and Design" in [p["description"] for p in response.json()]
+
+def test_create_game_rejects_bad_seeds(client: TestClient, tmp_path):
+    """Test that a seed set without an admin or with repeated players is rejected before the game is created"""
+    admin_token = get_token(client, "admin", "adminpass")
+    no_admin = {**SEED, "users": [user for user in SEED["users"] if user["role"] != "admin"]}
+    repeated_user = {**SEED, "users": SEED["users"] + [{"username": "player1", "password_plain": "x", "role": "player"}]}
+    repeated_persona = {**SEED, "personas": {"outies": {"player1": "Desk"}, "innies": {"player1": "Cubicle"}}}
+    for seed in (no_admin, repeated_user, repeated_persona):
+        response = client.post(
+            "/api/games",
+            json={"id": "party", "admin_password": "partyhost", "seed": seed},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 422
+    assert list(tmp_path.iterdir()) == []
+
+def test_failed_seeding_frees_the_game_id(client: TestClient, tmp_path, monkeypatch):
+    """Test that a game whose seeding fails is deleted, so its id can be used again"""
+    seed_database = routes.seed_database
+    calls = []
+    def fail_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("seeding failed")
+        seed_database(*args)
+    monkeypatch.setattr(routes, "seed_database", fail_once)
+
+    with pytest.raises(RuntimeError):
+        create_game(client)
+    assert list(tmp_path.iterdir()) == []
+    assert games.loaded("party") is None
+    assert create_game(client).status_code == 201
+
+def test_unreadable_clues_are_an_error(client: TestClient, tmp_path):
+    """Test that a game whose clues file is unreadable doesn't serve the default game's clues"""
+    create_game(client)
+    (tmp_path / "party.clues.json").write_text("not json")
+    games.dispose()
+    games._games.pop("party")
+
+    token = get_token(client, "host", "partyhost", "party")
+    response = client.get("/api/games/party/clues/murder", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 500
+
+def test_unknown_game(client: TestClient):
+    """Test requesting a game that doesn't exist"""
+    response = client.post("/api/games/nope/login", data={"username": "admin", "password": "adminpass"})
+    assert response.status_code == 404
+
+def test_create_claims_the_shard_before_writing_clues(tmp_path):
+    """Test that a worker losing the race for a game id leaves the winner's clues alone"""
+    registry = GameRegistry(str(tmp_path))
+    # Another worker has claimed the id and written its clues
+    (tmp_path / "party.db").touch()
+    (tmp_path / "party.clues.json").write_text('{"clues_regular": {}}')
+
+    with pytest.raises(FileExistsError):
+        registry.create("party", {"clues_regular": {"player1": ["overwritten"]}})
+    assert (tmp_path / "party.clues.json").read_text() == '{"clues_regular": {}}'
+    assert [path.name for path in tmp_path.iterdir() if path.name.endswith(".tmp")] == []
@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from api.main import app
+from api.database import get_session
+from api.models import User, Room
+from api.auth import get_password_hash
+from api.metrics import Histogram, registry
+
+# Create an in-memory SQLite database for testing
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", pw_hash=get_password_hash("adminpass"), role="admin"))
+        session.add(User(username="player1", pw_hash=get_password_hash("player1pass"), role="player"))
+        session.add(Room(code4="MTRC", playerA="player1", playerB="admin"))
+        session.commit()
+
+        yield session
+
+# Override the get_session dependency
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    def get_session_override():
+        return session
+
+    app.dependency_overrides[get_session] = get_session_override
+    registry.clear()
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+def get_token(client: TestClient, username: str, password: str):
+    """Helper function to get auth token"""
+    response = client.post(
+        "/api/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+def test_metrics_by_route_template(client: TestClient):
+    """Test that requests are counted under their route template with SQL work"""
+    player1_token = get_token(client, "player1", "player1pass")
+    headers = {"Authorization": f"Bearer {player1_token}"}
+    client.post("/api/rooms/MTRC/msg", headers=headers, json={"content": "hello"})
+    client.get("/api/rooms/MTRC/messages", headers=headers)
+
+    admin_token = get_token(client, "admin", "adminpass")
+    response = client.get("/api/metrics", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    assert 'http_requests_total{route="/api/rooms/{code4}/messages",method="GET",status="200"} 1' in text
+    assert 'http_requests_total{route="/api/login",method="POST",status="200"} 2' in text
+    assert 'http_request_duration_seconds_count{route="/api/rooms/{code4}/msg",method="POST"} 1' in text
+    assert 'rate_limit_rejections{limiter="messages"} 0' in text
+    assert 'rate_limit_tracked_keys{limiter="logins"} 2' in text
+    assert "bcrypt_queue_depth 0" in text
+    # The history page ran at least one query on behalf of its request
+    sql_count = [line for line in text.splitlines() if line.startswith('http_request_sql_queries_bucket{route="/api/rooms/{code4}/messages",le="0"}')]
+    assert sql_count == ['http_request_sql_queries_bucket{route="/api/rooms/{code4}/messages",le="0"} 0']
+
+def test_metrics_require_admin(client: TestClient):
+    """Test that players can't read metrics"""
+    player1_token = get_token(client, "player1", "player1pass")
+    response = client.get("/api/metrics", headers={"Authorization": f"Bearer {player1_token}"})
+    assert response.status_code == 403
+    assert client.get("/api/metrics").status_code == 401
+
+def test_histogram_buckets_are_cumulative():
+    """Test the Prometheus histogram rendering"""
+    histogram = Histogram("latency_seconds", "Test latency", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "/x")
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/x",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/x"} 3' in lines
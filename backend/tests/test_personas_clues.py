@@ -1,13 +1,13 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
 from api.main import app
 from api.database import get_session
 from api.models import User, Persona
-from api.auth import get_password_hash
-from api.seed_data import SEED_DATA
+from api.auth import get_password_hash, verify_password
+from api.seed_data import SEED_DATA, hash_seed_passwords
 
 # Create an in-memory SQLite database for testing
 @pytest.fixture(name="session")
@@ -105,6 +105,27 @@ def test_get_personas(client: TestClient):
     assert reena_persona["group"] == "innie"
     assert "Cubicle G12" in reena_persona["description"]
 
+def test_personas_conditional_get(client: TestClient, session: Session):
+    """Test that personas answer 304 until a persona changes"""
+    token = get_token(client, "Dhruv", "dhruvpass")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/api/personas", headers=headers)
+    etag = response.headers["etag"]
+
+    response = client.get("/api/personas", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    persona = session.exec(select(Persona).where(Persona.username == "Reena")).one()
+    persona.description = "Moved to Optics and Design"
+    session.add(persona)
+    session.commit()
+
+    response = client.get("/api/personas", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "Moved to Optics and Design" in [p["description"] for p in response.json()]
+
 def test_get_clues(client: TestClient):
     """Test retrieving clues for a user"""
     # Get Dhruv's token
@@ -177,3 +198,18 @@ def test_get_murder_clues(client: TestClient):
     )
     
     assert response.status_code == 403
+
+def test_seed_hashes_are_cached(tmp_path):
+    """Test that seed password hashes are persisted and reused per password/cost pair"""
+    cache_path = str(tmp_path / "seed_hashes.json")
+
+    first = hash_seed_passwords(["bike123", "silver22"], rounds=4, cache_path=cache_path)
+    assert verify_password("bike123", first["bike123"])
+
+    second = hash_seed_passwords(["bike123", "silver22"], rounds=4, cache_path=cache_path)
+    assert second == first
+
+    # A different cost is a different cache entry
+    third = hash_seed_passwords(["bike123"], rounds=5, cache_path=cache_path)
+    assert third["bike123"] != first["bike123"]
+    assert verify_password("bike123", third["bike123"])
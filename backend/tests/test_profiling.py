@@ -0,0 +1,89 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from api.main import app
+from api.database import games, get_session
+from api.models import User, Room, Message
+from api.auth import get_password_hash
+from api.profiling import profile_store
+
+# Create an in-memory SQLite database for testing
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", pw_hash=get_password_hash("adminpass"), role="admin"))
+        session.add(User(username="player1", pw_hash=get_password_hash("player1pass"), role="player"))
+        room = Room(code4="PROF", playerA="player1", playerB="admin")
+        session.add(room)
+        session.commit()
+        session.refresh(room)
+        for i in range(20):
+            session.add(Message(room_id=room.id, sender="player1", content=f"message {i}"))
+        session.commit()
+
+        yield session
+
+# Override the get_session dependency
+@pytest.fixture(name="client")
+def client_fixture(session: Session, monkeypatch):
+    def get_session_override():
+        return session
+
+    app.dependency_overrides[get_session] = get_session_override
+    # The middleware checks admins against the default game's own database
+    monkeypatch.setattr(games.default, "engine", session.get_bind())
+    profile_store.clear()
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+def get_token(client: TestClient, username: str, password: str):
+    """Helper function to get auth token"""
+    response = client.post(
+        "/api/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+def test_admin_can_profile_a_request(client: TestClient):
+    """Test that a flagged admin request is profiled with its SQL"""
+    admin_token = get_token(client, "admin", "adminpass")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.get("/api/rooms/PROF/messages", headers={**headers, "X-Profile": "1"})
+    assert response.status_code == 200
+    assert len(response.json()) == 20
+    profile_id = response.headers["x-profile-id"]
+
+    response = client.get(f"/api/profiles/{profile_id}?format=json", headers=headers)
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["path"] == "/api/rooms/PROF/messages"
+    assert profile["status"] == 200
+    assert any("FROM message" in query["sql"] for query in profile["queries"])
+
+    response = client.get(f"/api/profiles/{profile_id}", headers=headers)
+    assert response.status_code == 200
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+
+    response = client.get("/api/profiles", headers=headers)
+    assert [p["id"] for p in response.json()] == [profile_id]
+
+def test_profile_flag_ignored_for_players(client: TestClient):
+    """Test that only admins can turn profiling on"""
+    player1_token = get_token(client, "player1", "player1pass")
+    response = client.get(
+        "/api/rooms/PROF/messages?profile=1",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert profile_store.list() == []
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from api.models import RateLimitBucket
+from api.ratelimit import RateLimiter, SharedRateLimiter, SyncedRateLimiter
+
+def test_token_bucket_allows_burst_then_refills():
+    """Test that a key gets its burst, is rejected, and recovers at the refill rate"""
+    limiter = RateLimiter(per_minute=60, burst=3)
+
+    results = [limiter.hit("player1", now=0.0) for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[2].remaining == 0
+    assert limiter.rejections == 1
+    assert results[3].headers()["Retry-After"] == "1"
+
+    # One token per second comes back
+    assert limiter.hit("player1", now=1.0).allowed
+    assert not limiter.hit("player1", now=1.0).allowed
+
+    # Other keys have their own bucket
+    assert limiter.hit("player2", now=1.0).allowed
+
+def test_idle_keys_are_expired_and_memory_is_bounded():
+    """Test that idle buckets are dropped and the number of keys never exceeds max_keys"""
+    limiter = RateLimiter(per_minute=60, burst=3, max_keys=2)
+
+    limiter.hit("a", now=0.0)
+    limiter.hit("b", now=0.0)
+    limiter.hit("c", now=0.0)
+    assert len(limiter) == 2
+
+    # After a full refill period the old buckets carry no state and are dropped
+    limiter.hit("d", now=10.0)
+    assert len(limiter) == 1
+
+def test_concurrent_hits_do_not_corrupt_buckets():
+    """Test that threadpool workers checking and expiring keys at once never raise"""
+    limiter = RateLimiter(per_minute=60000, burst=5, max_keys=16)
+
+    def hammer(worker):
+        for i in range(3000):
+            limiter.hit(f"player{(worker * 7 + i) % 64}")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(hammer, range(8)))
+    assert len(limiter) <= 16
+
+def test_shared_limiter_matches_in_memory_buckets():
+    """Test that database buckets give the same burst, rejection and refill as the in-memory ones"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    # Two workers' limiters over the same database share the bucket
+    first = SharedRateLimiter("messages", per_minute=60, burst=3, engine=engine)
+    second = SharedRateLimiter("messages", per_minute=60, burst=3, engine=engine)
+
+    results = [first.hit("player1", now=0.0), second.hit("player1", now=0.0), first.hit("player1", now=0.0), second.hit("player1", now=0.0)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[2].remaining == 0
+    assert results[3].headers()["Retry-After"] == "1"
+    assert second.rejections == 1
+
+    assert first.hit("player1", now=1.0).allowed
+    assert not second.hit("player1", now=1.0).allowed
+    assert second.hit("player2", now=1.0).allowed
+
+    # Limiters with other names keep separate buckets
+    assert SharedRateLimiter("logins", per_minute=60, burst=3, engine=engine).hit("player1", now=1.0).allowed
+    assert len(first) == 2
+    first.clear()
+    assert len(first) == 0
+
+def test_shared_limiter_prunes_idle_buckets_on_demand():
+    """Test that idle database buckets are only dropped by prune, not by hits"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    limiter = SharedRateLimiter("messages", per_minute=60, burst=3, engine=engine)
+    limiter.hit("idle", now=0.0)
+    limiter.hit("busy", now=10.0)
+
+    limiter.prune(now=10.0)
+    assert len(limiter) == 1
+
+def test_synced_limiters_share_spent_tokens():
+    """Test that synced limiters charge locally and see each other's spending after a sync"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    first = SyncedRateLimiter("stream", per_minute=60, burst=4, engine=engine)
+    second = SyncedRateLimiter("stream", per_minute=60, burst=4, engine=engine)
+
+    # Checks cost no database writes until the sync
+    assert first.hit("player1", now=0.0).allowed
+    assert first.hit("player1", now=0.0).allowed
+    assert first.hit("player1", now=0.0).allowed
+    with Session(engine) as session:
+        assert session.exec(select(RateLimitBucket)).all() == []
+
+    first.sync(now=100.0)
+    second.hit("player1", now=0.0)
+    second.sync(now=100.0)
+    # Between them they spent all four tokens
+    assert not second.hit("player1", now=0.0).allowed
+    first.sync(now=100.0)
+    assert not first.hit("player1", now=0.0).allowed
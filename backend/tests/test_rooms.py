@@ -1,12 +1,17 @@
+import asyncio
 import pytest
+from fastapi import WebSocketDisconnect
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
 from api.main import app
 from api.database import get_session
-from api.models import User, Room, Message
+from api.models import User, Persona, Room, Message, RoomPresence
 from api.auth import get_password_hash
+from api.pairing import round_robin
+from api.realtime import RoomNotifier, RoomSubscription
+from api.rooms import RoomCodePool, room_directory
 
 # Create an in-memory SQLite database for testing
 @pytest.fixture(name="session")
@@ -84,6 +89,108 @@ def test_create_room(client: TestClient):
     assert data["playerB"] == "player2"
     assert "created_at" in data
 
+def test_round_robin_meets_everyone_once():
+    """Test that successive generated rounds pair every outie with every innie exactly once"""
+    outies, innies = ["o1", "o2", "o3"], ["i1", "i2", "i3", "i4"]
+    previous = []
+    for _ in range(4):
+        pairs, unpaired = round_robin(outies, innies, previous)
+        assert len(pairs) == 3 and len(unpaired) == 1
+        assert all(outie in outies and innie in innies for outie, innie in pairs)
+        previous.extend(pairs)
+    assert len(set(previous)) == 12
+
+    # An explicit round is just that rotation
+    assert round_robin(outies, innies, round=1)[0] == [("o1", "i2"), ("o2", "i3"), ("o3", "i4")]
+
+def test_bulk_create_rooms(client: TestClient, session: Session):
+    """Test creating a round of rooms from given pairings and from persona groups"""
+    admin_token = get_token(client, "admin", "adminpass")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.post("/api/rooms/bulk", headers=headers, json={
+        "pairings": [{"playerA": "player1", "playerB": "player2"}, {"playerA": "player3", "playerB": "admin"}]
+    })
+    assert response.status_code == 200
+    rooms = response.json()["rooms"]
+    assert [(room["playerA"], room["playerB"]) for room in rooms] == [("player1", "player2"), ("player3", "admin")]
+    assert len({room["code4"] for room in rooms}) == 2
+    # The new rooms resolve right away
+    assert client.get(f"/api/rooms/{rooms[0]['code4']}", headers=headers).status_code == 200
+
+    # Validation happens before anything is written
+    for body, status_code in (
+        ({"pairings": [{"playerA": "player1", "playerB": "ghost"}]}, 404),
+        ({"pairings": [{"playerA": "player1", "playerB": "player2"}, {"playerA": "player1", "playerB": "player3"}]}, 400),
+        ({"pairings": [], "generate": "round_robin"}, 400),
+        ({"generate": "random"}, 400),
+    ):
+        assert client.post("/api/rooms/bulk", headers=headers, json=body).status_code == status_code
+    assert len(client.get("/api/rooms", headers=headers).json()) == 2
+
+    # Generated rounds pair outies with innies and move on to new partners
+    session.add(Persona(username="player1", group="outie", description="a"))
+    session.add(Persona(username="player2", group="innie", description="b"))
+    session.add(Persona(username="player3", group="innie", description="c"))
+    session.commit()
+    first = client.post("/api/rooms/bulk", headers=headers, json={"generate": "round_robin"}).json()
+    second = client.post("/api/rooms/bulk", headers=headers, json={"generate": "round_robin"}).json()
+    assert [(room["playerA"], room["playerB"]) for room in first["rooms"]] == [("player1", "player3")]
+    assert first["unpaired"] == ["player2"]
+    assert [(room["playerA"], room["playerB"]) for room in second["rooms"]] == [("player1", "player2")]
+
+    # Players can't start rounds
+    player_token = get_token(client, "player1", "player1pass")
+    response = client.post("/api/rooms/bulk", headers={"Authorization": f"Bearer {player_token}"}, json={"generate": "round_robin"})
+    assert response.status_code == 403
+
+def test_room_code_pool_skips_taken_codes():
+    """Test that the pool never hands out a taken code or the same code twice"""
+    pool = RoomCodePool(refill_size=50)
+    taken = set(pool._candidates(10))
+    pool._position = 0
+
+    class Codes:
+        async def existing_room_codes(self, codes):
+            return [code for code in codes if code in taken]
+
+    codes = asyncio.run(pool.take(40, Codes()))
+    codes += asyncio.run(pool.take(40, Codes()))
+    assert len(set(codes)) == 80
+    assert not taken & set(codes)
+    assert all(len(code) == 4 for code in codes)
+
+def test_dashboard_summarizes_every_room(client: TestClient, session: Session):
+    """Test that the dashboard reports counts, last message and last-seen times for all rooms at once"""
+    admin_token = get_token(client, "admin", "adminpass")
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    player1_headers = {"Authorization": f"Bearer {get_token(client, 'player1', 'player1pass')}"}
+
+    busy = client.post("/api/rooms", headers=admin_headers, json={"playerA": "player1", "playerB": "player2"}).json()["code4"]
+    quiet = client.post("/api/rooms", headers=admin_headers, json={"playerA": "player2", "playerB": "player3"}).json()["code4"]
+    for i in range(3):
+        client.post(f"/api/rooms/{busy}/msg", headers=player1_headers, json={"content": f"line {i}"})
+
+    # Admin visits don't count as a participant being seen
+    client.get(f"/api/rooms/{quiet}", headers=admin_headers)
+
+    response = client.get("/api/dashboard", headers=admin_headers)
+    assert response.status_code == 200
+    rooms = {room["code4"]: room for room in response.json()}
+    assert rooms[busy]["message_count"] == 3
+    assert rooms[busy]["last_message"]["content"] == "line 2"
+    assert rooms[busy]["last_activity"] == rooms[busy]["last_message"]["ts"]
+    assert rooms[busy]["last_seen"]["player1"] is not None
+    assert rooms[busy]["last_seen"]["player2"] is None
+    assert rooms[quiet] == {**rooms[quiet], "message_count": 0, "last_message": None, "last_activity": None}
+    assert rooms[quiet]["last_seen"] == {"player2": None, "player3": None}
+
+    # The last-seen time was also stored, for other workers
+    assert [presence.username for presence in session.exec(select(RoomPresence)).all()] == ["player1"]
+
+    # Players can't see the dashboard
+    assert client.get("/api/dashboard", headers=player1_headers).status_code == 403
+
 def test_non_admin_cannot_create_room(client: TestClient):
     """Test that non-admin users cannot create rooms"""
     # Get player token
@@ -192,3 +299,190 @@ def test_admin_can_access_any_room(client: TestClient, session: Session):
     assert response.status_code == 200
     data = response.json()
     assert data["code4"] == "ADMN"
+
+def test_stream_returns_new_messages(client: TestClient, session: Session):
+    """Test that the stream endpoint returns messages after the given id"""
+    room = Room(code4="STRM", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+
+    player1_token = get_token(client, "player1", "player1pass")
+    first = client.post(
+        "/api/rooms/STRM/msg",
+        headers={"Authorization": f"Bearer {player1_token}"},
+        json={"content": "first"}
+    ).json()
+    client.post(
+        "/api/rooms/STRM/msg",
+        headers={"Authorization": f"Bearer {player1_token}"},
+        json={"content": "second"}
+    )
+
+    response = client.get(
+        f"/api/rooms/STRM/stream?after={first['id']}",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert response.status_code == 200
+    messages = response.json()
+    assert [m["content"] for m in messages] == ["second"]
+    # Encoded straight from rows: exactly the MessageResponse fields, and the rate limit headers survive
+    assert set(messages[0]) == {"id", "sender", "content", "ts"}
+    assert "X-RateLimit-Remaining" in response.headers
+
+    # Nothing newer: the request parks until the (short) timeout and returns nothing
+    response = client.get(
+        f"/api/rooms/STRM/stream?after={messages[0]['id']}&timeout=0.05",
+        headers={"Authorization": f"Bearer {player1_token}"}
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+def test_parked_stream_holds_no_connection(client: TestClient, session: Session, monkeypatch):
+    """Test that a stream request gives its database connection back before it parks"""
+    session.add(Room(code4="PARK", playerA="player1", playerB="player2"))
+    session.commit()
+    player1_token = get_token(client, "player1", "player1pass")
+
+    in_transaction = []
+    wait = RoomSubscription.wait
+    async def recording_wait(self, timeout):
+        in_transaction.append(session.in_transaction())
+        return await wait(self, timeout)
+    monkeypatch.setattr(RoomSubscription, "wait", recording_wait)
+
+    response = client.get("/api/rooms/PARK/stream?timeout=0.01", headers={"Authorization": f"Bearer {player1_token}"})
+    assert response.json() == []
+    assert in_transaction == [False]
+
+def test_room_notifier_wakes_only_that_room():
+    """Test that notifying a room wakes its waiters and no others"""
+    notifier = RoomNotifier()
+
+    async def scenario():
+        with notifier.subscribe("AAAA") as a, notifier.subscribe("BBBB") as b:
+            assert notifier.waiter_count("AAAA") == 1
+            asyncio.get_running_loop().call_later(0.01, notifier.notify, "AAAA")
+            woke_a, woke_b = await asyncio.gather(a.wait(1), b.wait(0.05))
+        return woke_a, woke_b
+
+    assert asyncio.run(scenario()) == (True, False)
+    assert notifier.waiter_count("AAAA") == 0
+
+def test_websocket_broadcasts_messages(client: TestClient, session: Session):
+    """Test that room sockets receive messages posted over HTTP and over the socket"""
+    room = Room(code4="SOCK", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+
+    player1_token = get_token(client, "player1", "player1pass")
+    player2_token = get_token(client, "player2", "player2pass")
+
+    with client.websocket_connect(f"/api/rooms/SOCK/ws?token={player1_token}") as ws1, \
+            client.websocket_connect(f"/api/rooms/SOCK/ws?token={player2_token}") as ws2:
+        client.post(
+            "/api/rooms/SOCK/msg",
+            headers={"Authorization": f"Bearer {player1_token}"},
+            json={"content": "over http"}
+        )
+        assert ws1.receive_json()["content"] == "over http"
+        assert ws2.receive_json()["content"] == "over http"
+
+        ws2.send_json({"content": "over the socket"})
+        received = ws1.receive_json()
+        assert received["sender"] == "player2"
+        assert received["content"] == "over the socket"
+        assert ws2.receive_json()["id"] == received["id"]
+
+def test_websocket_rejects_non_members(client: TestClient, session: Session):
+    """Test that players outside the room cannot open its socket"""
+    room = Room(code4="PRIV", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+
+    player3_token = get_token(client, "player3", "player3pass")
+    with pytest.raises(WebSocketDisconnect) as excinfo:
+        with client.websocket_connect(f"/api/rooms/PRIV/ws?token={player3_token}") as ws:
+            ws.receive_json()
+    assert excinfo.value.code == 1008
+
+def test_message_history_pages_by_id(client: TestClient, session: Session):
+    """Test keyset pagination of room history with before/after cursors"""
+    room = Room(code4="PAGE", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+    session.refresh(room)
+    for i in range(5):
+        session.add(Message(room_id=room.id, sender="player1", content=f"message {i}"))
+    session.commit()
+
+    player1_token = get_token(client, "player1", "player1pass")
+    headers = {"Authorization": f"Bearer {player1_token}"}
+
+    latest = client.get("/api/rooms/PAGE/messages?limit=2", headers=headers).json()
+    assert [m["content"] for m in latest] == ["message 3", "message 4"]
+
+    older = client.get(f"/api/rooms/PAGE/messages?limit=2&before={latest[0]['id']}", headers=headers).json()
+    assert [m["content"] for m in older] == ["message 1", "message 2"]
+
+    newer = client.get(f"/api/rooms/PAGE/messages?limit=2&after={older[0]['id']}", headers=headers).json()
+    assert [m["content"] for m in newer] == ["message 2", "message 3"]
+
+    response = client.get("/api/rooms/PAGE/messages?limit=1000", headers=headers)
+    assert response.status_code == 422
+
+def test_message_history_conditional_get(client: TestClient, session: Session):
+    """Test that unchanged history answers 304 and a new message invalidates it"""
+    room = Room(code4="ETAG", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+
+    player1_token = get_token(client, "player1", "player1pass")
+    headers = {"Authorization": f"Bearer {player1_token}"}
+    client.post("/api/rooms/ETAG/msg", headers=headers, json={"content": "first"})
+
+    response = client.get("/api/rooms/ETAG/messages", headers=headers)
+    etag = response.headers["etag"]
+    response = client.get("/api/rooms/ETAG/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/api/rooms/ETAG/msg", headers=headers, json={"content": "second"})
+    response = client.get("/api/rooms/ETAG/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [m["content"] for m in response.json()] == ["first", "second"]
+
+def test_room_directory_tracks_create_and_delete(client: TestClient):
+    """Test that rooms created and deleted through the API resolve without a database lookup"""
+    admin_token = get_token(client, "admin", "adminpass")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    code4 = client.post("/api/rooms", headers=headers, json={"playerA": "player1", "playerB": "player2"}).json()["code4"]
+    entry = room_directory.get(code4)
+    assert entry is not None
+    assert (entry.playerA, entry.playerB) == ("player1", "player2")
+
+    response = client.delete(f"/api/rooms/{code4}", headers=headers)
+    assert response.status_code == 200
+    assert room_directory.get(code4) is None
+    assert client.get(f"/api/rooms/{code4}", headers=headers).status_code == 404
+
+def test_message_rate_limit_headers(client: TestClient, session: Session):
+    """Test that posting reports remaining quota and answers 429 once it is spent"""
+    room = Room(code4="RATE", playerA="player1", playerB="player2")
+    session.add(room)
+    session.commit()
+
+    player1_token = get_token(client, "player1", "player1pass")
+    headers = {"Authorization": f"Bearer {player1_token}"}
+
+    response = client.post("/api/rooms/RATE/msg", headers=headers, json={"content": "hi"})
+    assert response.status_code == 200
+    limit = int(response.headers["X-RateLimit-Limit"])
+    assert int(response.headers["X-RateLimit-Remaining"]) == limit - 1
+
+    for _ in range(limit - 1):
+        client.post("/api/rooms/RATE/msg", headers=headers, json={"content": "spam"})
+
+    response = client.post("/api/rooms/RATE/msg", headers=headers, json={"content": "one too many"})
+    assert response.status_code == 429
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+    assert "Retry-After" in response.headers
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.pool import StaticPool
+
+from api.models import Room, Message
+from api.writer import GroupCommitWriter
+
+def make_engine():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Room(code4="GRPC", playerA="player1", playerB="player2"))
+        session.commit()
+    return engine
+
+def test_concurrent_inserts_share_one_commit():
+    """Test that inserts submitted together are committed as one batch with ids assigned"""
+    engine = make_engine()
+    writer = GroupCommitWriter(engine, window_seconds=0.05)
+
+    def insert(content):
+        def add(session):
+            message = Message(room_id=1, sender="player1", content=content)
+            session.add(message)
+            return message
+        return add
+
+    async def scenario():
+        return await asyncio.gather(*(writer.submit(insert(f"line {i}")) for i in range(10)))
+
+    messages = asyncio.run(scenario())
+    assert writer.batches == 1
+    assert sorted(m.id for m in messages) == list(range(1, 11))
+    assert all(m.ts is not None for m in messages)
+
+    with Session(engine) as session:
+        assert len(session.exec(select(Message)).all()) == 10
+
+def test_failed_write_does_not_fail_the_batch():
+    """Test that one failing write only fails its own caller"""
+    engine = make_engine()
+    writer = GroupCommitWriter(engine, window_seconds=0.05)
+
+    def good(session):
+        message = Message(room_id=1, sender="player1", content="fine")
+        session.add(message)
+        return message
+
+    def bad(session):
+        # Duplicate code4 violates the unique index at commit time
+        session.add(Room(code4="GRPC", playerA="x", playerB="y"))
+
+    async def scenario():
+        return await asyncio.gather(writer.submit(good), writer.submit(bad), writer.submit(good), return_exceptions=True)
+
+    first, second, third = asyncio.run(scenario())
+    assert first.content == "fine" and third.content == "fine"
+    assert isinstance(second, Exception)
+
+def test_close_waits_for_the_batch_being_committed():
+    """Test that closing the writer lets an in-flight commit finish and resolve its callers"""
+    engine = make_engine()
+    writer = GroupCommitWriter(engine, window_seconds=0)
+    committing = threading.Event()
+
+    def slow(session):
+        committing.set()
+        time.sleep(0.1)
+        message = Message(room_id=1, sender="player1", content="slow")
+        session.add(message)
+        return message
+
+    async def scenario():
+        pending = asyncio.ensure_future(writer.submit(slow))
+        while not committing.is_set():
+            await asyncio.sleep(0.001)
+        await writer.close()
+        assert pending.done()
+        return await pending
+
+    assert asyncio.run(scenario()).content == "slow"
+    assert writer.batches == 1
+
+def test_restart_keeps_writes_the_dead_task_never_took():
+    """Test that a write left in the queue of a dead writer task is committed by the next one"""
+    engine = make_engine()
+    writer = GroupCommitWriter(engine, window_seconds=0)
+
+    def insert(content):
+        def add(session):
+            message = Message(room_id=1, sender="player1", content=content)
+            session.add(message)
+            return message
+        return add
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        # A writer task that died with a write still queued
+        writer._loop = loop
+        writer._queue = asyncio.Queue()
+        writer._task = loop.create_task(asyncio.sleep(0))
+        await writer._task
+        leftover = loop.create_future()
+        writer._queue.put_nowait((insert("left over"), leftover))
+
+        message = await writer.submit(insert("new"))
+        return (await asyncio.wait_for(leftover, 1)).content, message.content
+
+    assert asyncio.run(scenario()) == ("left over", "new")
@@ -0,0 +1,26 @@
+// Write .br and .gz siblings next to every compressible file in dist/,
+// so the backend can serve them without compressing per request.
+import { readdirSync, readFileSync, statSync, writeFileSync } from 'node:fs';
+import { join } from 'node:path';
+import { brotliCompressSync, gzipSync, constants } from 'node:zlib';
+
+const DIST = new URL('../dist/', import.meta.url).pathname;
+const COMPRESSIBLE = /\.(js|css|html|svg|json|txt|map)$/;
+const MIN_SIZE = 1024;
+
+const walk = (dir) =>
+  readdirSync(dir).flatMap((name) => {
+    const path = join(dir, name);
+    return statSync(path).isDirectory() ? walk(path) : [path];
+  });
+
+for (const path of walk(DIST)) {
+  if (!COMPRESSIBLE.test(path)) continue;
+  const body = readFileSync(path);
+  if (body.length < MIN_SIZE) continue;
+
+  const br = brotliCompressSync(body, { params: { [constants.BROTLI_PARAM_QUALITY]: 11 } });
+  const gz = gzipSync(body, { level: 9 });
+  if (br.length < body.length) writeFileSync(`${path}.br`, br);
+  if (gz.length < body.length) writeFileSync(`${path}.gz`, gz);
+}
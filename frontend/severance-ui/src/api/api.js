@@ -1,13 +1,20 @@
 import axios from 'axios';
 
+// API root of the game the user logged into: /api for the default game, /api/games/<id> for others
+export const apiBase = () => {
+  const game = localStorage.getItem('game');
+  return game ? `/api/games/${encodeURIComponent(game)}` : '/api';
+};
+
 // Create axios instance with relative URL
 const api = axios.create({
   baseURL: '/api',  // Use a relative path that works regardless of domain
 });
 
-// Add request interceptor to add auth token to requests
+// Add request interceptor to add the game and auth token to requests
 api.interceptors.request.use(
   (config) => {
+    config.baseURL = apiBase();
     const token = localStorage.getItem('token');
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
@@ -55,11 +62,21 @@ export const getAllRooms = async () => {
   return response.data;
 };
 
+export const getDashboard = async () => {
+  const response = await api.get('/dashboard');
+  return response.data;
+};
+
 export const createRoom = async (playerA, playerB) => {
   const response = await api.post('/rooms', { playerA, playerB });
   return response.data;
 };
 
+export const startRound = async () => {
+  const response = await api.post('/rooms/bulk', { generate: 'round_robin' });
+  return response.data;
+};
+
 export const getRoom = async (code4) => {
   const response = await api.get(`/rooms/${code4}`);
   return response.data;
@@ -80,20 +97,36 @@ export const sendMessage = async (code4, content) => {
   return response.data;
 };
 
-export const streamMessages = async (code4, afterMessageId) => {
+export const streamMessages = async (code4, afterMessageId, signal, waitSeconds) => {
   const response = await api.get(`/rooms/${code4}/stream`, {
-    params: { after: afterMessageId },
-    timeout: 6000, // 6 seconds timeout - slightly longer than polling interval
+    params: { after: afterMessageId, timeout: waitSeconds },
+    timeout: 35000, // Long-poll: the server holds the request for up to ~25 seconds
+    signal,
   });
   return response.data;
 };
 
+// Live room socket; the token goes in the query string since browsers can't set WebSocket headers
+export const openRoomSocket = (code4) => {
+  const token = localStorage.getItem('token');
+  const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+  return new WebSocket(
+    `${protocol}://${window.location.host}${apiBase()}/rooms/${code4}/ws?token=${encodeURIComponent(token)}`
+  );
+};
+
 // Direct Messages API
 export const sendDirectMessage = async (username, content) => {
   const response = await api.post('/direct-messages', { user_username: username, content });
   return response.data;
 };
 
+// Send one message to a whole group ("outies", "innies" or "players") in a single request
+export const broadcastDirectMessage = async (target, content) => {
+  const response = await api.post('/direct-messages/broadcast', { target, content });
+  return response.data;
+};
+
 export const getSentDirectMessages = async () => {
   const response = await api.get('/direct-messages/sent');
   return response.data;
@@ -108,3 +141,9 @@ export const getUnreadMessageCount = async () => {
   const response = await api.get('/direct-messages/unread-count');
   return response.data;
 };
+
+// Server-Sent Events stream of direct messages and unread counts
+export const openEventStream = () => {
+  const token = localStorage.getItem('token');
+  return new EventSource(`${apiBase()}/events?token=${encodeURIComponent(token)}`);
+};
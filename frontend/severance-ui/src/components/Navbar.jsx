@@ -3,14 +3,14 @@ import { Link } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import DarkModeToggle from './DarkModeToggle';
 import DirectMessagesModal from './DirectMessagesModal';
-import { getUnreadMessageCount } from '../api/api';
+import { getUnreadMessageCount, openEventStream } from '../api/api';
 
 const Navbar = () => {
   const { user, logout, isAdmin } = useAuth();
   const [unreadCount, setUnreadCount] = useState(0);
   const [showMessagesModal, setShowMessagesModal] = useState(false);
 
-  // Fetch unread message count for regular users
+  // Track unread message count for regular users
   useEffect(() => {
     if (user && !isAdmin()) {
       const fetchUnreadCount = async () => {
@@ -22,11 +22,26 @@ const Navbar = () => {
         }
       };
 
-      fetchUnreadCount();
+      // The server pushes the count whenever it changes
+      let interval = null;
+      const events = openEventStream();
+      events.addEventListener('unread_count', (event) => {
+        setUnreadCount(JSON.parse(event.data).unread_count);
+      });
+      events.onerror = () => {
+        // Fall back to polling every 30 seconds if the stream is unavailable
+        if (events.readyState === EventSource.CLOSED && !interval) {
+          fetchUnreadCount();
+          interval = setInterval(fetchUnreadCount, 30000);
+        }
+      };
 
-      // Poll for new messages every 30 seconds
-      const interval = setInterval(fetchUnreadCount, 30000);
-      return () => clearInterval(interval);
+      return () => {
+        events.close();
+        if (interval) {
+          clearInterval(interval);
+        }
+      };
     }
   }, [user, isAdmin]);
 
@@ -31,6 +31,13 @@ export const AuthProvider = ({ children }) => {
 
   // Login function
   const login = async (username, password) => {
+    // Games other than the default one are joined through a ?game=<id> link
+    const game = new URLSearchParams(window.location.search).get('game');
+    if (game) {
+      localStorage.setItem('game', game);
+    } else {
+      localStorage.removeItem('game');
+    }
     try {
       const data = await apiLogin(username, password);
       localStorage.setItem('token', data.access_token);
@@ -46,6 +53,7 @@ export const AuthProvider = ({ children }) => {
   // Logout function
   const logout = () => {
     localStorage.removeItem('token');
+    localStorage.removeItem('game');
     setUser(null);
     navigate('/login');
   };
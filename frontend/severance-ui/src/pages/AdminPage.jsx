@@ -1,9 +1,14 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import Navbar from '../components/Navbar';
-import { getPersonas, getMurderClues, createRoom, getAllRooms, deleteRoom } from '../api/api';
+import { getPersonas, getMurderClues, createRoom, startRound, getDashboard, deleteRoom } from '../api/api';
 import { useAuth } from '../contexts/AuthContext';
 
+// How often the rooms table refreshes its activity columns
+const DASHBOARD_REFRESH_MS = 15000;
+
+const formatTime = (value) => (value ? new Date(value).toLocaleString() : 'never');
+
 const AdminPage = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
@@ -19,6 +24,7 @@ const AdminPage = () => {
   const [playerB, setPlayerB] = useState('');
   const [createdRoomCode, setCreatedRoomCode] = useState('');
   const [creatingRoom, setCreatingRoom] = useState(false);
+  const [startingRound, setStartingRound] = useState(false);
 
   useEffect(() => {
     const fetchData = async () => {
@@ -26,7 +32,7 @@ const AdminPage = () => {
         const [personasData, cluesData, roomsData] = await Promise.all([
           getPersonas(),
           getMurderClues(),
-          getAllRooms()
+          getDashboard()
         ]);
         setPersonas(personasData);
         setMurderClues(cluesData);
@@ -45,13 +51,19 @@ const AdminPage = () => {
   // Function to refresh rooms after creating a new one
   const refreshRooms = async () => {
     try {
-      const roomsData = await getAllRooms();
+      const roomsData = await getDashboard();
       setRooms(roomsData);
     } catch (err) {
       console.error('Error refreshing rooms:', err);
     }
   };
 
+  // One request refreshes every room's activity, however many rooms there are
+  useEffect(() => {
+    const interval = setInterval(refreshRooms, DASHBOARD_REFRESH_MS);
+    return () => clearInterval(interval);
+  }, []);
+
   const handleCreateRoom = async (e) => {
     e.preventDefault();
     if (!playerA || !playerB || playerA === playerB) {
@@ -76,6 +88,22 @@ const AdminPage = () => {
     }
   };
 
+  const handleStartRound = async () => {
+    setStartingRound(true);
+    try {
+      const round = await startRound();
+      if (round.unpaired.length > 0) {
+        alert(`Sitting out this round: ${round.unpaired.join(', ')}`);
+      }
+      await refreshRooms();
+    } catch (err) {
+      console.error('Error starting round:', err);
+      alert('Failed to start round. Please try again.');
+    } finally {
+      setStartingRound(false);
+    }
+  };
+
   const handleDeleteRoom = async (code4) => {
     if (window.confirm(`Are you sure you want to delete room ${code4}? This action cannot be undone.`)) {
       try {
@@ -120,12 +148,21 @@ const AdminPage = () => {
               <h1 className="text-2xl font-bold text-gray-900 dark:text-white">
                 Admin Dashboard
               </h1>
-              <button
-                onClick={() => setShowModal(true)}
-                className="bg-green-600 hover:bg-green-700 text-white font-medium py-2 px-4 rounded-lg"
-              >
-                Create Room
-              </button>
+              <div className="flex gap-2">
+                <button
+                  onClick={handleStartRound}
+                  disabled={startingRound}
+                  className="bg-blue-600 hover:bg-blue-700 disabled:opacity-50 text-white font-medium py-2 px-4 rounded-lg"
+                >
+                  {startingRound ? 'Starting...' : 'Start Round'}
+                </button>
+                <button
+                  onClick={() => setShowModal(true)}
+                  className="bg-green-600 hover:bg-green-700 text-white font-medium py-2 px-4 rounded-lg"
+                >
+                  Create Room
+                </button>
+              </div>
             </div>
 
             {/* Active Rooms Section */}
@@ -155,6 +192,12 @@ const AdminPage = () => {
                         <th className="px-4 py-3 text-left text-xs font-medium text-gray-500 dark:text-gray-300 uppercase tracking-wider">
                           Created
                         </th>
+                        <th className="px-4 py-3 text-left text-xs font-medium text-gray-500 dark:text-gray-300 uppercase tracking-wider">
+                          Messages
+                        </th>
+                        <th className="px-4 py-3 text-left text-xs font-medium text-gray-500 dark:text-gray-300 uppercase tracking-wider">
+                          Last Activity
+                        </th>
                         <th className="px-4 py-3 text-left text-xs font-medium text-gray-500 dark:text-gray-300 uppercase tracking-wider">
                           Actions
                         </th>
@@ -168,13 +211,26 @@ const AdminPage = () => {
                           </td>
                           <td className="px-4 py-3 whitespace-nowrap text-sm text-gray-500 dark:text-gray-300">
                             {room.playerA}
+                            <div className="text-xs text-gray-400">seen {formatTime(room.last_seen[room.playerA])}</div>
                           </td>
                           <td className="px-4 py-3 whitespace-nowrap text-sm text-gray-500 dark:text-gray-300">
                             {room.playerB}
+                            <div className="text-xs text-gray-400">seen {formatTime(room.last_seen[room.playerB])}</div>
                           </td>
                           <td className="px-4 py-3 whitespace-nowrap text-sm text-gray-500 dark:text-gray-300">
                             {new Date(room.created_at).toLocaleString()}
                           </td>
+                          <td className="px-4 py-3 whitespace-nowrap text-sm text-gray-500 dark:text-gray-300">
+                            {room.message_count}
+                          </td>
+                          <td className="px-4 py-3 text-sm text-gray-500 dark:text-gray-300">
+                            {formatTime(room.last_activity)}
+                            {room.last_message && (
+                              <div className="text-xs text-gray-400 truncate max-w-xs">
+                                {room.last_message.sender}: {room.last_message.content}
+                              </div>
+                            )}
+                          </td>
                           <td className="px-4 py-3 whitespace-nowrap text-sm">
                             <div className="flex space-x-2">
                               <button
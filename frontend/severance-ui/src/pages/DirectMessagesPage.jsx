@@ -2,7 +2,9 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import Navbar from '../components/Navbar';
 import { useAuth } from '../contexts/AuthContext';
-import { getPersonas, sendDirectMessage, getSentDirectMessages } from '../api/api';
+import { getPersonas, sendDirectMessage, broadcastDirectMessage, getSentDirectMessages } from '../api/api';
+
+const BROADCAST_PREFIX = 'all:';
 
 const DirectMessagesPage = () => {
   const { user } = useAuth();
@@ -56,8 +58,14 @@ const DirectMessagesPage = () => {
     setSuccess('');
 
     try {
-      await sendDirectMessage(selectedUser, messageContent);
-      setSuccess(`Message sent to ${selectedUser} successfully!`);
+      if (selectedUser.startsWith(BROADCAST_PREFIX)) {
+        const target = selectedUser.slice(BROADCAST_PREFIX.length);
+        const sent = await broadcastDirectMessage(target, messageContent);
+        setSuccess(`Message sent to ${sent.length} ${target} successfully!`);
+      } else {
+        await sendDirectMessage(selectedUser, messageContent);
+        setSuccess(`Message sent to ${selectedUser} successfully!`);
+      }
       setMessageContent('');
       
       // Refresh sent messages
@@ -123,6 +131,9 @@ const DirectMessagesPage = () => {
                       required
                     >
                       <option value="">Select User</option>
+                      <option value={`${BROADCAST_PREFIX}players`}>All players</option>
+                      <option value={`${BROADCAST_PREFIX}outies`}>All outies</option>
+                      <option value={`${BROADCAST_PREFIX}innies`}>All innies</option>
                       {personas.map((persona) => (
                         <option key={persona.username} value={persona.username}>
                           {persona.username} ({persona.group})
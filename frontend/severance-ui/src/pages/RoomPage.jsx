@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import Navbar from '../components/Navbar';
 import { useAuth } from '../contexts/AuthContext';
-import { getRoom, getRoomMessages, sendMessage, streamMessages } from '../api/api';
+import { getRoom, getRoomMessages, sendMessage, streamMessages, openRoomSocket } from '../api/api';
 import { saveRoom } from '../utils/roomStorage';
 
 const RoomPage = () => {
@@ -16,9 +16,11 @@ const RoomPage = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [sending, setSending] = useState(false);
+  const [socketOpen, setSocketOpen] = useState(false);
 
   const messagesEndRef = useRef(null);
   const pollingRef = useRef(null);
+  const lastMessageIdRef = useRef(null);
 
   // Fetch room data and initial messages
   useEffect(() => {
@@ -59,14 +61,59 @@ const RoomPage = () => {
     };
   }, [code4, user]);
 
-  // Set up message polling
   useEffect(() => {
+    lastMessageIdRef.current = messages.length > 0 ? messages[messages.length - 1].id : null;
+  }, [messages]);
+
+  const appendMessages = (incoming) => {
+    setMessages(prev => {
+      // Deduplicate messages by ID
+      const existingIds = new Set(prev.map(msg => msg.id));
+      const uniqueNewMessages = incoming.filter(msg => !existingIds.has(msg.id));
+      return uniqueNewMessages.length > 0 ? [...prev, ...uniqueNewMessages] : prev;
+    });
+  };
+
+  // Prefer a live socket; long-polling below takes over whenever it is closed
+  useEffect(() => {
+    if (!room) return;
+
+    const socket = openRoomSocket(code4);
+    socket.onopen = async () => {
+      setSocketOpen(true);
+      // Catch up on anything sent while the socket was connecting
+      try {
+        appendMessages(await streamMessages(code4, lastMessageIdRef.current, undefined, 0));
+      } catch (err) {
+        console.error('Error catching up on messages:', err);
+      }
+    };
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.id) {
+        appendMessages([data]);
+      }
+    };
+    socket.onclose = () => setSocketOpen(false);
+
+    return () => {
+      socket.onclose = null;
+      socket.close();
+      setSocketOpen(false);
+    };
+  }, [code4, room]);
+
+  // Set up message long-polling
+  useEffect(() => {
+    const controller = new AbortController();
+
     const pollMessages = async () => {
-      if (!room) return;
+      if (!room || socketOpen) return;
 
+      let delay = 250;
       try {
         const lastMessageId = messages.length > 0 ? messages[messages.length - 1].id : null;
-        const newMessages = await streamMessages(code4, lastMessageId);
+        const newMessages = await streamMessages(code4, lastMessageId, controller.signal);
 
         if (newMessages && newMessages.length > 0) {
           // Deduplicate messages by ID
@@ -78,21 +125,27 @@ const RoomPage = () => {
           }
         }
       } catch (err) {
+        if (controller.signal.aborted) return;
         console.error('Error polling messages:', err);
+        // Back off before retrying after an error
+        delay = 5000;
       }
 
-      // Poll again after 5 seconds - balanced polling interval
-      pollingRef.current = setTimeout(pollMessages, 5000);
+      // The server already waited for new messages, so re-poll almost immediately
+      if (!controller.signal.aborted) {
+        pollingRef.current = setTimeout(pollMessages, delay);
+      }
     };
 
     pollMessages();
 
     return () => {
+      controller.abort();
       if (pollingRef.current) {
         clearTimeout(pollingRef.current);
       }
     };
-  }, [code4, room, messages]); // Add messages back as dependency to get the latest message ID
+  }, [code4, room, messages, socketOpen]); // Add messages back as dependency to get the latest message ID
 
   // Scroll to bottom when messages change
   useEffect(() => {